@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from os.path import isfile, join as joinpath
+from posixpath import normpath
+
+from api.resample import RESAMPLE_CACHE, RESAMPLE_SINC
+from api.sound import load_samples
+from loaders.midi import MIDIFile
+from loaders.pda import PDAudioFile
+from loaders.pdi import PDImageFile
+from loaders.pdt import PDImageTableFile
+from loaders.pft import PDFontFile
+from logger import get_logger
+
+LOGGER = get_logger("api.assets")
+
+ASSET_IMAGE = "image"
+ASSET_IMAGETABLE = "imagetable"
+ASSET_FONT = "font"
+ASSET_SAMPLE = "sample"
+ASSET_MIDI = "midi"
+
+ASSET_LOADERS = {
+	ASSET_IMAGE: PDImageFile,
+	ASSET_IMAGETABLE: PDImageTableFile,
+	ASSET_FONT: PDFontFile,
+	ASSET_SAMPLE: PDAudioFile,
+	ASSET_MIDI: MIDIFile
+}
+
+# games can name the source file, which pdc compiles to the Playdate format
+SOURCE_EXTENSIONS = (".png", ".gif", ".fnt", ".wav", ".aif", ".aiff")
+
+# the device's RAM, which is all a game gets for its assets too
+ASSET_CACHE_SIZE = 16 * 1024 * 1024
+
+def normalize_path(path):
+	# one key however a game spells the path: no leading slash, no "./" or "..", no extension
+	path = normpath(path.replace("\\", "/")).lstrip("/")
+	for ext in SOURCE_EXTENSIONS + tuple(loader.PD_FILE_EXT for loader in ASSET_LOADERS.values()):
+		if path.lower().endswith(ext): return path[:-len(ext)]
+	return path
+
+def asset_size(asset):
+	# roughly what the decoded asset takes up on the device
+	if isinstance(asset, PDImageFile): return len(asset.raw)
+	if isinstance(asset, PDImageTableFile): return sum(len(image.raw) for row in asset.image_table for image in row)
+	if hasattr(asset, "nbytes"): return asset.nbytes
+	if getattr(asset, "decompressed_size", None) is not None: return asset.decompressed_size
+	return len(asset.data or b"")
+
+class AssetStats:
+	def __init__(self):
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.bytes = 0
+
+class PDAssetManager:
+	def __init__(self, directory=None, max_bytes=ASSET_CACHE_SIZE, sample_rate=None, resample_mode=RESAMPLE_SINC):
+		self.directory = directory
+		self.max_bytes = max_bytes
+
+		# with a rate, samples are kept converted to it in the resample cache, so a new sample player never decodes or resamples
+		self.sample_rate = sample_rate
+		self.resample_mode = resample_mode
+
+		# PDZ files are searched before the directory, in the order they were mounted
+		self.archives = []
+
+		# (asset type, normalized path) -> (asset, size), least recently used first
+		self.entries = OrderedDict()
+		self.size = 0
+		self.stats = {asset_type: AssetStats() for asset_type in ASSET_LOADERS}
+
+	def set_directory(self, directory):
+		self.directory = directory
+		self.clear()
+
+	def mount(self, pdz_file):
+		self.archives.append(pdz_file)
+
+	def _load(self, asset_type, path):
+		loader = ASSET_LOADERS[asset_type]
+		for archive in self.archives:
+			try: entry = archive.get_file(path)
+			except FileNotFoundError: continue
+			if isinstance(entry.data, loader): return entry.data
+
+		if self.directory is not None:
+			file_path = joinpath(self.directory, path + loader.PD_FILE_EXT)
+			if isfile(file_path): return loader(file_path)
+		raise FileNotFoundError(f"No {asset_type} at '{path}'")
+
+	def _get_resampled(self, path):
+		# keyed on the file path the way PDSamplePlayer.from_file does it, so the two never hold the same sound twice
+		stats = self.stats[ASSET_SAMPLE]
+		misses = stats.misses
+
+		def load():
+			stats.misses += 1
+			audio_file = self._load(ASSET_SAMPLE, path)
+			return load_samples(audio_file), audio_file.framerate
+
+		file_path = joinpath(self.directory or "", path + PDAudioFile.PD_FILE_EXT)
+		samples = RESAMPLE_CACHE.get(file_path, self.sample_rate, self.resample_mode, load)
+		if stats.misses == misses: stats.hits += 1
+		return samples, self.sample_rate
+
+	def get(self, asset_type, path):
+		# the same object comes back for every load of a path, so nothing may modify what it gets here
+		key = (asset_type, normalize_path(path))
+		if asset_type == ASSET_SAMPLE and self.sample_rate is not None: return self._get_resampled(key[1])
+		stats = self.stats[asset_type]
+		entry = self.entries.get(key)
+		if entry is not None:
+			stats.hits += 1
+			self.entries.move_to_end(key)
+			return entry[0]
+
+		stats.misses += 1
+		asset = self._load(asset_type, key[1])
+		if asset_type == ASSET_SAMPLE:
+			asset = load_samples(asset), asset.framerate
+			size = asset[0].nbytes
+		else: size = asset_size(asset)
+
+		if size > self.max_bytes:
+			# bigger than the whole budget, so it's handed out without pushing everything else out first
+			LOGGER.debug(f"{key[1]} takes {size} bytes, more than the {self.max_bytes} byte asset budget")
+			return asset
+
+		self.entries[key] = (asset, size)
+		self.size += size
+		stats.bytes += size
+		while self.size > self.max_bytes:
+			(old_type, old_path), (evicted, evicted_size) = self.entries.popitem(last=False)
+			self.size -= evicted_size
+			self.stats[old_type].bytes -= evicted_size
+			self.stats[old_type].evictions += 1
+		return asset
+
+	def get_image(self, path):
+		return self.get(ASSET_IMAGE, path)
+
+	def get_image_table(self, path):
+		return self.get(ASSET_IMAGETABLE, path)
+
+	def get_font(self, path):
+		return self.get(ASSET_FONT, path)
+
+	def get_samples(self, path):
+		return self.get(ASSET_SAMPLE, path)
+
+	def get_midi(self, path):
+		return self.get(ASSET_MIDI, path)
+
+	def get_stats(self):
+		return {asset_type: {"hits": stats.hits, "misses": stats.misses, "evictions": stats.evictions, "bytes": stats.bytes} for asset_type, stats in self.stats.items()}
+
+	def clear(self):
+		self.entries.clear()
+		self.size = 0
+		for stats in self.stats.values(): stats.bytes = 0
@@ -0,0 +1,136 @@
+import numpy as np
+
+from weakref import WeakKeyDictionary
+
+from logger import get_logger
+
+LOGGER = get_logger("api.blitter")
+
+DRAWMODE_COPY = 0
+DRAWMODE_WHITE_TRANSPARENT = 1
+DRAWMODE_BLACK_TRANSPARENT = 2
+DRAWMODE_FILL_WHITE = 3
+DRAWMODE_FILL_BLACK = 4
+DRAWMODE_XOR = 5
+DRAWMODE_NXOR = 6
+DRAWMODE_INVERTED = 7
+
+# the Lua API also takes the modes by name
+DRAWMODE_NAMES = {
+	"copy": DRAWMODE_COPY,
+	"whiteTransparent": DRAWMODE_WHITE_TRANSPARENT,
+	"blackTransparent": DRAWMODE_BLACK_TRANSPARENT,
+	"fillWhite": DRAWMODE_FILL_WHITE,
+	"fillBlack": DRAWMODE_FILL_BLACK,
+	"XOR": DRAWMODE_XOR,
+	"NXOR": DRAWMODE_NXOR,
+	"inverted": DRAWMODE_INVERTED
+}
+
+class PackedImage:
+	def __init__(self, color, mask, width):
+		# packed (height, stride) planes with nothing trimmed off the edges, for things that aren't loaded from a file
+		self.color = color
+		self.mask = mask
+		self.width = width
+		self.height, self.stride = color.shape
+		self.clip_l = self.clip_r = self.clip_t = self.clip_b = 0
+		self.alpha = True
+
+	def get_planes(self):
+		return self.color, self.mask
+
+	@property
+	def nbytes(self):
+		return self.color.nbytes + self.mask.nbytes
+
+class ShiftedImage:
+	def __init__(self, color, alpha, width, shift):
+		# color and alpha are packed (height, stride) planes, moved right by shift bits into (height, cols) ones
+		height, stride = color.shape
+		cols = (width + shift + 7) >> 3
+
+		# which bits of each byte actually belong to the image
+		starts = np.arange(cols, dtype=np.int32) * 8
+		lo = np.clip(shift - starts, 0, 8)
+		hi = np.clip(starts + 8 - shift - width, 0, 8)
+		coverage = ((0xff >> lo) & (0xff << hi) & 0xff).astype(np.uint8)
+
+		self.mask = self.shift_plane(alpha, shift, cols) & coverage if alpha is not None else np.tile(coverage, (height, 1))
+		color = self.shift_plane(color, shift, cols)
+		self.white = color & self.mask
+		self.black = ~color & self.mask
+
+	@property
+	def nbytes(self):
+		return self.mask.nbytes + self.white.nbytes + self.black.nbytes
+
+	@staticmethod
+	def shift_plane(plane, shift, cols):
+		height, stride = plane.shape
+		out = np.zeros((height, cols), dtype=np.uint8)
+		n = min(stride, cols)
+		out[:, :n] = plane[:, :n] >> shift
+		if shift and cols > 1:
+			n = min(stride, cols - 1)
+			out[:, 1:n + 1] |= plane[:, :n] << (8 - shift)
+		return out
+
+# each image keeps its eight alignments for as long as it's alive
+SHIFT_CACHE = WeakKeyDictionary()
+
+def get_shifted(image, shift):
+	variants = SHIFT_CACHE.get(image)
+	if variants is None:
+		variants = [None] * 8
+		SHIFT_CACHE[image] = variants
+
+	if variants[shift] is None:
+		color, alpha = image.get_planes()
+		variants[shift] = ShiftedImage(color, alpha, image.width, shift)
+		# a cache holding the image counts its alignments against its own budget
+		cache = getattr(image, "cache", None)
+		if cache is not None: cache.grow(image, variants[shift].nbytes)
+	return variants[shift]
+
+def blit(frame, image, x, y, clip_rect, mode=DRAWMODE_COPY):
+	# x and y are where the image's stored data starts, in screen space
+	x, y = int(x), int(y)
+	clip_x0, clip_y0, clip_x1, clip_y1 = clip_rect
+	if x >= clip_x1 or y >= clip_y1 or x + image.width <= clip_x0 or y + image.height <= clip_y0: return
+
+	shifted = get_shifted(image, x & 7)
+	height, cols = shifted.mask.shape
+	col = x >> 3
+
+	row0, row1 = max(clip_y0 - y, 0), min(clip_y1 - y, height)
+	col0, col1 = max((clip_x0 >> 3) - col, 0), min(((clip_x1 + 7) >> 3) - col, cols)
+	if row0 >= row1 or col0 >= col1: return
+
+	region = frame[y + row0:y + row1, col + col0:col + col1]
+	mask = shifted.mask[row0:row1, col0:col1]
+	white = shifted.white[row0:row1, col0:col1]
+	black = shifted.black[row0:row1, col0:col1]
+
+	# a clip edge partway through a byte has to mask off the pixels outside it
+	left = clip_x0 - (col + col0) * 8
+	right = (col + col1) * 8 - clip_x1
+	if left > 0 or right > 0:
+		edges = np.full(col1 - col0, 0xff, dtype=np.uint8)
+		if left > 0: edges[0] &= 0xff >> left
+		if right > 0: edges[-1] &= (0xff << right) & 0xff
+		mask, white, black = mask & edges, white & edges, black & edges
+
+	if mode == DRAWMODE_COPY:
+		region &= ~mask
+		region |= white
+	elif mode == DRAWMODE_WHITE_TRANSPARENT: region &= ~black
+	elif mode == DRAWMODE_BLACK_TRANSPARENT: region |= white
+	elif mode == DRAWMODE_FILL_WHITE: region |= mask
+	elif mode == DRAWMODE_FILL_BLACK: region &= ~mask
+	elif mode == DRAWMODE_XOR: region ^= white
+	elif mode == DRAWMODE_NXOR: region ^= black
+	elif mode == DRAWMODE_INVERTED:
+		region &= ~mask
+		region |= black
+	else: LOGGER.warning(f"Unknown draw mode {mode}")
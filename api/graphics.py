@@ -0,0 +1,356 @@
+import numpy as np
+import pygame as pg
+
+from math import hypot
+
+from api.blitter import DRAWMODE_COPY, blit
+from api.transform import FLIP_NONE, TransformCache
+from loaders.pdi import PDI_PALETTE
+from logger import get_logger
+
+LOGGER = get_logger("api.graphics")
+
+LCD_WIDTH = 400
+LCD_HEIGHT = 240
+LCD_ROWSIZE = 52
+
+COLOR_BLACK = 0
+COLOR_WHITE = 1
+COLOR_CLEAR = 2
+COLOR_XOR = 3
+
+STROKE_CENTERED = 0
+STROKE_OUTSIDE = 1
+STROKE_INSIDE = 2
+
+DITHER_BAYER8X8 = 6
+
+BAYER8X8 = np.array((
+	(0, 32, 8, 40, 2, 34, 10, 42),
+	(48, 16, 56, 24, 50, 18, 58, 26),
+	(12, 44, 4, 36, 14, 46, 6, 38),
+	(60, 28, 52, 20, 62, 30, 54, 22),
+	(3, 35, 11, 43, 1, 33, 9, 41),
+	(51, 19, 59, 27, 49, 17, 57, 25),
+	(15, 47, 7, 39, 13, 45, 5, 37),
+	(63, 31, 55, 23, 61, 29, 53, 21)
+), dtype=np.int32)
+
+# x coordinate of the leftmost pixel in each byte of a row
+BYTE_STARTS = np.arange(LCD_ROWSIZE, dtype=np.int32) * 8
+
+def span_masks(xa, xb, col0, col1):
+	# xa and xb are (rows, spans) arrays of half-open pixel spans, the result is each row's byte mask over columns col0 to col1
+	starts = BYTE_STARTS[col0:col1]
+	lo = np.clip(xa[:, :, None] - starts, 0, 8)
+	hi = np.clip(starts + 8 - xb[:, :, None], 0, 8)
+	masks = (0xff >> lo) & (0xff << hi) & 0xff
+	return np.bitwise_or.reduce(masks, axis=1).astype(np.uint8)
+
+def ellipse_spans(x, y, width, height, ys):
+	# the pixels whose centres fall inside the ellipse, one span per row
+	a = width / 2
+	b = height / 2
+	dy = (ys + 0.5 - (y + b)) / b if b > 0 else np.zeros(len(ys))
+	half = a * np.sqrt(np.clip(1 - dy * dy, 0, None))
+	cx = x + a
+	xa = np.ceil(cx - half - 0.5).astype(np.int32)
+	xb = np.ceil(cx + half - 0.5).astype(np.int32)
+	inside = np.abs(dy) < 1
+	return np.where(inside, xa, 0), np.where(inside, xb, 0)
+
+def polygon_spans(points, ys):
+	# even-odd scanline fill, with every edge crossing of every row worked out at once
+	points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+	x0, y0 = points[:, 0], points[:, 1]
+	x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+	yc = ys[:, None] + 0.5
+	crosses = ((y0 <= yc) & (yc < y1)) | ((y1 <= yc) & (yc < y0))
+	with np.errstate(divide="ignore", invalid="ignore"):
+		xs = x0 + (yc - y0) * (x1 - x0) / (y1 - y0)
+	xs = np.sort(np.where(crosses, xs, np.inf), axis=1)
+	if xs.shape[1] % 2: xs = xs[:, :-1]
+
+	# pairs that ran into the padding come out as empty spans
+	xs = np.ceil(np.clip(xs, -LCD_WIDTH, 2 * LCD_WIDTH) - 0.5).astype(np.int32)
+	return xs[:, 0::2], xs[:, 1::2]
+
+class PDGraphics:
+	def __init__(self):
+		# packed 1-bit rows, most significant bit leftmost, set bits are white
+		self.frame = np.full((LCD_HEIGHT, LCD_ROWSIZE), 0xff, dtype=np.uint8)
+		self.surf = None
+		self.transforms = TransformCache()
+		self.reset()
+
+	def reset(self):
+		self.color = COLOR_BLACK
+		self.background_color = COLOR_WHITE
+		self.pattern = None
+		self.pattern_alpha = None
+		self.line_width = 1
+		self.stroke_location = STROKE_CENTERED
+		self.draw_offset = (0, 0)
+		self.clip_rect = (0, 0, LCD_WIDTH, LCD_HEIGHT)
+		self.image_draw_mode = DRAWMODE_COPY
+
+	def set_color(self, color):
+		self.color = color
+		self.pattern = None
+		self.pattern_alpha = None
+
+	def set_pattern(self, rows, alpha_rows=None):
+		self.pattern = np.array([row & 0xff for row in rows[:8]], dtype=np.uint8)
+		self.pattern_alpha = None if alpha_rows is None else np.array([row & 0xff for row in alpha_rows[:8]], dtype=np.uint8)
+
+	def set_dither_pattern(self, alpha, dither_type=DITHER_BAYER8X8):
+		if dither_type != DITHER_BAYER8X8: LOGGER.warning(f"Dither type {dither_type} not supported, using Bayer 8x8")
+
+		# the device inverts alpha when drawing in white
+		level = round((1 - alpha if self.color == COLOR_WHITE else alpha) * 64)
+		opaque = BAYER8X8 < level
+		self.pattern = np.full(8, 0xff if self.color == COLOR_WHITE else 0x00, dtype=np.uint8)
+		self.pattern_alpha = np.packbits(opaque, axis=1)[:, 0]
+
+	def set_clip_rect(self, x, y, width, height):
+		ox, oy = self.draw_offset
+		x0, y0 = max(int(x) + ox, 0), max(int(y) + oy, 0)
+		x1, y1 = min(int(x + width) + ox, LCD_WIDTH), min(int(y + height) + oy, LCD_HEIGHT)
+		self.clip_rect = (x0, y0, max(x0, x1), max(y0, y1))
+
+	def set_screen_clip_rect(self, x, y, width, height):
+		x0, y0 = max(int(x), 0), max(int(y), 0)
+		self.clip_rect = (x0, y0, max(x0, min(int(x + width), LCD_WIDTH)), max(y0, min(int(y + height), LCD_HEIGHT)))
+
+	def clear_clip_rect(self):
+		self.clip_rect = (0, 0, LCD_WIDTH, LCD_HEIGHT)
+
+	def clear(self, color=None):
+		if color is None: color = self.background_color
+		if color == COLOR_CLEAR: return
+		if color == COLOR_XOR: self.frame ^= 0xff
+		else: self.frame[:] = 0xff if color == COLOR_WHITE else 0x00
+
+	def clear_rect(self, x, y, width, height, color=None):
+		# screen coordinates and a solid color, but still inside the clip rect
+		if color is None: color = self.background_color
+		if width <= 0 or height <= 0: return
+		saved = self.color, self.pattern, self.pattern_alpha
+		self.color, self.pattern, self.pattern_alpha = color, None, None
+		self._fill_spans(y, *self._rect_spans(x, y, width, height))
+		self.color, self.pattern, self.pattern_alpha = saved
+
+	def _fill_spans(self, y0, xa, xb):
+		# every fill ends up here: rows y0 onwards, with (rows, spans) arrays of pixel spans in screen space
+		clip_x0, clip_y0, clip_x1, clip_y1 = self.clip_rect
+		h = len(xa)
+		top = max(clip_y0 - y0, 0)
+		bottom = min(clip_y1 - y0, h)
+		if top >= bottom or self.color == COLOR_CLEAR and self.pattern is None: return
+
+		xa = np.clip(xa[top:bottom], clip_x0, clip_x1)
+		xb = np.clip(xb[top:bottom], clip_x0, clip_x1)
+		y0 += top
+
+		used = xa < xb
+		if not used.any(): return
+		col0 = int(xa[used].min()) >> 3
+		col1 = (int(xb[used].max()) + 7) >> 3
+
+		masks = span_masks(xa, xb, col0, col1)
+		region = self.frame[y0:y0 + len(masks), col0:col1]
+
+		if self.pattern is not None:
+			rows = (np.arange(y0, y0 + len(masks)) & 7)[:, None]
+			if self.pattern_alpha is not None: masks &= self.pattern_alpha[rows]
+			region[:] = (region & ~masks) | (self.pattern[rows] & masks)
+		elif self.color == COLOR_BLACK: region &= ~masks
+		elif self.color == COLOR_WHITE: region |= masks
+		elif self.color == COLOR_XOR: region ^= masks
+
+	def _plot(self, xs, ys):
+		clip_x0, clip_y0, clip_x1, clip_y1 = self.clip_rect
+		keep = (xs >= clip_x0) & (xs < clip_x1) & (ys >= clip_y0) & (ys < clip_y1)
+		xs, ys = xs[keep], ys[keep]
+		if len(xs) == 0: return
+
+		# a pixel plotted twice would xor itself back out
+		index = np.unique(ys * LCD_WIDTH + xs)
+		ys, xs = np.divmod(index, LCD_WIDTH)
+		flat = self.frame.reshape(-1)
+		cells = ys * LCD_ROWSIZE + (xs >> 3)
+		bits = (0x80 >> (xs & 7)).astype(np.uint8)
+
+		if self.pattern is not None:
+			if self.pattern_alpha is not None:
+				opaque = (self.pattern_alpha[ys & 7] & bits) != 0
+				cells, bits, ys = cells[opaque], bits[opaque], ys[opaque]
+			white = (self.pattern[ys & 7] & bits) != 0
+			np.bitwise_or.at(flat, cells[white], bits[white])
+			np.bitwise_and.at(flat, cells[~white], ~bits[~white])
+		elif self.color == COLOR_BLACK: np.bitwise_and.at(flat, cells, ~bits)
+		elif self.color == COLOR_WHITE: np.bitwise_or.at(flat, cells, bits)
+		elif self.color == COLOR_XOR: np.bitwise_xor.at(flat, cells, bits)
+
+	def _rect_spans(self, x, y, width, height):
+		ys = np.arange(y, y + height)
+		return np.full((len(ys), 1), x, dtype=np.int32), np.full((len(ys), 1), x + width, dtype=np.int32)
+
+	def _stroke_bounds(self, x, y, width, height):
+		lw = self.line_width
+		if self.stroke_location == STROKE_INSIDE: grow = 0
+		elif self.stroke_location == STROKE_OUTSIDE: grow = lw
+		else: grow = lw // 2
+		return x - grow, y - grow, width + 2 * grow, height + 2 * grow, lw
+
+	def draw_pixel(self, x, y):
+		ox, oy = self.draw_offset
+		self._plot(np.array([int(x) + ox]), np.array([int(y) + oy]))
+
+	def fill_rect(self, x, y, width, height):
+		ox, oy = self.draw_offset
+		x, y, width, height = int(x) + ox, int(y) + oy, int(width), int(height)
+		if width <= 0 or height <= 0: return
+		self._fill_spans(y, *self._rect_spans(x, y, width, height))
+
+	def draw_rect(self, x, y, width, height):
+		ox, oy = self.draw_offset
+		x, y, width, height, lw = self._stroke_bounds(int(x) + ox, int(y) + oy, int(width), int(height))
+		if width <= 0 or height <= 0: return
+
+		# the frame is the outer rect minus the inner one, so rows through the middle get two spans
+		xa, xb = self._rect_spans(x, y, width, height)
+		xa = np.repeat(xa, 2, axis=1)
+		xb = np.repeat(xb, 2, axis=1)
+		middle = slice(lw, max(height - lw, lw))
+		xb[middle, 0] = x + lw
+		xa[middle, 1] = x + width - lw
+		self._fill_spans(y, xa, xb)
+
+	def fill_ellipse(self, x, y, width, height):
+		ox, oy = self.draw_offset
+		x, y = x + ox, y + oy
+		y0 = int(y)
+		ys = np.arange(y0, int(np.ceil(y + height)))
+		xa, xb = ellipse_spans(x, y, width, height, ys)
+		self._fill_spans(y0, xa[:, None], xb[:, None])
+
+	def draw_ellipse(self, x, y, width, height):
+		ox, oy = self.draw_offset
+		x, y, width, height, lw = self._stroke_bounds(x + ox, y + oy, width, height)
+		y0 = int(y)
+		ys = np.arange(y0, int(np.ceil(y + height)))
+
+		outer_a, outer_b = ellipse_spans(x, y, width, height, ys)
+		if width <= 2 * lw or height <= 2 * lw:
+			self._fill_spans(y0, outer_a[:, None], outer_b[:, None])
+			return
+
+		# rows that miss the inner ellipse get one solid span, the rest get the two bits either side of it
+		inner_a, inner_b = ellipse_spans(x + lw, y + lw, width - 2 * lw, height - 2 * lw, ys)
+		hollow = inner_a < inner_b
+		xa = np.stack((outer_a, np.where(hollow, inner_b, 0)), axis=1)
+		xb = np.stack((np.where(hollow, inner_a, outer_b), np.where(hollow, outer_b, 0)), axis=1)
+		self._fill_spans(y0, xa, xb)
+
+	def fill_circle(self, x, y, radius):
+		self.fill_ellipse(x - radius, y - radius, 2 * radius, 2 * radius)
+
+	def draw_circle(self, x, y, radius):
+		self.draw_ellipse(x - radius, y - radius, 2 * radius, 2 * radius)
+
+	def fill_polygon(self, points):
+		ox, oy = self.draw_offset
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2) + (ox, oy)
+		if len(points) < 3: return
+
+		y0 = int(np.floor(points[:, 1].min()))
+		ys = np.arange(y0, int(np.ceil(points[:, 1].max())))
+		if len(ys) == 0: return
+		self._fill_spans(y0, *polygon_spans(points, ys))
+
+	def draw_line(self, x1, y1, x2, y2):
+		ox, oy = self.draw_offset
+		x1, y1, x2, y2 = x1 + ox, y1 + oy, x2 + ox, y2 + oy
+
+		if self.line_width > 1:
+			# thick lines are the rectangle around the line, with flat ends
+			length = hypot(x2 - x1, y2 - y1)
+			if length == 0: return
+			nx = (y1 - y2) / length * self.line_width / 2
+			ny = (x2 - x1) / length * self.line_width / 2
+			saved_offset = self.draw_offset
+			self.draw_offset = (0, 0)
+			self.fill_polygon(((x1 + nx, y1 + ny), (x2 + nx, y2 + ny), (x2 - nx, y2 - ny), (x1 - nx, y1 - ny)))
+			self.draw_offset = saved_offset
+			return
+
+		x1, y1, x2, y2 = round(x1), round(y1), round(x2), round(y2)
+		n = max(abs(x2 - x1), abs(y2 - y1))
+		t = np.arange(n + 1)
+		if n == 0: self._plot(np.array([x1]), np.array([y1]))
+		else: self._plot(x1 + np.rint(t * (x2 - x1) / n).astype(np.int64), y1 + np.rint(t * (y2 - y1) / n).astype(np.int64))
+
+	def draw_polygon(self, points):
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+		for i in range(len(points)):
+			x1, y1 = points[i - 1]
+			x2, y2 = points[i]
+			self.draw_line(x1, y1, x2, y2)
+
+	def draw_bitmap(self, white, opaque, x, y):
+		# (h, w) bool arrays; unpacks just the rows underneath, copies the opaque pixels in and packs them back up
+		clip_x0, clip_y0, clip_x1, clip_y1 = self.clip_rect
+		ox, oy = self.draw_offset
+		x, y = int(x) + ox, int(y) + oy
+		h, w = white.shape
+
+		left, top = max(clip_x0 - x, 0), max(clip_y0 - y, 0)
+		right, bottom = min(clip_x1 - x, w), min(clip_y1 - y, h)
+		if left >= right or top >= bottom: return
+
+		col0 = (x + left) >> 3
+		col1 = (x + right + 7) >> 3
+		region = self.frame[y + top:y + bottom, col0:col1]
+		pixels = np.unpackbits(region, axis=1)
+		dx = x + left - col0 * 8
+		target = pixels[:, dx:dx + right - left]
+		mask = opaque[top:bottom, left:right]
+		target[mask] = white[top:bottom, left:right][mask]
+		region[:] = np.packbits(pixels, axis=1)
+
+	def draw_image(self, image, x, y, flip=FLIP_NONE):
+		# image is a PDImageFile, whose transparent padding is never stored so it's skipped over here
+		if flip != FLIP_NONE: image = self.transforms.get(image, flip=flip)
+		ox, oy = self.draw_offset
+		blit(self.frame, image, int(x) + ox + image.clip_l, int(y) + oy + image.clip_t, self.clip_rect, self.image_draw_mode)
+
+	def draw_rotated(self, image, x, y, angle, xscale=1.0, yscale=None):
+		# centred on x, y like the device does it
+		transformed = self.transforms.get(image, angle, xscale, yscale)
+		if transformed.width == 0 or transformed.height == 0: return
+		self.draw_image(transformed, round(x - transformed.width / 2), round(y - transformed.height / 2))
+
+	def draw_scaled(self, image, x, y, xscale, yscale=None):
+		transformed = self.transforms.get(image, 0.0, xscale, yscale)
+		if transformed.width == 0 or transformed.height == 0: return
+		self.draw_image(transformed, x, y)
+
+	def draw_surface(self, surf, x, y):
+		rgb = pg.surfarray.pixels3d(surf).transpose(1, 0, 2)
+		white = rgb.mean(axis=2) >= 0x80
+		if surf.get_flags() & pg.SRCALPHA: opaque = pg.surfarray.pixels_alpha(surf).T >= 0x80
+		else: opaque = np.ones(white.shape, dtype=bool)
+		self.draw_bitmap(white, opaque, x, y)
+
+	def to_surf(self):
+		pixels = np.unpackbits(self.frame, axis=1)[:, :LCD_WIDTH]
+		if self.surf is None:
+			self.surf = pg.Surface((LCD_WIDTH, LCD_HEIGHT), depth=8)
+			self.surf.set_palette(PDI_PALETTE)
+		pg.surfarray.blit_array(self.surf, pixels.T)
+		return self.surf
+
+	def present(self, display):
+		display.blit(self.to_surf(), (0, 0))
@@ -0,0 +1,47 @@
+from os.path import isfile, join as joinpath
+
+from loaders.pds import PDStringsFile
+from logger import get_logger
+
+LOGGER = get_logger("api.localization")
+
+LANGUAGE_ENGLISH = 0
+LANGUAGE_JAPANESE = 1
+
+# pdc names each compiled strings table after its language
+LANGUAGE_CODES = {
+	LANGUAGE_ENGLISH: "en",
+	LANGUAGE_JAPANESE: "jp"
+}
+
+class PDStringsManager:
+	def __init__(self, directory=None):
+		self.directory = directory
+		self.language = LANGUAGE_ENGLISH
+
+		# every language stays loaded once it has been used, so switching back and forth is free
+		self.tables = {}
+
+	def set_directory(self, directory):
+		self.directory = directory
+		self.tables.clear()
+
+	def set_language(self, language):
+		self.language = language
+
+	def get_table(self, language=None):
+		if language is None: language = self.language
+		code = LANGUAGE_CODES.get(language, language)
+
+		if code not in self.tables:
+			table = None
+			path = joinpath(self.directory, f"{code}{PDStringsFile.PD_FILE_EXT}") if self.directory is not None else None
+			if path is not None and isfile(path): table = PDStringsFile(path, skip_magic=False, lazy=True)
+			else: LOGGER.warning(f"No strings table for language '{code}'")
+			self.tables[code] = table
+		return self.tables[code]
+
+	def get_localized_text(self, key, language=None):
+		table = self.get_table(language)
+		if table is None: return None
+		return table.get(key)
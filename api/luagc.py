@@ -0,0 +1,72 @@
+from time import perf_counter
+
+from api.runtime import RUNTIME
+from logger import get_logger
+
+LOGGER = get_logger("api.luagc")
+
+# the Playdate has 16 MB of RAM for the game
+DEVICE_HEAP_SIZE = 16 * 1024 * 1024
+
+# keep Lua's own allocation-driven collector from starting cycles mid-frame
+AUTO_GC_PAUSE = 1000
+AUTO_GC_STEPMUL = 100
+
+DEFAULT_MIN_GC_TIME = 1
+
+class LuaGarbageCollector:
+	def __init__(self, runtime=RUNTIME, heap_size=DEVICE_HEAP_SIZE):
+		self.runtime = runtime
+		self.heap_size = heap_size
+		self.collectgarbage = runtime.globals().collectgarbage
+
+		self._enabled = True
+		self.min_mem = 0.0
+		self.max_mem = 1.0
+		self.min_time = DEFAULT_MIN_GC_TIME
+
+		self.frame_time = 0.0
+		self.cycles = 0
+
+		self.collectgarbage("incremental", AUTO_GC_PAUSE, AUTO_GC_STEPMUL)
+
+	@property
+	def enabled(self):
+		return self._enabled
+
+	@enabled.setter
+	def enabled(self, flag):
+		# with automatic collection off, the game collects manually with collectgarbage()
+		self._enabled = bool(flag)
+		self.collectgarbage("restart" if self._enabled else "stop")
+
+	def get_memory_used(self):
+		return self.collectgarbage("count") * 1024 / self.heap_size
+
+	def get_budget(self, idle):
+		min_time = self.min_time / 1000
+		idle = max(idle - min_time, 0.0)
+		used = self.get_memory_used()
+
+		if used >= self.max_mem: scale = 1.0
+		elif used <= self.min_mem: scale = 0.0
+		else: scale = (used - self.min_mem) / (self.max_mem - self.min_mem)
+
+		return min_time + scale * idle
+
+	def collect(self, idle):
+		self.frame_time = 0.0
+		if not self._enabled: return self.frame_time
+
+		start = perf_counter()
+		deadline = start + self.get_budget(idle)
+
+		while True:
+			if self.collectgarbage("step", 0):
+				# a cycle just finished, so there's nothing left to find this frame
+				self.cycles += 1
+				break
+			if perf_counter() >= deadline: break
+
+		self.frame_time = perf_counter() - start
+		return self.frame_time
@@ -1,15 +1,20 @@
 import pygame as pg
 
-from calendar import timegm
-from datetime import datetime, timezone
-
 from os import name as PLATFORM, system
-from time import gmtime, localtime, sleep, perf_counter
-from threading import Thread
+from time import perf_counter
 
 from loaders.pft import PFT_PALETTE
+from api.blitter import DRAWMODE_COPY, DRAWMODE_WHITE_TRANSPARENT, DRAWMODE_BLACK_TRANSPARENT, DRAWMODE_FILL_WHITE, DRAWMODE_FILL_BLACK, DRAWMODE_XOR, DRAWMODE_NXOR, DRAWMODE_INVERTED, DRAWMODE_NAMES
+from api.graphics import COLOR_BLACK, COLOR_WHITE, COLOR_CLEAR, COLOR_XOR, DITHER_BAYER8X8, STROKE_CENTERED, STROKE_OUTSIDE, STROKE_INSIDE
+from api.localization import LANGUAGE_ENGLISH, LANGUAGE_JAPANESE
+from api.runtime import RUNTIME, TABLE_POOL
+from api.sound import PDFilePlayer, PDSamplePlayer
+from api.sequence import PDSequence, PDSequenceTrack
+from api.sprites import COLLISION_SLIDE, COLLISION_FREEZE, COLLISION_OVERLAP, COLLISION_BOUNCE, PDSprite
+from api.synth import LFO_SQUARE, LFO_TRIANGLE, LFO_SINE, LFO_SAMPLE_AND_HOLD, LFO_SAWTOOTH_UP, LFO_SAWTOOTH_DOWN, WAVE_SQUARE, WAVE_TRIANGLE, WAVE_SINE, WAVE_NOISE, WAVE_SAWTOOTH, WAVE_PO_PHASE, WAVE_PO_DIGITAL, WAVE_PO_VOSIM, PDInstrument, PDLFO, PDSynth
+from api.tilemap import PDTilemap
+from api.transform import FLIP_NONE, FLIP_X, FLIP_Y, FLIP_XY, FLIP_NAMES
 from pdemu import EMULATOR
-from api.runtime import RUNTIME
 
 def pd_accelerometerIsRunning():
 	return EMULATOR.accel.running
@@ -35,17 +40,22 @@ def pd_drawFPS(x, y):
 	fps_surf = pg.Surface((fps_text.get_width() + 1, fps_text.get_height() + 2))
 	fps_surf.fill(PFT_PALETTE[3])
 	fps_surf.blit(fps_text, (0, 1))
-	EMULATOR.display.blit(fps_surf, (x, y))
+	
+	# it goes into the frame buffer like any other drawing, in screen coordinates
+	ox, oy = EMULATOR.graphics.draw_offset
+	EMULATOR.graphics.draw_surface(fps_surf, x - ox, y - oy)
 
 def pd_epochFromGMTTime(time):
-	dt = datetime(time.year, time.month, time.day, time.hour, time.minute, time.second, time.millisecond * 1000, timezone.utc)
-	epoch = (dt - datetime(2000, 1, 1, tzinfo=timezone.utc)).total_seconds()
-	return int(epoch), round((epoch - int(epoch)) * 1000)
+	return EMULATOR.time_service.epoch_from_gmt_time(time)
 
 def pd_epochFromTime(time):
-	dt = datetime(time.year, time.month, time.day, time.hour, time.minute, time.second, time.millisecond * 1000).astimezone(tz=None)
-	epoch = (dt - datetime(2000, 1, 1, tzinfo=timezone.utc)).total_seconds()
-	return int(epoch), round((epoch - int(epoch)) * 1000)
+	return EMULATOR.time_service.epoch_from_time(time)
+
+def pd_frameTimer_new(duration, callback=None, *args):
+	return EMULATOR.scheduler.call_after_frames(duration, callback, *args)
+
+def pd_frameTimer_remove(timer):
+	timer.cancel()
 
 def pd_getBatteryPercentage():
 	return EMULATOR.battery.pct
@@ -86,22 +96,11 @@ def pd_getFPS():
 	return EMULATOR.clock.get_fps()
 
 def pd_getGMTTime():
-	dt = datetime.now(tz=timezone.utc)
-	time = dt.timetuple()
-	return RUNTIME.table_from({
-		"year": time.tm_year,
-		"month": time.tm_month,
-		"day": time.tm_mday,
-		"weekday": time.tm_wday,
-		"hour": time.tm_hour,
-		"minute": time.tm_min,
-		"second": time.tm_sec,
-		"millisecond": round(dt.microsecond / 1000)
-	})
+	return EMULATOR.time_service.get_gmt_time()
 
 def pd_getPowerStatus():
-	return RUNTIME.table_from({
-		"charging": EMULATOR.battery.charging
+	return TABLE_POOL.fill("getPowerStatus", {
+		"charging": EMULATOR.battery.charging,
 		"USB": EMULATOR.serial.enabled
 	})
 
@@ -109,16 +108,13 @@ def pd_getReduceFlashing():
 	return EMULATOR.settings.reduce_flashing
 
 def pd_getSecondsSinceEpoch():
-	dt = datetime.now(tz=timezone.utc)
-	epoch = (dt - datetime(2000, 1, 1, tzinfo=timezone.utc)).total_seconds()
-	return int(epoch), round((epoch - int(epoch)) * 1000)
+	return EMULATOR.time_service.get_seconds_since_epoch()
 
-# TODO: rework the garbage collector to be more like that of the device
 def pd_getStats():
-	return RUNTIME.table_from({
-		"GC": EMULATOR.stats.gc_time / EMULATOR.stats.interval
-		"game": EMULATOR.stats.game_time / EMULATOR.stats.interval
-		"audio": EMULATOR.stats.audio_time / EMULATOR.stats.interval
+	return TABLE_POOL.fill("getStats", {
+		"GC": EMULATOR.stats.gc_time / EMULATOR.stats.interval,
+		"game": EMULATOR.stats.game_time / EMULATOR.stats.interval,
+		"audio": EMULATOR.stats.audio_time / EMULATOR.stats.interval,
 		"idle": (EMULATOR.clock.get_time() - EMULATOR.clock.get_rawtime()) / (EMULATOR.stats.interval * 1000)
 	})
 
@@ -126,35 +122,142 @@ def pd_getSystemLanguage():
 	return EMULATOR.settings.language
 
 def pd_getSystemMenu():
-	return RUNTIME.table_from(EMULATOR.system_menu.formatted_dict)
+	return TABLE_POOL.fill("getSystemMenu", EMULATOR.system_menu.formatted_dict)
 
 def pd_getTime():
-	dt = datetime.now(tz=timezone.utc).astimezone(tz=None)
-	time = dt.timetuple()
-	return RUNTIME.table_from({
-		"year": time.tm_year,
-		"month": time.tm_month,
-		"day": time.tm_mday,
-		"weekday": time.tm_wday,
-		"hour": time.tm_hour,
-		"minute": time.tm_min,
-		"second": time.tm_sec,
-		"millisecond": round(dt.microsecond / 1000)
-	})
+	return EMULATOR.time_service.get_time()
 
 def pd_GMTTimeFromEpoch(seconds, milliseconds):
-	epoch = int(seconds) + (int(milliseconds) / 1000)
-	time = datetime(2000, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=epoch)
-	return RUNTIME.table_from({
-		"year": time.tm_year,
-		"month": time.tm_month,
-		"day": time.tm_mday,
-		"weekday": time.tm_wday,
-		"hour": time.tm_hour,
-		"minute": time.tm_min,
-		"second": time.tm_sec,
-		"millisecond": round((epoch - int(epoch)) * 1000)
-	})
+	return EMULATOR.time_service.gmt_time_from_epoch(seconds, milliseconds)
+
+def pd_graphics_clear(color=None):
+	EMULATOR.graphics.clear(color)
+
+def pd_graphics_clearClipRect():
+	EMULATOR.graphics.clear_clip_rect()
+
+def pd_graphics_drawCircleAtPoint(x, y, radius):
+	EMULATOR.graphics.draw_circle(x, y, radius)
+
+def pd_graphics_drawCircleInRect(x, y, width, height):
+	size = min(width, height)
+	EMULATOR.graphics.draw_ellipse(x + (width - size) / 2, y + (height - size) / 2, size, size)
+
+def pd_graphics_drawEllipseInRect(x, y, width, height):
+	EMULATOR.graphics.draw_ellipse(x, y, width, height)
+
+def pd_graphics_drawLine(x1, y1, x2, y2):
+	EMULATOR.graphics.draw_line(x1, y1, x2, y2)
+
+def pd_graphics_drawPixel(x, y):
+	EMULATOR.graphics.draw_pixel(x, y)
+
+def pd_graphics_drawPolygon(*coords):
+	EMULATOR.graphics.draw_polygon(coords)
+
+def pd_graphics_drawRect(x, y, width, height):
+	EMULATOR.graphics.draw_rect(x, y, width, height)
+
+def pd_graphics_fillCircleAtPoint(x, y, radius):
+	EMULATOR.graphics.fill_circle(x, y, radius)
+
+def pd_graphics_fillCircleInRect(x, y, width, height):
+	size = min(width, height)
+	EMULATOR.graphics.fill_ellipse(x + (width - size) / 2, y + (height - size) / 2, size, size)
+
+def pd_graphics_fillEllipseInRect(x, y, width, height):
+	EMULATOR.graphics.fill_ellipse(x, y, width, height)
+
+def pd_graphics_fillPolygon(*coords):
+	EMULATOR.graphics.fill_polygon(coords)
+
+def pd_graphics_fillRect(x, y, width, height):
+	EMULATOR.graphics.fill_rect(x, y, width, height)
+
+def pd_graphics_font_new(path):
+	return EMULATOR.assets.get_font(path)
+
+def pd_graphics_getBackgroundColor():
+	return EMULATOR.graphics.background_color
+
+def pd_graphics_getClipRect():
+	x0, y0, x1, y1 = EMULATOR.graphics.clip_rect
+	ox, oy = EMULATOR.graphics.draw_offset
+	return x0 - ox, y0 - oy, x1 - x0, y1 - y0
+
+def pd_graphics_getColor():
+	return EMULATOR.graphics.color
+
+def pd_graphics_getDrawOffset():
+	return EMULATOR.graphics.draw_offset
+
+def pd_graphics_getImageDrawMode():
+	return EMULATOR.graphics.image_draw_mode
+
+def pd_graphics_getLineWidth():
+	return EMULATOR.graphics.line_width
+
+def pd_graphics_getLocalizedText(key, language=None):
+	# the strings manager's own language unless the game asks for a specific one
+	return EMULATOR.strings.get_localized_text(key, language)
+
+def pd_graphics_getStrokeLocation():
+	return EMULATOR.graphics.stroke_location
+
+def pd_graphics_image_draw(image, x, y, flip=FLIP_NONE):
+	# drawn with whatever setImageDrawMode last set
+	EMULATOR.graphics.draw_image(image.pdImg, x, y, FLIP_NAMES.get(flip, flip))
+
+def pd_graphics_image_drawRotated(image, x, y, angle, xscale=1.0, yscale=None):
+	EMULATOR.graphics.draw_rotated(image.pdImg, x, y, angle, xscale, yscale)
+
+def pd_graphics_image_drawScaled(image, x, y, xscale, yscale=None):
+	EMULATOR.graphics.draw_scaled(image.pdImg, x, y, xscale, yscale)
+
+def pd_graphics_image_new(path):
+	# shared with every other load of the same path, the Lua object keeps it as pdImg
+	return EMULATOR.assets.get_image(path)
+
+def pd_graphics_image_rotatedImage(image, angle, xscale=1.0, yscale=None):
+	# out of the transform cache, so it's shared with every draw of the same rotation
+	return EMULATOR.graphics.transforms.get(image.pdImg, angle, xscale, yscale)
+
+def pd_graphics_image_scaledImage(image, xscale, yscale=None):
+	return EMULATOR.graphics.transforms.get(image.pdImg, 0.0, xscale, yscale)
+
+def pd_graphics_imagetable_new(path):
+	return EMULATOR.assets.get_image_table(path)
+
+def pd_graphics_setBackgroundColor(color):
+	EMULATOR.graphics.background_color = color
+
+def pd_graphics_setClipRect(x, y, width, height):
+	EMULATOR.graphics.set_clip_rect(x, y, width, height)
+
+def pd_graphics_setColor(color):
+	EMULATOR.graphics.set_color(color)
+
+def pd_graphics_setDitherPattern(alpha, dither_type=DITHER_BAYER8X8):
+	EMULATOR.graphics.set_dither_pattern(alpha, dither_type)
+
+def pd_graphics_setDrawOffset(x, y):
+	EMULATOR.graphics.draw_offset = (int(x), int(y))
+
+def pd_graphics_setImageDrawMode(mode):
+	EMULATOR.graphics.image_draw_mode = DRAWMODE_NAMES.get(mode, mode)
+
+def pd_graphics_setLineWidth(width):
+	EMULATOR.graphics.line_width = max(int(width), 1)
+
+def pd_graphics_setPattern(pattern):
+	rows = [int(pattern[i]) for i in range(1, len(pattern) + 1)]
+	EMULATOR.graphics.set_pattern(rows[:8], rows[8:16] if len(rows) >= 16 else None)
+
+def pd_graphics_setScreenClipRect(x, y, width, height):
+	EMULATOR.graphics.set_screen_clip_rect(x, y, width, height)
+
+def pd_graphics_setStrokeLocation(location):
+	EMULATOR.graphics.stroke_location = location
 
 def pd_isCrankDocked():
 	return EMULATOR.crank.docked
@@ -200,6 +303,299 @@ def pd_setStatsInterval(seconds):
 def pd_shouldDisplay24HourTime():
 	return EMULATOR.settings.time_24hours
 
+def pd_sound_fileplayer_new(path, buffer_size=None):
+	player = PDFilePlayer.from_file(path, EMULATOR.mixer)
+	if buffer_size is not None: player.set_buffer_size(buffer_size)
+	return player
+
+def pd_sound_fileplayer_pause(player):
+	player.pause()
+
+def pd_sound_fileplayer_setBufferSize(player, seconds):
+	player.set_buffer_size(seconds)
+
+def pd_sound_getCurrentTime():
+	return EMULATOR.mixer.get_current_time()
+
+def pd_sound_instrument_addVoice(instrument, synth, range_start=0, range_end=127, transpose=0):
+	instrument.add_voice(synth, range_start, range_end, transpose)
+
+def pd_sound_instrument_allNotesOff(instrument):
+	instrument.all_notes_off()
+
+def pd_sound_instrument_new(synth=None):
+	instrument = PDInstrument(EMULATOR.mixer)
+	if synth is not None: instrument.add_voice(synth)
+	return instrument
+
+def pd_sound_instrument_noteOff(instrument, pitch):
+	instrument.note_off(pitch)
+
+def pd_sound_instrument_playMIDINote(instrument, note, volume=1.0, length=None):
+	return instrument.play_midi_note(note, volume, length)
+
+def pd_sound_instrument_playNote(instrument, pitch, volume=1.0, length=None):
+	return instrument.play_note(pitch, volume, length)
+
+def pd_sound_instrument_setTranspose(instrument, halfsteps):
+	instrument.transpose = halfsteps
+
+def pd_sound_lfo_new(lfo_type=LFO_SINE):
+	return PDLFO(lfo_type)
+
+def pd_sound_lfo_setCenter(lfo, center):
+	lfo.center = center
+
+def pd_sound_lfo_setDepth(lfo, depth):
+	lfo.depth = depth
+
+def pd_sound_lfo_setPhase(lfo, phase):
+	lfo.phase = phase
+
+def pd_sound_lfo_setRate(lfo, rate):
+	lfo.rate = rate
+
+def pd_sound_lfo_setType(lfo, lfo_type):
+	lfo.type = lfo_type
+
+def pd_sound_player_getOffset(player):
+	return player.get_offset()
+
+def pd_sound_player_getRate(player):
+	return player.get_rate()
+
+def pd_sound_player_getVolume(player):
+	return player.get_volume()
+
+def pd_sound_player_isPlaying(player):
+	return player.is_playing()
+
+def pd_sound_player_play(player, repeat=1, rate=None):
+	player.play(repeat, rate)
+	return True
+
+def pd_sound_player_setFinishCallback(player, callback):
+	player.finish_callback = callback
+
+def pd_sound_player_setRate(player, rate):
+	player.set_rate(rate)
+
+def pd_sound_player_setVolume(player, left, right=None):
+	player.set_volume(left, right)
+
+def pd_sound_player_stop(player):
+	player.stop()
+
+def pd_sound_sampleplayer_getLength(player):
+	return player.get_length()
+
+def pd_sound_sampleplayer_new(path):
+	samples, sample_rate = EMULATOR.assets.get_samples(path)
+	return PDSamplePlayer(samples, sample_rate, EMULATOR.mixer)
+
+def pd_sound_sampleplayer_setOffset(player, seconds):
+	player.set_offset(seconds)
+
+def pd_sound_sequence_addTrack(sequence, track=None):
+	return sequence.add_track(track)
+
+def pd_sound_sequence_getCurrentStep(sequence):
+	return int(sequence.get_current_step())
+
+def pd_sound_sequence_getLength(sequence):
+	return sequence.get_length()
+
+def pd_sound_sequence_getTempo(sequence):
+	return sequence.get_tempo()
+
+def pd_sound_sequence_getTrackAtIndex(sequence, index):
+	return sequence.get_track_at_index(index)
+
+def pd_sound_sequence_getTrackCount(sequence):
+	return sequence.get_track_count()
+
+def pd_sound_sequence_goToStep(sequence, step, play=False):
+	sequence.go_to_step(step, play)
+
+def pd_sound_sequence_isPlaying(sequence):
+	return sequence.is_playing()
+
+def pd_sound_sequence_new(path=None):
+	if path is None: return PDSequence(EMULATOR.mixer)
+	return PDSequence.from_midi(EMULATOR.assets.get_midi(path), EMULATOR.mixer)
+
+def pd_sound_sequence_play(sequence, finish_callback=None):
+	sequence.play(finish_callback)
+
+def pd_sound_sequence_setLoops(sequence, start_step, end_step=None, loop_count=0):
+	sequence.set_loops(start_step, end_step, loop_count)
+
+def pd_sound_sequence_setTempo(sequence, steps_per_second):
+	sequence.set_tempo(steps_per_second)
+
+def pd_sound_sequence_setTrackAtIndex(sequence, index, track):
+	sequence.set_track_at_index(index, track)
+
+def pd_sound_sequence_stop(sequence):
+	sequence.stop()
+
+def pd_sound_synth_new(waveform=WAVE_SQUARE):
+	return PDSynth(waveform, EMULATOR.mixer)
+
+def pd_sound_synth_noteOff(synth):
+	synth.note_off()
+
+def pd_sound_synth_playMIDINote(synth, note, volume=1.0, length=None):
+	synth.play_midi_note(note, volume, length)
+	return True
+
+def pd_sound_synth_playNote(synth, pitch, volume=1.0, length=None):
+	synth.play_note(pitch, volume, length)
+	return True
+
+def pd_sound_synth_setADSR(synth, attack, decay, sustain, release):
+	synth.set_adsr(attack, decay, sustain, release)
+
+def pd_sound_synth_setAmplitudeMod(synth, lfo=None):
+	synth.amplitude_mod = lfo
+
+def pd_sound_synth_setAttackTime(synth, seconds):
+	synth.envelope.attack = seconds
+
+def pd_sound_synth_setDecayTime(synth, seconds):
+	synth.envelope.decay = seconds
+
+def pd_sound_synth_setFrequencyMod(synth, lfo=None):
+	synth.frequency_mod = lfo
+
+def pd_sound_synth_setParameter(synth, index, value):
+	if index == 1: synth.parameter = min(max(value, 0.0), 1.0)
+
+def pd_sound_synth_setReleaseTime(synth, seconds):
+	synth.envelope.release = seconds
+
+def pd_sound_synth_setSustainLevel(synth, level):
+	synth.envelope.sustain = level
+
+def pd_sound_synth_setWaveform(synth, waveform):
+	synth.set_waveform(waveform)
+
+def pd_sound_synth_setWavetable(synth, samples):
+	synth.set_wavetable([samples[i] for i in range(1, len(samples) + 1)])
+
+def pd_sound_track_addNote(track, step, note, length, velocity=1.0):
+	track.add_note(step, note, length, velocity)
+
+def pd_sound_track_clearNotes(track):
+	track.clear_notes()
+
+def pd_sound_track_getInstrument(track):
+	return track.instrument
+
+def pd_sound_track_getLength(track):
+	return track.get_length()
+
+def pd_sound_track_getNotes(track, step=None, end_step=None):
+	notes = track.get_notes(step, end_step)
+	return RUNTIME.table_from([RUNTIME.table_from({"step": step, "length": length, "note": note, "velocity": velocity}) for step, length, note, velocity in notes])
+
+def pd_sound_track_isMuted(track):
+	return track.muted
+
+def pd_sound_track_new():
+	return PDSequenceTrack()
+
+def pd_sound_track_removeNote(track, step, note):
+	track.remove_note(step, note)
+
+def pd_sound_track_setInstrument(track, instrument):
+	track.set_instrument(instrument)
+
+def pd_sound_track_setMuted(track, muted):
+	track.set_muted(muted)
+
+def pd_sprite_add(sprite):
+	EMULATOR.sprites.add(sprite)
+
+def pd_sprite_allOverlappingSprites():
+	return RUNTIME.table_from([RUNTIME.table(a, b) for a, b in EMULATOR.sprites.all_overlapping_sprites()])
+
+def _collision_tables(collisions):
+	# the SDK's field names, with points, vectors and rects as x/y keyed tables
+	tables = []
+	for i, collision in enumerate(collisions):
+		name = f"spriteCollision{i}"
+		(mx, my), (nx, ny), (tx, ty) = collision.move, collision.normal, collision.touch
+		sx, sy, sw, sh = collision.sprite_rect
+		ox, oy, ow, oh = collision.other_rect
+		tables.append(TABLE_POOL.fill(name, {
+			"sprite": collision.sprite,
+			"other": collision.other,
+			"type": collision.type,
+			"overlaps": collision.overlaps,
+			"ti": collision.ti,
+			"move": TABLE_POOL.fill(f"{name}.move", {"x": mx, "y": my}),
+			"normal": TABLE_POOL.fill(f"{name}.normal", {"x": nx, "y": ny}),
+			"touch": TABLE_POOL.fill(f"{name}.touch", {"x": tx, "y": ty}),
+			"spriteRect": TABLE_POOL.fill(f"{name}.spriteRect", {"x": sx, "y": sy, "width": sw, "height": sh}),
+			"otherRect": TABLE_POOL.fill(f"{name}.otherRect", {"x": ox, "y": oy, "width": ow, "height": oh})
+		}))
+	return RUNTIME.table_from(tables)
+
+def pd_sprite_checkCollisions(sprite, x, y):
+	actual_x, actual_y, collisions = sprite.check_collisions(x, y)
+	return actual_x, actual_y, _collision_tables(collisions), len(collisions)
+
+def pd_sprite_getAllSprites():
+	return RUNTIME.table_from(EMULATOR.sprites.sprites)
+
+def pd_sprite_getPosition(sprite):
+	return sprite.x, sprite.y
+
+def pd_sprite_moveBy(sprite, x, y):
+	sprite.move_by(x, y)
+
+def pd_sprite_moveTo(sprite, x, y):
+	sprite.move_to(x, y)
+
+def pd_sprite_moveWithCollisions(sprite, x, y):
+	actual_x, actual_y, collisions = sprite.move_with_collisions(x, y)
+	return actual_x, actual_y, _collision_tables(collisions), len(collisions)
+
+def pd_sprite_new(image=None):
+	return PDSprite(None if image is None else image.pdImg)
+
+def pd_sprite_overlappingSprites(sprite):
+	return RUNTIME.table_from(sprite.overlapping_sprites())
+
+def pd_sprite_querySpritesAtPoint(x, y):
+	return RUNTIME.table_from(EMULATOR.sprites.query_sprites_at_point(x, y))
+
+def pd_sprite_querySpritesInRect(x, y, width, height):
+	return RUNTIME.table_from(EMULATOR.sprites.query_sprites_in_rect(x, y, width, height))
+
+def pd_sprite_remove(sprite):
+	sprite.remove()
+
+def pd_sprite_removeAll():
+	EMULATOR.sprites.remove_all()
+
+def pd_sprite_setBackgroundDrawingCallback(callback):
+	EMULATOR.sprites.background = callback
+	EMULATOR.sprites.dirty[:] = True
+
+def pd_sprite_setCollideRect(sprite, x, y, width, height):
+	sprite.set_collide_rect(x, y, width, height)
+
+def pd_sprite_setZIndex(sprite, z_index):
+	sprite.set_z_index(z_index)
+
+def pd_sprite_spriteCount():
+	return len(EMULATOR.sprites.sprites)
+
+def pd_sprite_update():
+	EMULATOR.sprites.update()
+
 def pd_start():
 	with EMULATOR.call_update_lock: EMULATOR.call_update = True
 
@@ -212,27 +608,53 @@ def pd_stop():
 def pd_stopAccelerometer():
 	EMULATOR.accel.running = False
 
+def pd_tilemap_draw(tilemap, x, y):
+	tilemap.draw(EMULATOR.graphics, x, y, EMULATOR.graphics.image_draw_mode)
+
+def pd_tilemap_getPixelSize(tilemap):
+	return tilemap.get_pixel_size()
+
+def pd_tilemap_getSize(tilemap):
+	return tilemap.get_size()
+
+def pd_tilemap_getTileAtPosition(tilemap, x, y):
+	return tilemap.get_tile_at(x, y)
+
+def pd_tilemap_getTileSize(tilemap):
+	return tilemap.tile_width, tilemap.tile_height
+
+def pd_tilemap_new():
+	return PDTilemap()
+
+def pd_tilemap_setImageTable(tilemap, table):
+	tilemap.set_image_table(table.pdImg)
+
+def pd_tilemap_setSize(tilemap, width, height):
+	tilemap.set_size(width, height)
+
+def pd_tilemap_setTileAtPosition(tilemap, x, y, index):
+	tilemap.set_tile_at(x, y, index)
+
+def pd_tilemap_setTiles(tilemap, data, width):
+	tilemap.set_tiles([int(data[i]) for i in range(1, len(data) + 1)], width)
+
 def pd_timeFromEpoch(seconds, milliseconds):
-	epoch = int(seconds) + int(milliseconds / 1000)
-	time = datetime(2000, 1, 1).astimezone(tz=None) + timedelta(seconds=epoch)
-	return RUNTIME.table_from({
-		"year": time.tm_year,
-		"month": time.tm_month,
-		"day": time.tm_mday,
-		"weekday": time.tm_wday,
-		"hour": time.tm_hour,
-		"minute": time.tm_min,
-		"second": time.tm_sec,
-		"millisecond": round((epoch - int(epoch)) * 1000)
-	})
+	return EMULATOR.time_service.time_from_epoch(seconds, milliseconds)
 
-def pd_wait_cb(millis):
-	pd_stop()
-	sleep(millis / 1000)
-	pd_start()
+def pd_timer_new(duration, callback=None, *args):
+	# set repeats on the timer before it fires to keep it going
+	return EMULATOR.scheduler.call_later(duration, callback, *args)
+
+def pd_timer_remove(timer):
+	timer.cancel()
+
+def pd_timer_updateTimers():
+	# the emulator runs timers itself at the start of every frame, so there's nothing left to do here
+	pass
 
 def pd_wait(millis):
-	Thread(target=pd_wait_cb, name="playdate.wait()", args=(millis,), daemon=True)
+	pd_stop()
+	EMULATOR.scheduler.call_later(millis, pd_start)
 
 PLAYDATE_API = {
 	"accelerometerIsRunning": pd_accelerometerIsRunning,
@@ -287,4 +709,255 @@ PLAYDATE_API = {
 	"stopAccelerometer": pd_stopAccelerometer,
 	"timeFromEpoch": pd_timeFromEpoch,
 	"wait": pd_wait	
+}
+
+PLAYDATE_GRAPHICS_API = {
+	"clear": pd_graphics_clear,
+	"clearClipRect": pd_graphics_clearClipRect,
+	"drawCircleAtPoint": pd_graphics_drawCircleAtPoint,
+	"drawCircleInRect": pd_graphics_drawCircleInRect,
+	"drawEllipseInRect": pd_graphics_drawEllipseInRect,
+	"drawLine": pd_graphics_drawLine,
+	"drawPixel": pd_graphics_drawPixel,
+	"drawPolygon": pd_graphics_drawPolygon,
+	"drawRect": pd_graphics_drawRect,
+	"drawTriangle": pd_graphics_drawPolygon,
+	"fillCircleAtPoint": pd_graphics_fillCircleAtPoint,
+	"fillCircleInRect": pd_graphics_fillCircleInRect,
+	"fillEllipseInRect": pd_graphics_fillEllipseInRect,
+	"fillPolygon": pd_graphics_fillPolygon,
+	"fillRect": pd_graphics_fillRect,
+	"fillTriangle": pd_graphics_fillPolygon,
+	"getBackgroundColor": pd_graphics_getBackgroundColor,
+	"getClipRect": pd_graphics_getClipRect,
+	"getColor": pd_graphics_getColor,
+	"getDrawOffset": pd_graphics_getDrawOffset,
+	"getImageDrawMode": pd_graphics_getImageDrawMode,
+	"getLineWidth": pd_graphics_getLineWidth,
+	"getLocalizedText": pd_graphics_getLocalizedText,
+	"getStrokeLocation": pd_graphics_getStrokeLocation,
+	"kColorBlack": COLOR_BLACK,
+	"kColorClear": COLOR_CLEAR,
+	"kColorWhite": COLOR_WHITE,
+	"kColorXOR": COLOR_XOR,
+	"kDrawModeBlackTransparent": DRAWMODE_BLACK_TRANSPARENT,
+	"kDrawModeCopy": DRAWMODE_COPY,
+	"kDrawModeFillBlack": DRAWMODE_FILL_BLACK,
+	"kDrawModeFillWhite": DRAWMODE_FILL_WHITE,
+	"kDrawModeInverted": DRAWMODE_INVERTED,
+	"kDrawModeNXOR": DRAWMODE_NXOR,
+	"kDrawModeWhiteTransparent": DRAWMODE_WHITE_TRANSPARENT,
+	"kDrawModeXOR": DRAWMODE_XOR,
+	"kImageFlippedX": FLIP_X,
+	"kImageFlippedXY": FLIP_XY,
+	"kImageFlippedY": FLIP_Y,
+	"kImageUnflipped": FLIP_NONE,
+	"kLanguageEnglish": LANGUAGE_ENGLISH,
+	"kLanguageJapanese": LANGUAGE_JAPANESE,
+	"kStrokeCentered": STROKE_CENTERED,
+	"kStrokeInside": STROKE_INSIDE,
+	"kStrokeOutside": STROKE_OUTSIDE,
+	"setBackgroundColor": pd_graphics_setBackgroundColor,
+	"setClipRect": pd_graphics_setClipRect,
+	"setColor": pd_graphics_setColor,
+	"setDitherPattern": pd_graphics_setDitherPattern,
+	"setDrawOffset": pd_graphics_setDrawOffset,
+	"setImageDrawMode": pd_graphics_setImageDrawMode,
+	"setLineWidth": pd_graphics_setLineWidth,
+	"setPattern": pd_graphics_setPattern,
+	"setScreenClipRect": pd_graphics_setScreenClipRect,
+	"setStrokeLocation": pd_graphics_setStrokeLocation
+}
+
+PLAYDATE_SPRITE_API = {
+	"add": pd_sprite_add,
+	"addSprite": pd_sprite_add,
+	"allOverlappingSprites": pd_sprite_allOverlappingSprites,
+	"checkCollisions": pd_sprite_checkCollisions,
+	"getAllSprites": pd_sprite_getAllSprites,
+	"getPosition": pd_sprite_getPosition,
+	"kCollisionTypeBounce": COLLISION_BOUNCE,
+	"kCollisionTypeFreeze": COLLISION_FREEZE,
+	"kCollisionTypeOverlap": COLLISION_OVERLAP,
+	"kCollisionTypeSlide": COLLISION_SLIDE,
+	"moveBy": pd_sprite_moveBy,
+	"moveTo": pd_sprite_moveTo,
+	"moveWithCollisions": pd_sprite_moveWithCollisions,
+	"new": pd_sprite_new,
+	"overlappingSprites": pd_sprite_overlappingSprites,
+	"querySpritesAtPoint": pd_sprite_querySpritesAtPoint,
+	"querySpritesInRect": pd_sprite_querySpritesInRect,
+	"remove": pd_sprite_remove,
+	"removeAll": pd_sprite_removeAll,
+	"removeSprite": pd_sprite_remove,
+	"setBackgroundDrawingCallback": pd_sprite_setBackgroundDrawingCallback,
+	"setCollideRect": pd_sprite_setCollideRect,
+	"setZIndex": pd_sprite_setZIndex,
+	"spriteCount": pd_sprite_spriteCount,
+	"update": pd_sprite_update
+}
+
+PLAYDATE_TILEMAP_API = {
+	"draw": pd_tilemap_draw,
+	"getPixelSize": pd_tilemap_getPixelSize,
+	"getSize": pd_tilemap_getSize,
+	"getTileAtPosition": pd_tilemap_getTileAtPosition,
+	"getTileSize": pd_tilemap_getTileSize,
+	"new": pd_tilemap_new,
+	"setImageTable": pd_tilemap_setImageTable,
+	"setSize": pd_tilemap_setSize,
+	"setTileAtPosition": pd_tilemap_setTileAtPosition,
+	"setTiles": pd_tilemap_setTiles
+}
+
+PLAYDATE_SOUND_API = {
+	"getCurrentTime": pd_sound_getCurrentTime,
+	"kLFOTypeSampleAndHold": LFO_SAMPLE_AND_HOLD,
+	"kLFOTypeSawtoothDown": LFO_SAWTOOTH_DOWN,
+	"kLFOTypeSawtoothUp": LFO_SAWTOOTH_UP,
+	"kLFOTypeSine": LFO_SINE,
+	"kLFOTypeSquare": LFO_SQUARE,
+	"kLFOTypeTriangle": LFO_TRIANGLE,
+	"kWaveNoise": WAVE_NOISE,
+	"kWavePOPhase": WAVE_PO_PHASE,
+	"kWavePODigital": WAVE_PO_DIGITAL,
+	"kWavePOVosim": WAVE_PO_VOSIM,
+	"kWaveSawtooth": WAVE_SAWTOOTH,
+	"kWaveSine": WAVE_SINE,
+	"kWaveSquare": WAVE_SQUARE,
+	"kWaveTriangle": WAVE_TRIANGLE
+}
+
+PLAYDATE_SAMPLEPLAYER_API = {
+	"getLength": pd_sound_sampleplayer_getLength,
+	"getOffset": pd_sound_player_getOffset,
+	"getRate": pd_sound_player_getRate,
+	"getVolume": pd_sound_player_getVolume,
+	"isPlaying": pd_sound_player_isPlaying,
+	"new": pd_sound_sampleplayer_new,
+	"play": pd_sound_player_play,
+	"setFinishCallback": pd_sound_player_setFinishCallback,
+	"setOffset": pd_sound_sampleplayer_setOffset,
+	"setRate": pd_sound_player_setRate,
+	"setVolume": pd_sound_player_setVolume,
+	"stop": pd_sound_player_stop
+}
+
+PLAYDATE_FILEPLAYER_API = {
+	"getOffset": pd_sound_player_getOffset,
+	"getRate": pd_sound_player_getRate,
+	"getVolume": pd_sound_player_getVolume,
+	"isPlaying": pd_sound_player_isPlaying,
+	"new": pd_sound_fileplayer_new,
+	"pause": pd_sound_fileplayer_pause,
+	"play": pd_sound_player_play,
+	"setBufferSize": pd_sound_fileplayer_setBufferSize,
+	"setFinishCallback": pd_sound_player_setFinishCallback,
+	"setRate": pd_sound_player_setRate,
+	"setVolume": pd_sound_player_setVolume,
+	"stop": pd_sound_player_stop
+}
+
+PLAYDATE_SYNTH_API = {
+	"getVolume": pd_sound_player_getVolume,
+	"isPlaying": pd_sound_player_isPlaying,
+	"new": pd_sound_synth_new,
+	"noteOff": pd_sound_synth_noteOff,
+	"playMIDINote": pd_sound_synth_playMIDINote,
+	"playNote": pd_sound_synth_playNote,
+	"setADSR": pd_sound_synth_setADSR,
+	"setAmplitudeMod": pd_sound_synth_setAmplitudeMod,
+	"setAttackTime": pd_sound_synth_setAttackTime,
+	"setDecayTime": pd_sound_synth_setDecayTime,
+	"setFinishCallback": pd_sound_player_setFinishCallback,
+	"setFrequencyMod": pd_sound_synth_setFrequencyMod,
+	"setParameter": pd_sound_synth_setParameter,
+	"setReleaseTime": pd_sound_synth_setReleaseTime,
+	"setSustainLevel": pd_sound_synth_setSustainLevel,
+	"setVolume": pd_sound_player_setVolume,
+	"setWaveform": pd_sound_synth_setWaveform,
+	"setWavetable": pd_sound_synth_setWavetable,
+	"stop": pd_sound_player_stop
+}
+
+PLAYDATE_LFO_API = {
+	"new": pd_sound_lfo_new,
+	"setCenter": pd_sound_lfo_setCenter,
+	"setDepth": pd_sound_lfo_setDepth,
+	"setPhase": pd_sound_lfo_setPhase,
+	"setRate": pd_sound_lfo_setRate,
+	"setType": pd_sound_lfo_setType
+}
+
+PLAYDATE_INSTRUMENT_API = {
+	"addVoice": pd_sound_instrument_addVoice,
+	"allNotesOff": pd_sound_instrument_allNotesOff,
+	"getVolume": pd_sound_player_getVolume,
+	"new": pd_sound_instrument_new,
+	"noteOff": pd_sound_instrument_noteOff,
+	"playMIDINote": pd_sound_instrument_playMIDINote,
+	"playNote": pd_sound_instrument_playNote,
+	"setTranspose": pd_sound_instrument_setTranspose,
+	"setVolume": pd_sound_player_setVolume
+}
+
+PLAYDATE_SEQUENCE_API = {
+	"addTrack": pd_sound_sequence_addTrack,
+	"getCurrentStep": pd_sound_sequence_getCurrentStep,
+	"getLength": pd_sound_sequence_getLength,
+	"getTempo": pd_sound_sequence_getTempo,
+	"getTrackAtIndex": pd_sound_sequence_getTrackAtIndex,
+	"getTrackCount": pd_sound_sequence_getTrackCount,
+	"goToStep": pd_sound_sequence_goToStep,
+	"isPlaying": pd_sound_sequence_isPlaying,
+	"new": pd_sound_sequence_new,
+	"play": pd_sound_sequence_play,
+	"setLoops": pd_sound_sequence_setLoops,
+	"setTempo": pd_sound_sequence_setTempo,
+	"setTrackAtIndex": pd_sound_sequence_setTrackAtIndex,
+	"stop": pd_sound_sequence_stop
+}
+
+PLAYDATE_TRACK_API = {
+	"addNote": pd_sound_track_addNote,
+	"clearNotes": pd_sound_track_clearNotes,
+	"getInstrument": pd_sound_track_getInstrument,
+	"getLength": pd_sound_track_getLength,
+	"getNotes": pd_sound_track_getNotes,
+	"isMuted": pd_sound_track_isMuted,
+	"new": pd_sound_track_new,
+	"removeNote": pd_sound_track_removeNote,
+	"setInstrument": pd_sound_track_setInstrument,
+	"setMuted": pd_sound_track_setMuted
+}
+
+PLAYDATE_IMAGE_API = {
+	"draw": pd_graphics_image_draw,
+	"drawRotated": pd_graphics_image_drawRotated,
+	"drawScaled": pd_graphics_image_drawScaled,
+	"new": pd_graphics_image_new,
+	"rotatedImage": pd_graphics_image_rotatedImage,
+	"scaledImage": pd_graphics_image_scaledImage
+}
+
+PLAYDATE_IMAGETABLE_API = {
+	"new": pd_graphics_imagetable_new
+}
+
+PLAYDATE_FONT_API = {
+	"new": pd_graphics_font_new
+}
+
+PLAYDATE_TIMER_API = {
+	"new": pd_timer_new,
+	"performAfterDelay": pd_timer_new,
+	"remove": pd_timer_remove,
+	"updateTimers": pd_timer_updateTimers
+}
+
+PLAYDATE_FRAMETIMER_API = {
+	"new": pd_frameTimer_new,
+	"performAfterDelay": pd_frameTimer_new,
+	"remove": pd_frameTimer_remove,
+	"updateTimers": pd_timer_updateTimers
 }
\ No newline at end of file
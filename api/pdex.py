@@ -0,0 +1,347 @@
+from re import compile as re_compile
+from struct import pack, pack_into, unpack
+from sys import argv
+from time import perf_counter
+
+from capstone import Cs, CS_ARCH_ARM, CS_MODE_MCLASS, CS_MODE_THUMB
+from unicorn import Uc, UC_ARCH_ARM, UC_HOOK_BLOCK, UC_HOOK_CODE, UC_MODE_MCLASS, UC_MODE_THUMB
+from unicorn.arm_const import *
+
+from loaders.pdbin import PDBinFile
+from logger import init_logging, get_logger
+
+LOGGER = get_logger("api.pdex")
+
+# Rev A memory map (STM32F746): internal SRAM for the stack, external SDRAM for the game
+SRAM_BASE = 0x20000000
+SRAM_SIZE = 0x50000
+SDRAM_BASE = 0x60000000
+SDRAM_SIZE = 0x1000000
+LOAD_ADDRESS = 0x6000000c
+
+# host-side region holding the API trap stubs and the PlaydateAPI structs
+TRAP_BASE = 0x10000000
+TRAP_SIZE = 0x10000
+TRAP_STRIDE = 4
+API_BASE = TRAP_BASE + TRAP_SIZE
+API_SIZE = 0x10000
+
+# bx lr; nop
+THUMB_RETURN_STUB = b"\x70\x47\x00\xbf"
+
+K_EVENT_INIT = 0
+K_EVENT_INIT_LUA = 1
+K_EVENT_LOCK = 2
+K_EVENT_UNLOCK = 3
+K_EVENT_PAUSE = 4
+K_EVENT_RESUME = 5
+K_EVENT_TERMINATE = 6
+K_EVENT_KEY_PRESSED = 7
+K_EVENT_KEY_RELEASED = 8
+K_EVENT_LOW_POWER = 9
+
+ARG_REGS = (UC_ARM_REG_R0, UC_ARM_REG_R1, UC_ARM_REG_R2, UC_ARM_REG_R3)
+
+PLAYDATE_API_STRUCTS = ("system", "file", "graphics", "sprite", "display", "sound", "lua", "json", "scoreboards")
+
+# function pointers in struct playdate_sys, in order
+SYSTEM_API = (
+	"realloc", "formatString", "logToConsole", "error", "getLanguage",
+	"getCurrentTimeMilliseconds", "getSecondsSinceEpoch", "drawFPS", "setUpdateCallback", "getButtonState",
+	"setPeripheralsEnabled", "getAccelerometer", "getCrankChange", "getCrankAngle", "isCrankDocked",
+	"setCrankSoundsDisabled", "getFlipped", "setAutoLockDisabled", "setMenuImage", "addMenuItem",
+	"addCheckmarkMenuItem", "addOptionsMenuItem", "removeAllMenuItems", "removeMenuItem", "getMenuItemValue",
+	"setMenuItemValue", "getMenuItemTitle", "setMenuItemTitle", "getMenuItemUserdata", "setMenuItemUserdata",
+	"getReduceFlashing", "getElapsedTime", "resetElapsedTime", "getBatteryPercentage", "getBatteryVoltage",
+	"getTimezoneOffset", "shouldDisplay24HourTime", "convertEpochToDateTime", "convertDateTimeToEpoch", "clearICache"
+)
+# structs we haven't named yet still get a trap per slot, so calls through them are caught and logged
+API_STRUCT_SLOTS = 128
+
+PRINTF_SPEC = re_compile(rb"%([-+ #0]*)(\d+|\*)?(?:\.(\d+|\*))?(hh|h|ll|l|z|j|t)?([diuxXoeEfFgGcsp%])")
+
+class GuestHeap:
+	def __init__(self, start, end):
+		self.start = (start + 7) & ~7
+		self.end = end
+		self.top = self.start
+		self.sizes = {}
+		self.free_lists = {}
+
+	def alloc(self, size):
+		size = max((size + 7) & ~7, 8)
+		free_list = self.free_lists.get(size)
+		if free_list: ptr = free_list.pop()
+		else:
+			if self.top + size > self.end: return 0
+			ptr = self.top
+			self.top += size
+		self.sizes[ptr] = size
+		return ptr
+
+	def free(self, ptr):
+		size = self.sizes.pop(ptr, None)
+		if size is not None: self.free_lists.setdefault(size, []).append(ptr)
+
+	def size_of(self, ptr):
+		return self.sizes.get(ptr, 0)
+
+class PDExRuntime:
+	def __init__(self, bin_file, emulator=None, profile=False):
+		if type(bin_file) != PDBinFile: bin_file = PDBinFile(bin_file)
+		self.bin_file = bin_file
+		self.emulator = emulator
+
+		self.uc = Uc(UC_ARCH_ARM, UC_MODE_THUMB | UC_MODE_MCLASS)
+		self.uc.ctl_set_cpu_model(UC_CPU_ARM_CORTEX_M7)
+		self.uc.mem_map(SRAM_BASE, SRAM_SIZE)
+		self.uc.mem_map(SDRAM_BASE, SDRAM_SIZE)
+		self.uc.mem_map(TRAP_BASE, TRAP_SIZE + API_SIZE)
+
+		self.stack_top = SRAM_BASE + SRAM_SIZE
+		self.load()
+		self.heap = GuestHeap(LOAD_ADDRESS + self.bin_file.memsz, SDRAM_BASE + SDRAM_SIZE)
+
+		self.traps = []
+		self.unimplemented = set()
+		self.api_address = self._build_api()
+		self.halt_address = self._add_trap("host", "halt", None)
+
+		# only the trap region is instrumented, so translated game code runs without any hooks
+		self.uc.hook_add(UC_HOOK_CODE, self._dispatch_trap, begin=TRAP_BASE, end=TRAP_BASE + TRAP_SIZE - 1)
+
+		self.profile = profile
+		self.block_cache = {}
+		self.instructions = 0
+		self.run_time = 0.0
+		if profile:
+			self.disassembler = Cs(CS_ARCH_ARM, CS_MODE_THUMB | CS_MODE_MCLASS)
+			self.uc.hook_add(UC_HOOK_BLOCK, self._count_block, begin=SDRAM_BASE, end=SDRAM_BASE + SDRAM_SIZE - 1)
+
+		self.running = False
+		self.update_callback = 0
+		self.update_userdata = 0
+		self.entry = LOAD_ADDRESS + self.bin_file.event_handler
+
+	def load(self):
+		# code and zeroed BSS go into guest memory in a single write
+		image = self.bin_file.relocate(LOAD_ADDRESS)
+		self.uc.mem_write(LOAD_ADDRESS, image + bytes(self.bin_file.memsz - len(image)))
+
+	def _add_trap(self, struct_name, func_name, handler):
+		address = TRAP_BASE + len(self.traps) * TRAP_STRIDE
+		if address + TRAP_STRIDE > TRAP_BASE + TRAP_SIZE: raise MemoryError("API trap table is full")
+		self.uc.mem_write(address, THUMB_RETURN_STUB)
+		self.traps.append((struct_name, func_name, handler))
+		return address
+
+	def _build_api(self):
+		struct_size = API_STRUCT_SLOTS * 4
+		api_address = API_BASE
+		struct_address = API_BASE + len(PLAYDATE_API_STRUCTS) * 4
+
+		for i, struct_name in enumerate(PLAYDATE_API_STRUCTS):
+			names = SYSTEM_API if struct_name == "system" else ()
+			pointers = bytearray(struct_size)
+
+			for slot in range(API_STRUCT_SLOTS):
+				func_name = names[slot] if slot < len(names) else str(slot)
+				handler = getattr(self, f"_{struct_name}_{func_name}", None)
+				pack_into("<L", pointers, slot * 4, self._add_trap(struct_name, func_name, handler) | 1)
+
+			self.uc.mem_write(struct_address, bytes(pointers))
+			self.write_u32(api_address + i * 4, struct_address)
+			struct_address += struct_size
+
+		return api_address
+
+	def _dispatch_trap(self, uc, address, size, user_data):
+		struct_name, func_name, handler = self.traps[(address - TRAP_BASE) // TRAP_STRIDE]
+		if handler is not None:
+			result = handler()
+			if type(result) == float: self.set_return_float(result)
+			elif result is not None: self.set_return(result)
+		elif struct_name != "host":
+			if (struct_name, func_name) not in self.unimplemented:
+				LOGGER.warning(f"Unimplemented API function: playdate->{struct_name}->{func_name}")
+				self.unimplemented.add((struct_name, func_name))
+			self.set_return(0)
+
+	def _count_block(self, uc, address, size, user_data):
+		count = self.block_cache.get(address)
+		if count is None:
+			count = sum(1 for insn in self.disassembler.disasm_lite(bytes(uc.mem_read(address, size)), address))
+			self.block_cache[address] = count
+		self.instructions += count
+
+	def get_mips(self):
+		if not self.profile or self.run_time == 0.0: return None
+		return self.instructions / self.run_time / 1e6
+
+	def call(self, address, *args):
+		if self.running: raise RuntimeError("can't call into the game while it's already running")
+
+		sp = self.stack_top
+		stack_args = args[4:]
+		if stack_args:
+			sp = (sp - 4 * len(stack_args)) & ~7
+			self.uc.mem_write(sp, pack(f"<{len(stack_args)}L", *(arg & 0xffffffff for arg in stack_args)))
+		for reg, arg in zip(ARG_REGS, args): self.uc.reg_write(reg, arg & 0xffffffff)
+
+		self.uc.reg_write(UC_ARM_REG_SP, sp)
+		self.uc.reg_write(UC_ARM_REG_LR, self.halt_address | 1)
+
+		self.running = True
+		start = perf_counter()
+		try: self.uc.emu_start(address | 1, self.halt_address)
+		finally:
+			self.run_time += perf_counter() - start
+			self.running = False
+
+		return self.uc.reg_read(UC_ARM_REG_R0)
+
+	def send_event(self, event, arg=0):
+		return self.call(self.entry, self.api_address, event, arg)
+
+	def update(self):
+		if self.update_callback: return self.call(self.update_callback, self.update_userdata)
+		return 0
+
+	def arg(self, index):
+		if index < 4: return self.uc.reg_read(ARG_REGS[index])
+		return self.read_u32(self.uc.reg_read(UC_ARM_REG_SP) + 4 * (index - 4))
+
+	def set_return(self, value):
+		self.uc.reg_write(UC_ARM_REG_R0, int(value) & 0xffffffff)
+
+	def set_return_float(self, value):
+		self.uc.reg_write(UC_ARM_REG_S0, unpack("<L", pack("<f", value))[0])
+
+	def read_u32(self, address):
+		return unpack("<L", self.uc.mem_read(address, 4))[0]
+
+	def write_u32(self, address, value):
+		self.uc.mem_write(address, pack("<L", value & 0xffffffff))
+
+	def read_str(self, address):
+		data = bytearray()
+		while True:
+			chunk = self.uc.mem_read(address + len(data), 64)
+			end = chunk.find(b"\0")
+			if end != -1: return bytes(data + chunk[:end])
+			data += chunk
+
+	def write_str(self, data):
+		ptr = self.heap.alloc(len(data) + 1)
+		if ptr: self.uc.mem_write(ptr, data + b"\0")
+		return ptr
+
+	def format_string(self, fmt_address, first_arg):
+		fmt = self.read_str(fmt_address)
+		# variadic arguments always follow the base procedure call standard, even with a hardware FPU
+		state = {"index": first_arg}
+
+		def next_word():
+			value = self.arg(state["index"])
+			state["index"] += 1
+			return value
+
+		def next_dword():
+			if state["index"] % 2: state["index"] += 1
+			low = next_word()
+			return low | (next_word() << 32)
+
+		def convert(match):
+			flags, width, precision, length, conv = match.groups()
+			if conv == b"%": return b"%"
+			if width == b"*": width = str(next_word()).encode()
+			if precision == b"*": precision = str(next_word()).encode()
+			spec = b"%" + flags + (width or b"") + (b"." + precision if precision is not None else b"")
+
+			if conv in b"eEfFgG": value = unpack("<d", pack("<Q", next_dword()))[0]
+			elif length in (b"ll", b"j"): value = next_dword()
+			else: value = next_word()
+
+			if conv == b"s": return (spec + b"s") % self.read_str(value)
+			if conv == b"c": return (spec + b"c") % (value & 0xff)
+			if conv == b"p": return b"0x%08x" % value
+			if conv in b"di":
+				bits = 64 if length in (b"ll", b"j") else 32
+				if value >> (bits - 1): value -= 1 << bits
+				conv = b"d"
+			elif conv == b"u": conv = b"d"
+			return (spec + conv) % value
+
+		return PRINTF_SPEC.sub(convert, fmt)
+
+	def _system_realloc(self):
+		ptr, size = self.arg(0), self.arg(1)
+		if size == 0:
+			self.heap.free(ptr)
+			return 0
+
+		new_ptr = self.heap.alloc(size)
+		if ptr and new_ptr:
+			self.uc.mem_write(new_ptr, bytes(self.uc.mem_read(ptr, min(self.heap.size_of(ptr), size))))
+			self.heap.free(ptr)
+		return new_ptr
+
+	def _system_formatString(self):
+		text = self.format_string(self.arg(1), 2)
+		self.write_u32(self.arg(0), self.write_str(text))
+		return len(text)
+
+	def _system_logToConsole(self):
+		print(self.format_string(self.arg(0), 1).decode("utf-8", errors="replace"))
+
+	def _system_error(self):
+		LOGGER.error(self.format_string(self.arg(0), 1).decode("utf-8", errors="replace"))
+		self.uc.emu_stop()
+
+	def _system_getCurrentTimeMilliseconds(self):
+		if self.emulator is None: return int(self.run_time * 1000)
+		return int(self.emulator.game_time)
+
+	def _system_getSecondsSinceEpoch(self):
+		if self.emulator is None: return 0
+		seconds, milliseconds = self.emulator.time_service.get_seconds_since_epoch()
+		if self.arg(0): self.write_u32(self.arg(0), milliseconds)
+		return seconds
+
+	def _system_setUpdateCallback(self):
+		self.update_callback = self.arg(0)
+		self.update_userdata = self.arg(1)
+
+	def _system_getButtonState(self):
+		current = pushed = released = 0
+		if self.emulator is not None:
+			for button, pressed in self.emulator.buttons.items():
+				was_pressed = self.emulator.prev_buttons[button]
+				if pressed: current |= button
+				if pressed and not was_pressed: pushed |= button
+				if was_pressed and not pressed: released |= button
+
+		for i, value in enumerate((current, pushed, released)):
+			if self.arg(i): self.write_u32(self.arg(i), value)
+
+	def _system_getElapsedTime(self):
+		if self.emulator is None: return 0.0
+		return float(perf_counter() - self.emulator.hires_time)
+
+	def _system_resetElapsedTime(self):
+		if self.emulator is not None: self.emulator.hires_time = perf_counter()
+
+	def _system_clearICache(self):
+		pass
+
+if __name__ == "__main__":
+	init_logging()
+
+	runtime = PDExRuntime(argv[1], profile=True)
+	runtime.send_event(K_EVENT_INIT)
+
+	num_frames = int(argv[2]) if len(argv) > 2 else 0
+	for i in range(num_frames): runtime.update()
+
+	mips = runtime.get_mips()
+	if mips is not None: print(f"Guest speed: {mips:.2f} MIPS over {runtime.instructions} instructions")
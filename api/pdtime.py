@@ -0,0 +1,109 @@
+from time import localtime, time_ns
+
+from api.runtime import TABLE_POOL
+
+# seconds from the Unix epoch to the Playdate epoch (2000-01-01 00:00:00 UTC)
+PLAYDATE_EPOCH = 946684800
+SECONDS_PER_DAY = 86400
+
+# from Howard Hinnant's date algorithms, shifted so that day 0 is 2000-01-01
+def days_from_civil(year, month, day):
+	year -= month <= 2
+	era = year // 400
+	yoe = year - era * 400
+	doy = (153 * (month - 3 if month > 2 else month + 9) + 2) // 5 + day - 1
+	doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+	return era * 146097 + doe - 730425
+
+def civil_from_days(days):
+	days += 730425
+	era = days // 146097
+	doe = days - era * 146097
+	yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+	doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+	mp = (5 * doy + 2) // 153
+	day = doy - (153 * mp + 2) // 5 + 1
+	month = mp + 3 if mp < 10 else mp - 9
+	return yoe + era * 400 + (month <= 2), month, day
+
+def epoch_from_fields(year, month, day, hour=0, minute=0, second=0):
+	return days_from_civil(year, month, day) * SECONDS_PER_DAY + hour * 3600 + minute * 60 + second
+
+def get_utc_offset(seconds):
+	return localtime(seconds + PLAYDATE_EPOCH).tm_gmtoff
+
+def local_to_epoch(local_seconds):
+	# the offset depends on the instant, so resolve it against a first guess
+	guess = local_seconds - get_utc_offset(local_seconds)
+	return local_seconds - get_utc_offset(guess)
+
+def fill_time_table(table, seconds, milliseconds):
+	days, secs = divmod(seconds, SECONDS_PER_DAY)
+	year, month, day = civil_from_days(days)
+
+	table.year = year
+	table.month = month
+	table.day = day
+	# 2000-01-01 was a Saturday, and the Playdate counts weekdays from Monday = 1
+	table.weekday = (days + 5) % 7 + 1
+	table.hour = secs // 3600
+	table.minute = (secs // 60) % 60
+	table.second = secs % 60
+	table.millisecond = milliseconds
+	return table
+
+class PDTimeService:
+	def __init__(self, pool=TABLE_POOL):
+		self.pool = pool
+
+		self.gmt_table = None
+		self.local_table = None
+
+		self.begin_frame()
+
+	def begin_frame(self):
+		# the wall clock is sampled at most once per emulated frame
+		self._sampled = False
+		self._gmt_stale = True
+		self._local_stale = True
+
+	def _sample(self):
+		if not self._sampled:
+			seconds, self.milliseconds = divmod(time_ns() // 1000000, 1000)
+			self.seconds = seconds - PLAYDATE_EPOCH
+			self.utc_offset = get_utc_offset(self.seconds)
+			self._sampled = True
+
+	def get_seconds_since_epoch(self):
+		self._sample()
+		return self.seconds, self.milliseconds
+
+	def get_gmt_time(self):
+		if self._gmt_stale or self.pool.copy_mode:
+			self._sample()
+			self.gmt_table = fill_time_table(self.pool.acquire("getGMTTime"), self.seconds, self.milliseconds)
+			self._gmt_stale = False
+		return self.gmt_table
+
+	def get_time(self):
+		if self._local_stale or self.pool.copy_mode:
+			self._sample()
+			self.local_table = fill_time_table(self.pool.acquire("getTime"), self.seconds + self.utc_offset, self.milliseconds)
+			self._local_stale = False
+		return self.local_table
+
+	def gmt_time_from_epoch(self, seconds, milliseconds=0):
+		seconds, milliseconds = divmod(int(seconds) * 1000 + int(milliseconds), 1000)
+		return fill_time_table(self.pool.acquire(None, copy=True), seconds, milliseconds)
+
+	def time_from_epoch(self, seconds, milliseconds=0):
+		seconds, milliseconds = divmod(int(seconds) * 1000 + int(milliseconds), 1000)
+		return fill_time_table(self.pool.acquire(None, copy=True), seconds + get_utc_offset(seconds), milliseconds)
+
+	def epoch_from_gmt_time(self, table):
+		seconds = epoch_from_fields(table.year, table.month, table.day, table.hour or 0, table.minute or 0, table.second or 0)
+		return seconds, int(table.millisecond or 0)
+
+	def epoch_from_time(self, table):
+		seconds = epoch_from_fields(table.year, table.month, table.day, table.hour or 0, table.minute or 0, table.second or 0)
+		return local_to_epoch(seconds), int(table.millisecond or 0)
@@ -0,0 +1,128 @@
+import numpy as np
+
+from collections import OrderedDict
+from math import ceil, floor
+
+from logger import get_logger
+
+LOGGER = get_logger("api.resample")
+
+RESAMPLE_LINEAR = 0
+RESAMPLE_SINC = 1
+
+# zero crossings of the sinc on each side at full bandwidth, and how finely the fractional phase is tabulated
+SINC_ZEROS = 8
+SINC_PHASES = 256
+
+# sound effects up to this long are kept around already converted
+RESAMPLE_CACHE_SIZE = 8 * 1024 * 1024
+RESAMPLE_CACHE_MAX_SECONDS = 5.0
+
+_sinc_tables = {}
+
+def sinc_table(half, cutoff):
+	# one row of tap weights per phase, windowed with a Blackman window and normalised to unity gain
+	key = (half, cutoff)
+	table = _sinc_tables.get(key)
+	if table is None:
+		offsets = np.arange(-half + 1, half + 1, dtype=np.float64)
+		phases = np.arange(SINC_PHASES + 1, dtype=np.float64)[:, None] / SINC_PHASES
+		x = offsets - phases
+		window = 0.42 + 0.5 * np.cos(np.pi * x / half) + 0.08 * np.cos(2 * np.pi * x / half)
+		weights = cutoff * np.sinc(cutoff * x) * np.where(np.abs(x) < half, window, 0)
+		table = (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+		_sinc_tables[key] = table
+	return table
+
+class PDResampler:
+	def __init__(self, src_rate, dst_rate, nchannels, mode=RESAMPLE_SINC):
+		self.step = src_rate / dst_rate
+		self.mode = mode
+
+		if mode == RESAMPLE_SINC:
+			# going down in rate, the filter has to cut off below the new Nyquist frequency, which takes more taps
+			cutoff = min(1.0, dst_rate / src_rate)
+			half = ceil(SINC_ZEROS / cutoff)
+			self.table = sinc_table(half, cutoff)
+			self.offsets = np.arange(-half + 1, half + 1)
+			self.left, self.right = half - 1, half
+		else:
+			self.left, self.right = 0, 1
+
+		# input frames still needed for the next block, and where the next output falls among them
+		self.history = np.zeros((self.left, nchannels), dtype=np.float32)
+		self.pos = float(self.left)
+
+	def _run(self, buf, end=None):
+		# every output whose taps are all inside buf, and before end if the real input stops there
+		last = len(buf) - 1 - self.right
+		n = max(ceil((last + 1 - self.pos) / self.step), 0)
+		if end is not None: n = min(n, max(ceil((end - self.pos) / self.step), 0))
+		positions = self.pos + self.step * np.arange(n)
+
+		index = np.floor(positions).astype(np.int64)
+		frac = positions - index
+		if self.mode == RESAMPLE_SINC:
+			weights = self.table[np.rint(frac * SINC_PHASES).astype(np.int64)]
+			frames = buf[index[:, None] + self.offsets]
+			out = np.einsum("nt,ntc->nc", weights, frames)
+		else:
+			frac = frac.astype(np.float32)[:, None]
+			out = buf[index] + (buf[index + 1] - buf[index]) * frac
+
+		self.pos += self.step * n
+		keep = min(max(floor(self.pos) - self.left, 0), len(buf))
+		self.history = buf[keep:]
+		self.pos -= keep
+		return out.astype(np.float32)
+
+	def process(self, block):
+		return self._run(np.concatenate((self.history, block.astype(np.float32))))
+
+	def flush(self):
+		# pads with silence so the filter can reach the last real frames, then stops right after them
+		end = len(self.history)
+		padding = np.zeros((self.right + ceil(self.step) + 1, self.history.shape[1]), dtype=np.float32)
+		return self._run(np.concatenate((self.history, padding)), end)
+
+def resample(samples, src_rate, dst_rate, mode=RESAMPLE_SINC):
+	if src_rate == dst_rate: return samples
+	resampler = PDResampler(src_rate, dst_rate, samples.shape[1], mode)
+	return np.concatenate((resampler.process(samples), resampler.flush()))
+
+class ResampleCache:
+	def __init__(self, max_bytes=RESAMPLE_CACHE_SIZE, max_seconds=RESAMPLE_CACHE_MAX_SECONDS):
+		self.max_bytes = max_bytes
+		self.max_seconds = max_seconds
+		self.entries = OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, dst_rate, mode, load):
+		# load() gives (samples, rate) and only runs on a miss
+		full_key = (key, dst_rate, mode)
+		samples = self.entries.get(full_key)
+		if samples is not None:
+			self.hits += 1
+			self.entries.move_to_end(full_key)
+			return samples
+
+		self.misses += 1
+		samples, rate = load()
+		samples = resample(samples, rate, dst_rate, mode)
+
+		# long sounds are converted every time rather than pushing everything else out
+		if len(samples) <= self.max_seconds * dst_rate and samples.nbytes <= self.max_bytes:
+			self.entries[full_key] = samples
+			self.size += samples.nbytes
+			while self.size > self.max_bytes:
+				old_key, evicted = self.entries.popitem(last=False)
+				self.size -= evicted.nbytes
+		return samples
+
+	def clear(self):
+		self.entries.clear()
+		self.size = 0
+
+RESAMPLE_CACHE = ResampleCache()
@@ -11,4 +11,50 @@ def print_func(self, *args):
 '''
 
 RUNTIME = LuaRuntime(unpack_returned_tuples=True)
-'''RUNTIME.set_global("print", self.print_func)'''
\ No newline at end of file
+'''RUNTIME.set_global("print", self.print_func)'''
+
+class LuaTablePool:
+	def __init__(self, runtime=RUNTIME):
+		self.runtime = runtime
+		self.tables = {}
+		self.keys = {}
+
+		# when set, every call hands out a fresh table that the game is free to keep or mutate
+		self.copy_mode = False
+		self.allocations = 0
+
+	def _new_table(self):
+		self.allocations += 1
+		return self.runtime.table()
+
+	def acquire(self, name, copy=None):
+		if copy is None: copy = self.copy_mode
+		if copy: return self._new_table()
+
+		table = self.tables.get(name)
+		if table is None:
+			table = self._new_table()
+			self.tables[name] = table
+			self.keys[name] = set()
+		return table
+
+	def fill(self, name, values, copy=None):
+		if copy is None: copy = self.copy_mode
+		table = self.acquire(name, copy)
+
+		for k, v in values.items(): table[k] = v
+
+		if not copy:
+			# drop fields that were set last time but aren't there now
+			old_keys = self.keys[name]
+			if old_keys != values.keys():
+				for k in old_keys - values.keys(): table[k] = None
+				self.keys[name] = set(values)
+
+		return table
+
+	def release(self, name):
+		self.tables.pop(name, None)
+		self.keys.pop(name, None)
+
+TABLE_POOL = LuaTablePool(RUNTIME)
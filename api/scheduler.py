@@ -0,0 +1,74 @@
+from heapq import heappop, heappush
+from itertools import count
+
+from logger import get_logger
+
+LOGGER = get_logger("api.scheduler")
+
+class ScheduledCallback:
+	__slots__ = ("callback", "args", "interval", "repeats", "cancelled")
+
+	def __init__(self, callback, args, interval, repeats):
+		self.callback = callback
+		self.args = args
+		self.interval = interval
+		self.repeats = repeats
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+
+class PDScheduler:
+	def __init__(self):
+		self.time = 0.0
+		self.frame = 0
+
+		# heaps of (due, sequence number, callback); cancelled entries are dropped when they come due
+		self._timers = []
+		self._frame_timers = []
+		self._seq = count()
+
+	def __len__(self):
+		return len(self._timers) + len(self._frame_timers)
+
+	def call_later(self, millis, callback, *args, repeats=False):
+		entry = ScheduledCallback(callback, args, max(float(millis), 0.0), repeats)
+		heappush(self._timers, (self.time + entry.interval, next(self._seq), entry))
+		return entry
+
+	def call_after_frames(self, frames, callback, *args, repeats=False):
+		entry = ScheduledCallback(callback, args, max(int(frames), 1), repeats)
+		heappush(self._frame_timers, (self.frame + entry.interval, next(self._seq), entry))
+		return entry
+
+	def next_due(self):
+		while self._timers and self._timers[0][2].cancelled: heappop(self._timers)
+		return self._timers[0][0] if self._timers else None
+
+	def _run_heap(self, heap, now):
+		repeating = []
+
+		while heap and heap[0][0] <= now:
+			due, seq, entry = heappop(heap)
+			if entry.cancelled: continue
+
+			# a timer made without a callback just runs out
+			if entry.callback is not None: entry.callback(*entry.args)
+			if entry.repeats and not entry.cancelled: repeating.append((due, entry))
+
+		for due, entry in repeating:
+			# repeating timers keep their phase unless they've fallen a whole interval behind
+			next_due = due + entry.interval
+			if next_due <= now: next_due = now + entry.interval
+			heappush(heap, (next_due, next(self._seq), entry))
+
+	def run(self, time):
+		self.time = float(time)
+		self.frame += 1
+
+		self._run_heap(self._timers, self.time)
+		self._run_heap(self._frame_timers, self.frame)
+
+	def clear(self):
+		self._timers.clear()
+		self._frame_timers.clear()
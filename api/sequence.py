@@ -0,0 +1,249 @@
+import numpy as np
+
+from math import ceil
+from threading import Lock
+
+from api.sound import AUDIO_SAMPLE_RATE
+from api.synth import frequency_to_note, note_to_frequency, parse_pitch
+from loaders.midi import MIDIFile
+from logger import get_logger
+
+LOGGER = get_logger("api.sequence")
+
+EVENT_NOTE_OFF = 0
+EVENT_NOTE_ON = 1
+
+# further away than any block, for a sequence with nothing coming up
+NO_EVENT = 1 << 62
+
+class PDSequenceTrack:
+	def __init__(self):
+		self.instrument = None
+		self.muted = False
+
+		# (step, length, note, velocity), and the events built from them, rebuilt after any change
+		self.notes = []
+		self.events = None
+		self.sequence = None
+
+	@classmethod
+	def from_midi(cls, midi_track):
+		track = cls()
+		track.notes = [(start, length, note, velocity) for start, length, note, velocity, channel in midi_track.notes]
+		return track
+
+	def _changed(self):
+		self.events = None
+		if self.sequence is not None: self.sequence.index = None
+
+	def add_note(self, step, note, length, velocity=1.0):
+		if isinstance(note, str): note = round(frequency_to_note(parse_pitch(note)))
+		self.notes.append((step, length, note, velocity))
+		self._changed()
+
+	def remove_note(self, step, note):
+		self.notes = [entry for entry in self.notes if entry[0] != step or entry[2] != note]
+		self._changed()
+
+	def clear_notes(self):
+		self.notes = []
+		self._changed()
+
+	def get_notes(self, step=None, end_step=None):
+		if step is None: return list(self.notes)
+		if end_step is None: end_step = step
+		return [entry for entry in self.notes if step <= entry[0] <= end_step]
+
+	def get_length(self):
+		return max((step + length for step, length, note, velocity in self.notes), default=0)
+
+	def set_instrument(self, instrument):
+		if self.instrument is not None: self.instrument.all_notes_off()
+		self.instrument = instrument
+
+	def set_muted(self, muted):
+		self.muted = muted
+		if muted and self.instrument is not None: self.instrument.all_notes_off()
+
+	def get_events(self):
+		# every note as an on and an off, which the sequence merges with its other tracks
+		if self.events is None:
+			notes = np.array(self.notes, dtype=np.float64).reshape(-1, 4)
+			steps = np.concatenate((notes[:, 0], notes[:, 0] + notes[:, 1]))
+			kinds = np.repeat(np.array([EVENT_NOTE_ON, EVENT_NOTE_OFF], dtype=np.int8), len(notes))
+			self.events = (steps, kinds, np.tile(notes[:, 2], 2), np.tile(notes[:, 3], 2))
+		return self.events
+
+class PDSequence:
+	def __init__(self, mixer=None):
+		self.mixer = mixer
+		self.sample_rate = mixer.sample_rate if mixer is not None else AUDIO_SAMPLE_RATE
+		self.tracks = []
+		self.tempo = 4.0
+		self.lock = Lock()
+
+		# a loop_count of 0 loops until stopped, and a loop_end of None doesn't loop at all
+		self.loop_start = 0
+		self.loop_end = None
+		self.loop_count = 0
+		self.loops_left = 0
+
+		# the step the clock was last set to and how many frames have played since
+		self.start_step = 0.0
+		self.frame = 0
+		self.index = None
+		self.event_steps = []
+		self.length = 0
+		self.next_event = 0
+
+		self.playing = False
+		self.finished = False
+		self.finish_callback = None
+
+	@classmethod
+	def from_file(cls, path, mixer=None):
+		if not path.endswith(MIDIFile.PD_FILE_EXT): path += MIDIFile.PD_FILE_EXT
+		return cls.from_midi(MIDIFile(path), mixer)
+
+	@classmethod
+	def from_midi(cls, midi_file, mixer=None):
+		sequence = cls(mixer)
+		for midi_track in midi_file.tracks: sequence.add_track(PDSequenceTrack.from_midi(midi_track))
+		sequence.tempo = midi_file.get_steps_per_second()
+		return sequence
+
+	def add_track(self, track=None):
+		if track is None: track = PDSequenceTrack()
+		track.sequence = self
+		self.tracks.append(track)
+		self.index = None
+		return track
+
+	def set_track_at_index(self, index, track):
+		# 1-based like the Lua API
+		while len(self.tracks) < index: self.add_track()
+		track.sequence = self
+		self.tracks[index - 1] = track
+		self.index = None
+
+	def get_track_at_index(self, index):
+		return self.tracks[index - 1] if 1 <= index <= len(self.tracks) else None
+
+	def get_track_count(self):
+		return len(self.tracks)
+
+	def get_length(self):
+		return max((track.get_length() for track in self.tracks), default=0)
+
+	def _build_index(self):
+		# all tracks' events in one list, in step order with note offs first so a note can be struck again on the same step
+		parts = [track.get_events() for track in self.tracks]
+		steps = np.concatenate([part[0] for part in parts] + [np.zeros(0)])
+		kinds = np.concatenate([part[1] for part in parts] + [np.zeros(0, dtype=np.int8)])
+		notes = np.concatenate([part[2] for part in parts] + [np.zeros(0)])
+		velocities = np.concatenate([part[3] for part in parts] + [np.zeros(0)])
+		track_ids = np.concatenate([np.full(len(part[0]), i) for i, part in enumerate(parts)] + [np.zeros(0, dtype=np.int64)])
+
+		order = np.lexsort((kinds, steps))
+		self.index = (steps[order], kinds[order].tolist(), notes[order].astype(np.int64).tolist(), velocities[order].tolist(), track_ids[order].astype(np.int64).tolist())
+		self.event_steps = self.index[0].tolist()
+		self.length = max(self.event_steps, default=0)
+		self.next_event = int(np.searchsorted(self.index[0], self.get_current_step() - 1e-9))
+
+	def _frame_of(self, step):
+		# the first whole frame at or after the step, counted from the last time the clock was set
+		return ceil((step - self.start_step) * self.sample_rate / self.tempo - 1e-9)
+
+	def get_current_step(self):
+		return self.start_step + self.frame * self.tempo / self.sample_rate
+
+	def _set_clock(self, step):
+		self.start_step = float(step)
+		self.frame = 0
+
+	def _looping(self):
+		return self.loop_end is not None and self.loop_end > self.loop_start and (self.loop_count == 0 or self.loops_left > 0)
+
+	def _release_all(self):
+		for track in self.tracks:
+			if track.instrument is not None: track.instrument.all_notes_off()
+
+	def set_tempo(self, steps_per_second):
+		with self.lock:
+			self._set_clock(self.get_current_step())
+			self.tempo = steps_per_second
+
+	def get_tempo(self):
+		return self.tempo
+
+	def set_loops(self, start_step, end_step=None, loop_count=0):
+		# the Lua API also takes just a loop count, looping the whole sequence
+		if end_step is None: start_step, end_step, loop_count = 0, self.get_length(), start_step
+		self.loop_start, self.loop_end = start_step, end_step
+		self.loop_count = self.loops_left = loop_count
+
+	def go_to_step(self, step, play=False):
+		with self.lock:
+			self._release_all()
+			self._set_clock(step)
+			self.index = None
+		if play: self.play()
+
+	def play(self, finish_callback=None):
+		if finish_callback is not None: self.finish_callback = finish_callback
+		with self.lock:
+			if self.get_current_step() >= self.get_length(): self._set_clock(0)
+			self.loops_left = self.loop_count
+			self.finished = False
+			self.playing = True
+		if self.mixer is not None: self.mixer.add_sequence(self)
+
+	def stop(self):
+		with self.lock:
+			self.playing = False
+			self._release_all()
+		if self.mixer is not None: self.mixer.remove_sequence(self)
+
+	def is_playing(self):
+		return self.playing
+
+	def frames_to_next_event(self):
+		# how far the mixer can render before this sequence needs to do something
+		if not self.playing: return NO_EVENT
+		with self.lock:
+			if self.index is None: self._build_index()
+			frames = NO_EVENT
+			if self.next_event < len(self.event_steps): frames = self._frame_of(self.event_steps[self.next_event]) - self.frame
+			frames = min(frames, self._frame_of(self.loop_end if self._looping() else self.length) - self.frame)
+			return max(frames, 1)
+
+	def run_events(self):
+		# on the audio thread, between two parts of a block, so every event lands on its exact frame
+		if not self.playing: return
+		with self.lock:
+			if self.index is None: self._build_index()
+			steps, kinds, notes, velocities, track_ids = self.index
+			while True:
+				while self.next_event < len(self.event_steps) and self._frame_of(self.event_steps[self.next_event]) <= self.frame:
+					i = self.next_event
+					self.next_event += 1
+
+					track = self.tracks[track_ids[i]]
+					if self._looping() and self.event_steps[i] >= self.loop_end: continue
+					if track.muted or track.instrument is None: continue
+					if kinds[i] == EVENT_NOTE_ON: track.instrument.play_note(note_to_frequency(notes[i]), velocities[i])
+					else: track.instrument.note_off(note_to_frequency(notes[i]))
+
+				# after jumping back, the events on the loop's first step are due right away too
+				if self._looping() and self._frame_of(self.loop_end) <= self.frame:
+					self._release_all()
+					if self.loop_count > 0: self.loops_left -= 1
+					self._set_clock(self.loop_start)
+					self.next_event = int(np.searchsorted(steps, self.loop_start - 1e-9))
+					continue
+				if not self._looping() and self.next_event >= len(self.event_steps) and self._frame_of(self.length) <= self.frame:
+					self.playing, self.finished = False, True
+				break
+
+	def advance(self, nframes):
+		if self.playing: self.frame += nframes
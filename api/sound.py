@@ -0,0 +1,401 @@
+import numpy as np
+
+from threading import Lock
+from time import perf_counter
+
+from api.resample import RESAMPLE_CACHE, RESAMPLE_SINC, PDResampler, resample
+from loaders.pda import PDAudioFile
+from logger import get_logger
+
+LOGGER = get_logger("api.sound")
+
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_BLOCK_SIZE = 512
+
+# how much of a file player's audio is decoded ahead of the mixer
+FILEPLAYER_BUFFER_SECONDS = 0.25
+
+def pcm_to_float(data, sampwidth, nchannels):
+	# 8-bit PCM is unsigned like in a WAV file, 16-bit is signed little endian
+	if sampwidth == 1: samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 0x80) / 0x80
+	else: samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 0x8000
+	return samples[:len(samples) // nchannels * nchannels].reshape(-1, nchannels)
+
+def load_samples(audio_file):
+	return pcm_to_float(b"".join(audio_file.iter_pcm()), audio_file.sampwidth, audio_file.nchannels)
+
+def open_audio_file(path):
+	if not path.endswith(PDAudioFile.PD_FILE_EXT): path += PDAudioFile.PD_FILE_EXT
+	return PDAudioFile(path)
+
+def interpolate(data, positions):
+	# linear interpolation between the frames on either side, data needs one frame past the last position
+	index = np.floor(positions).astype(np.int64)
+	frac = (positions - index).astype(np.float32)[:, None]
+	first = data[index]
+	return first + (data[index + 1] - first) * frac
+
+class RingBuffer:
+	def __init__(self, capacity, nchannels):
+		self.capacity = capacity
+		self.data = np.zeros((capacity, nchannels), dtype=np.float32)
+
+		# both count frames since the start, the buffer index is just these modulo the capacity
+		self.read_pos = 0
+		self.write_pos = 0
+
+	def available(self):
+		return self.write_pos - self.read_pos
+
+	def space(self):
+		return self.capacity - self.available()
+
+	def write(self, frames):
+		n = min(len(frames), self.space())
+		start = self.write_pos % self.capacity
+		first = min(n, self.capacity - start)
+		self.data[start:start + first] = frames[:first]
+		self.data[:n - first] = frames[first:n]
+		self.write_pos += n
+		return n
+
+	def peek(self, index):
+		# index is an array of absolute frame numbers that have to be between read_pos and write_pos
+		return self.data[index % self.capacity]
+
+	def clear(self):
+		self.read_pos = self.write_pos = 0
+
+class SoundSource:
+	def __init__(self, sample_rate):
+		self.sample_rate = sample_rate
+		self.volume = (1.0, 1.0)
+		self.rate = 1.0
+		self.playing = False
+		self.repeat = 1
+
+		# set on the audio thread, the callback itself is run from the main thread by PDMixer.pump()
+		self.finished = False
+		self.finish_callback = None
+		self.mixer = None
+
+	def set_volume(self, left, right=None):
+		if right is None: right = left
+		self.volume = (min(max(left, 0.0), 1.0), min(max(right, 0.0), 1.0))
+
+	def get_volume(self):
+		return self.volume
+
+	def set_rate(self, rate):
+		self.rate = rate
+
+	def get_rate(self):
+		return self.rate
+
+	def is_playing(self):
+		return self.playing
+
+	def play(self, repeat=1, rate=None):
+		# repeat 0 loops until stopped
+		if rate is not None: self.rate = rate
+		self.repeat = repeat
+		self.finished = False
+		self.playing = True
+		if self.mixer is not None: self.mixer.add(self)
+
+	def stop(self):
+		self.playing = False
+		if self.mixer is not None: self.mixer.remove(self)
+
+	def render(self, nframes, out_rate):
+		return None
+
+class PDSamplePlayer(SoundSource):
+	def __init__(self, samples, sample_rate, mixer=None):
+		# converted to the output rate up front, so playing at rate 1 is a straight copy
+		if mixer is not None and sample_rate != mixer.sample_rate:
+			samples = resample(samples, sample_rate, mixer.sample_rate, mixer.resample_mode)
+			sample_rate = mixer.sample_rate
+
+		super().__init__(sample_rate)
+		self.mixer = mixer
+
+		# a copy of the first frame goes on the end so interpolating past the last one stays in bounds
+		self.samples = np.concatenate((samples, samples[:1] if len(samples) else np.zeros((1, samples.shape[1]), dtype=np.float32)))
+		self.length = len(samples)
+		self.position = 0.0
+
+	@classmethod
+	def from_file(cls, path, mixer=None):
+		# the same key the asset manager uses for this file
+		if not path.endswith(PDAudioFile.PD_FILE_EXT): path += PDAudioFile.PD_FILE_EXT
+
+		def load():
+			audio_file = open_audio_file(path)
+			return load_samples(audio_file), audio_file.framerate
+
+		if mixer is None: return cls(*load())
+		return cls(RESAMPLE_CACHE.get(path, mixer.sample_rate, mixer.resample_mode, load), mixer.sample_rate, mixer)
+
+	def get_length(self):
+		return self.length / self.sample_rate
+
+	def set_offset(self, seconds):
+		self.position = min(max(seconds * self.sample_rate, 0.0), self.length)
+
+	def get_offset(self):
+		return (self.position % self.length) / self.sample_rate if self.length else 0.0
+
+	def play(self, repeat=1, rate=None):
+		self.position = 0.0
+		super().play(repeat, rate)
+
+	def render(self, nframes, out_rate):
+		if self.length == 0:
+			self.playing, self.finished = False, True
+			return None
+
+		step = self.rate * self.sample_rate / out_rate
+		positions = self.position + step * np.arange(nframes)
+		self.position += step * nframes
+
+		end = self.length * self.repeat
+		if self.repeat == 0 or positions[0] >= 0 and positions[-1] < end: block = interpolate(self.samples, positions % self.length)
+		else:
+			# the last repeat runs out partway through the block
+			inside = (positions >= 0) & (positions < end)
+			block = np.zeros((nframes, self.samples.shape[1]), dtype=np.float32)
+			block[inside] = interpolate(self.samples, positions[inside] % self.length)
+			self.playing, self.finished = False, True
+		return block
+
+class PDFilePlayer(SoundSource):
+	def __init__(self, audio_file, mixer=None, buffer_seconds=FILEPLAYER_BUFFER_SECONDS):
+		# the ring buffer holds audio that's already at the output rate
+		super().__init__(mixer.sample_rate if mixer is not None else audio_file.framerate)
+		self.mixer = mixer
+		self.audio_file = audio_file
+		self.source_rate = audio_file.framerate
+		self.resample_mode = mixer.resample_mode if mixer is not None else RESAMPLE_SINC
+		self.resampler = None
+		self.nchannels = audio_file.nchannels
+		self.sampwidth = audio_file.sampwidth
+
+		self.buffer = RingBuffer(max(int(buffer_seconds * self.sample_rate), AUDIO_BLOCK_SIZE * 2), self.nchannels)
+		self.position = 0.0
+		self.pcm = None
+		self.pass_frames = 0
+		self.pending = None
+		self.loops_left = 0
+		self.end_pos = None
+		self.underruns = 0
+
+	@classmethod
+	def from_file(cls, path, mixer=None, buffer_seconds=FILEPLAYER_BUFFER_SECONDS):
+		return cls(open_audio_file(path), mixer, buffer_seconds)
+
+	def set_buffer_size(self, seconds):
+		self.buffer = RingBuffer(max(int(seconds * self.sample_rate), AUDIO_BLOCK_SIZE * 2), self.nchannels)
+		self.rewind()
+
+	def rewind(self):
+		if self.source_rate != self.sample_rate: self.resampler = PDResampler(self.source_rate, self.sample_rate, self.nchannels, self.resample_mode)
+		self.buffer.clear()
+		self.position = 0.0
+		self.pcm = None
+		self.pending = None
+		self.end_pos = None
+
+	def play(self, repeat=1, rate=None):
+		self.rewind()
+		self.loops_left = repeat - 1
+		self.fill()
+		super().play(repeat, rate)
+
+	def pause(self):
+		self.playing = False
+		if self.mixer is not None: self.mixer.remove(self)
+
+	def get_offset(self):
+		return self.position / self.sample_rate
+
+	def fill(self):
+		# runs on the main thread, so the audio thread only ever copies frames that are already decoded
+		while self.end_pos is None and self.buffer.space() > 0:
+			if self.pending is None or len(self.pending) == 0:
+				if self.pcm is None: self.pcm, self.pass_frames = self.audio_file.iter_pcm(), 0
+				data = next(self.pcm, None)
+				if data is None:
+					self.pcm = None
+					# a file with nothing in it would loop forever without ever filling the buffer
+					if self.loops_left != 0 and self.pass_frames > 0:
+						self.loops_left -= 1
+						continue
+
+					# whatever the resampler was holding on to, then one silent frame for the interpolation to land on
+					tail = self.resampler.flush() if self.resampler is not None else np.zeros((0, self.nchannels), dtype=np.float32)
+					self.end_pos = self.buffer.write_pos + len(tail)
+					self.pending = np.concatenate((tail, np.zeros((1, self.nchannels), dtype=np.float32)))
+				else:
+					self.pending = pcm_to_float(data, self.sampwidth, self.nchannels)
+					self.pass_frames += len(self.pending)
+					if self.resampler is not None: self.pending = self.resampler.process(self.pending)
+			self.pending = self.pending[self.buffer.write(self.pending):]
+
+		if self.end_pos is not None and self.pending is not None and len(self.pending):
+			self.pending = self.pending[self.buffer.write(self.pending):]
+
+	def render(self, nframes, out_rate):
+		buffer = self.buffer
+		step = self.rate * self.sample_rate / out_rate
+		positions = self.position + step * np.arange(nframes)
+
+		# frames past what's been decoded are silence: the end of the file, or the decoder falling behind
+		count = int(np.count_nonzero(positions < buffer.write_pos - 1))
+		block = np.zeros((nframes, self.nchannels), dtype=np.float32)
+		if count:
+			index = np.floor(positions[:count]).astype(np.int64)
+			frac = (positions[:count] - index).astype(np.float32)[:, None]
+			first = buffer.peek(index)
+			block[:count] = first + (buffer.peek(index + 1) - first) * frac
+
+		if count < nframes:
+			if self.end_pos is not None and buffer.write_pos > self.end_pos:
+				self.playing, self.finished = False, True
+			else:
+				self.underruns += 1
+				if self.mixer is not None: self.mixer.underruns += 1
+		self.position = float(positions[count - 1] + step) if count else self.position
+		buffer.read_pos = min(int(self.position), buffer.write_pos)
+		return block
+
+class PDMixer:
+	def __init__(self, sample_rate=AUDIO_SAMPLE_RATE, block_size=AUDIO_BLOCK_SIZE, resample_mode=RESAMPLE_SINC):
+		self.sample_rate = sample_rate
+		self.block_size = block_size
+		self.resample_mode = resample_mode
+		self.sources = []
+		self.sequences = []
+		self.lock = Lock()
+		self.device = None
+
+		self.frames_mixed = 0
+		self.mix_time = 0.0
+		self.last_mix_time = 0.0
+		self.max_mix_time = 0.0
+		self.underruns = 0
+
+	def open(self):
+		# SDL's callback device pulls blocks straight from the mixer, pygame.mixer would add its own buffering on top
+		try:
+			import pygame as pg
+			from pygame._sdl2 import audio as sdl_audio, sdl2
+
+			pg.mixer.quit()
+			sdl2.init_subsystem(sdl2.INIT_AUDIO)
+			names = sdl_audio.get_audio_device_names(False)
+			if not names: raise RuntimeError("no output devices")
+			self.device = sdl_audio.AudioDevice(
+				devicename=names[0], iscapture=False, frequency=self.sample_rate, audioformat=sdl_audio.AUDIO_S16,
+				numchannels=2, chunksize=self.block_size, allowed_changes=0, callback=self._callback
+			)
+			self.device.pause(0)
+		except Exception as e:
+			LOGGER.warning(f"Couldn't open an audio device, sound is muted: {e}")
+			self.device = None
+
+	def close(self):
+		if self.device is not None:
+			self.device.close()
+			self.device = None
+
+	def add(self, source):
+		source.mixer = self
+		with self.lock:
+			if source not in self.sources: self.sources.append(source)
+
+	def remove(self, source):
+		with self.lock:
+			if source in self.sources: self.sources.remove(source)
+
+	def add_sequence(self, sequence):
+		sequence.mixer = self
+		with self.lock:
+			if sequence not in self.sequences: self.sequences.append(sequence)
+
+	def remove_sequence(self, sequence):
+		with self.lock:
+			if sequence in self.sequences: self.sequences.remove(sequence)
+
+	def stop_all(self):
+		with self.lock:
+			for source in self.sources: source.playing = False
+			self.sources.clear()
+			for sequence in self.sequences: sequence.playing = False
+			self.sequences.clear()
+
+	def get_current_time(self):
+		return self.frames_mixed / self.sample_rate
+
+	def mix(self, nframes):
+		start = perf_counter()
+		out = np.zeros((nframes, 2), dtype=np.float32)
+		with self.lock: sequences = list(self.sequences)
+
+		# the block is split wherever a sequence has an event, so notes start on their exact frame
+		pos = 0
+		while pos < nframes:
+			end = nframes
+			for sequence in sequences:
+				sequence.run_events()
+				end = min(end, pos + sequence.frames_to_next_event())
+
+			# events can start new sources, so the list is only taken once they've run
+			with self.lock: sources = list(self.sources)
+			for source in sources:
+				if not source.playing: continue
+				block = source.render(end - pos, self.sample_rate)
+				if block is None: continue
+
+				# mono goes to both sides, then each side gets its own volume
+				out[pos:end] += block * np.array(source.volume, dtype=np.float32)
+
+			for sequence in sequences: sequence.advance(end - pos)
+			self.frames_mixed += end - pos
+			pos = end
+
+		samples = np.clip(out * 0x8000, -0x8000, 0x7fff).astype("<i2")
+
+		elapsed = perf_counter() - start
+		self.mix_time += elapsed
+		self.last_mix_time = elapsed
+		self.max_mix_time = max(self.max_mix_time, elapsed)
+		if elapsed > nframes / self.sample_rate:
+			self.underruns += 1
+			LOGGER.debug(f"Mixing {nframes} frames took {elapsed * 1000:.2f} ms, longer than they play for")
+		return samples
+
+	def _callback(self, device, stream):
+		stream[:] = self.mix(len(stream) // 4).tobytes()
+
+	def pump(self):
+		# main thread, once a frame: top up the file players and run finish callbacks outside the audio thread
+		with self.lock: sources = list(self.sources)
+		for source in sources:
+			if isinstance(source, PDFilePlayer) and source.playing: source.fill()
+			if source.finished:
+				source.finished = False
+				self.remove(source)
+				if source.finish_callback is not None: source.finish_callback(source)
+
+		with self.lock: sequences = list(self.sequences)
+		for sequence in sequences:
+			if sequence.finished:
+				sequence.finished = False
+				self.remove_sequence(sequence)
+				if sequence.finish_callback is not None: sequence.finish_callback(sequence)
+
+	def take_audio_time(self):
+		elapsed = self.mix_time
+		self.mix_time = 0.0
+		return elapsed
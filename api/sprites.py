@@ -0,0 +1,513 @@
+import numpy as np
+
+from math import floor
+
+from api.blitter import DRAWMODE_COPY
+from api.graphics import LCD_WIDTH, LCD_HEIGHT
+from api.transform import FLIP_NONE
+from logger import get_logger
+
+LOGGER = get_logger("api.sprites")
+
+COLLISION_SLIDE = 0
+COLLISION_FREEZE = 1
+COLLISION_OVERLAP = 2
+COLLISION_BOUNCE = 3
+
+SPRITE_CELL_SIZE = 32
+
+# the screen is redrawn in tiles this big, and only the ones something touched since last frame
+DIRTY_TILE_SIZE = 32
+DIRTY_TILES_X = -(-LCD_WIDTH // DIRTY_TILE_SIZE)
+DIRTY_TILES_Y = -(-LCD_HEIGHT // DIRTY_TILE_SIZE)
+
+# slack for floating point error when rects only touch
+COLLISION_DELTA = 1e-10
+
+def rects_overlap(a, b):
+	ax, ay, aw, ah = a
+	bx, by, bw, bh = b
+	return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+def _nearest(x, a, b):
+	return a if abs(a - x) < abs(b - x) else b
+
+def _segment_intersection(x, y, w, h, x1, y1, x2, y2, ti1, ti2):
+	# Liang-Barsky clipping of the segment against the rect, giving the entry and exit times with their normals
+	dx, dy = x2 - x1, y2 - y1
+	nx1 = ny1 = nx2 = ny2 = 0
+	for nx, ny, p, q in ((-1, 0, -dx, x1 - x), (1, 0, dx, x + w - x1), (0, -1, -dy, y1 - y), (0, 1, dy, y + h - y1)):
+		if p == 0:
+			if q <= 0: return None
+			continue
+		r = q / p
+		if p < 0:
+			if r > ti2: return None
+			if r > ti1: ti1, nx1, ny1 = r, nx, ny
+		else:
+			if r < ti1: return None
+			if r < ti2: ti2, nx2, ny2 = r, nx, ny
+	return ti1, ti2, nx1, ny1, nx2, ny2
+
+class SpriteCollision:
+	def __init__(self, sprite, other, collision_type, overlaps, ti, move, normal, touch, sprite_rect, other_rect):
+		self.sprite = sprite
+		self.other = other
+		self.type = collision_type
+		self.overlaps = overlaps
+		self.ti = ti
+		self.move = move
+		self.normal = normal
+		self.touch = touch
+		self.sprite_rect = sprite_rect
+		self.other_rect = other_rect
+
+def detect_collision(rect, other_rect, goal_x, goal_y):
+	# a swept AABB test of rect moving to the goal against a still other_rect, in the same form as bump.lua
+	x1, y1, w1, h1 = rect
+	x2, y2, w2, h2 = other_rect
+	dx, dy = goal_x - x1, goal_y - y1
+
+	# the Minkowski difference, which holds the origin when the rects already overlap
+	x, y, w, h = x2 - x1 - w1, y2 - y1 - h1, w1 + w2, h1 + h2
+	ti = None
+	nx = ny = 0
+	if -x > COLLISION_DELTA and -y > COLLISION_DELTA and x + w > COLLISION_DELTA and y + h > COLLISION_DELTA:
+		px, py = _nearest(0, x, x + w), _nearest(0, y, y + h)
+		ti = -min(w1, abs(px)) * min(h1, abs(py))
+		overlaps = True
+	else:
+		hit = _segment_intersection(x, y, w, h, 0, 0, dx, dy, -float("inf"), float("inf"))
+		if hit is not None:
+			ti1, ti2, nx1, ny1 = hit[:4]
+			if ti1 < 1 and abs(ti1 - ti2) >= COLLISION_DELTA and (0 < ti1 + COLLISION_DELTA or ti1 == 0 and ti2 > 0):
+				ti, nx, ny = ti1, nx1, ny1
+		overlaps = False
+	if ti is None: return None
+
+	if not overlaps: tx, ty = x1 + dx * ti, y1 + dy * ti
+	elif dx == 0 and dy == 0:
+		# push out along whichever axis is closer
+		px, py = _nearest(0, x, x + w), _nearest(0, y, y + h)
+		if abs(px) < abs(py): py = 0
+		else: px = 0
+		nx, ny = (px > 0) - (px < 0), (py > 0) - (py < 0)
+		tx, ty = x1 + px, y1 + py
+	else:
+		hit = _segment_intersection(x, y, w, h, 0, 0, dx, dy, -float("inf"), 1)
+		if hit is None: return None
+		ti1, ti2, nx, ny = hit[:4]
+		tx, ty = x1 + dx * ti1, y1 + dy * ti1
+
+	return overlaps, ti, (dx, dy), (nx, ny), (tx, ty)
+
+class SpatialHash:
+	def __init__(self, cell_size=SPRITE_CELL_SIZE):
+		self.cell_size = cell_size
+		self.cells = {}
+		self.ranges = {}
+		self.rects = {}
+
+	def _cell_range(self, rect):
+		x, y, w, h = rect
+		cs = self.cell_size
+		return floor(x / cs), floor(y / cs), floor((x + w) / cs), floor((y + h) / cs)
+
+	def update(self, item, rect):
+		# only touches the cells it's entering or leaving, which for small moves is none at all
+		self.rects[item] = rect
+		new = self._cell_range(rect)
+		old = self.ranges.get(item)
+		if old == new: return
+		if old is not None: self._unlink(item, old)
+
+		cx0, cy0, cx1, cy1 = new
+		for cy in range(cy0, cy1 + 1):
+			for cx in range(cx0, cx1 + 1):
+				cell = self.cells.get((cx, cy))
+				if cell is None:
+					cell = {}
+					self.cells[(cx, cy)] = cell
+				cell[item] = None
+		self.ranges[item] = new
+
+	def _unlink(self, item, cell_range):
+		cx0, cy0, cx1, cy1 = cell_range
+		for cy in range(cy0, cy1 + 1):
+			for cx in range(cx0, cx1 + 1):
+				cell = self.cells[(cx, cy)]
+				del cell[item]
+				if not cell: del self.cells[(cx, cy)]
+
+	def remove(self, item):
+		cell_range = self.ranges.pop(item, None)
+		if cell_range is not None: self._unlink(item, cell_range)
+		self.rects.pop(item, None)
+
+	def query(self, rect):
+		# dicts are used as ordered sets, so results come out the same every run
+		cx0, cy0, cx1, cy1 = self._cell_range(rect)
+		found = {}
+		for cy in range(cy0, cy1 + 1):
+			for cx in range(cx0, cx1 + 1):
+				cell = self.cells.get((cx, cy))
+				if cell: found.update(cell)
+		return found
+
+	def clear(self):
+		self.cells.clear()
+		self.ranges.clear()
+		self.rects.clear()
+
+class PDSprite:
+	def __init__(self, image=None):
+		self.manager = None
+		self.image = image
+		self.x = 0.0
+		self.y = 0.0
+		self.width = image.stored_width if image is not None else 0
+		self.height = image.stored_height if image is not None else 0
+		self.center_x = 0.5
+		self.center_y = 0.5
+		self.z_index = 0
+		self.order = 0
+		self.visible = True
+		self.flip = FLIP_NONE
+		self.draw_mode = DRAWMODE_COPY
+
+		# collide_rect is relative to the sprite's bounds, and a sprite without one never collides
+		self.collide_rect = None
+		self.collisions_enabled = True
+		self.groups = 0
+		self.collides_with_groups = 0
+		self.tag = 0
+
+		# optional callables, which get the sprite first so Lua functions can be used as methods:
+		# update(sprite), draw(sprite, x, y, width, height) and collision_response(sprite, other)
+		self.update = None
+		self.draw = None
+		self.collision_response = COLLISION_SLIDE
+
+	def get_bounds(self):
+		return self.x - self.width * self.center_x, self.y - self.height * self.center_y, self.width, self.height
+
+	def get_collide_bounds(self):
+		if self.collide_rect is None: return None
+		bx, by = self.x - self.width * self.center_x, self.y - self.height * self.center_y
+		x, y, w, h = self.collide_rect
+		return bx + x, by + y, w, h
+
+	def get_collision_response(self, other):
+		if callable(self.collision_response): return self.collision_response(self, other)
+		return self.collision_response
+
+	def _changed(self, old_bounds):
+		if self.manager is not None: self.manager.sprite_changed(self, old_bounds)
+
+	def remove(self):
+		if self.manager is not None: self.manager.remove(self)
+
+	def move_to(self, x, y):
+		old_bounds = self.get_bounds()
+		self.x, self.y = x, y
+		self._changed(old_bounds)
+
+	def move_by(self, dx, dy):
+		self.move_to(self.x + dx, self.y + dy)
+
+	def set_image(self, image, flip=FLIP_NONE):
+		old_bounds = self.get_bounds()
+		self.image = image
+		self.flip = flip
+		if image is not None: self.width, self.height = image.stored_width, image.stored_height
+		self._changed(old_bounds)
+
+	def set_size(self, width, height):
+		old_bounds = self.get_bounds()
+		self.width, self.height = width, height
+		self._changed(old_bounds)
+
+	def set_center(self, x, y):
+		old_bounds = self.get_bounds()
+		self.center_x, self.center_y = x, y
+		self._changed(old_bounds)
+
+	def set_collide_rect(self, x, y, width, height):
+		self.collide_rect = (x, y, width, height)
+		if self.manager is not None: self.manager.update_collisions(self)
+
+	def clear_collide_rect(self):
+		self.collide_rect = None
+		if self.manager is not None: self.manager.update_collisions(self)
+
+	def set_z_index(self, z_index):
+		if z_index == self.z_index: return
+		self.z_index = z_index
+		if self.manager is not None:
+			self.manager.needs_sort = True
+			self.manager.mark_dirty(self.get_bounds())
+
+	def set_visible(self, flag):
+		self.visible = bool(flag)
+		if self.manager is not None: self.manager.mark_dirty(self.get_bounds())
+
+	def mark_dirty(self):
+		if self.manager is not None: self.manager.mark_dirty(self.get_bounds())
+
+	def move_with_collisions(self, goal_x, goal_y):
+		if self.manager is None: return goal_x, goal_y, []
+		return self.manager.move_with_collisions(self, goal_x, goal_y)
+
+	def check_collisions(self, goal_x, goal_y):
+		if self.manager is None: return goal_x, goal_y, []
+		return self.manager.check_collisions(self, goal_x, goal_y)
+
+	def overlapping_sprites(self):
+		if self.manager is None: return []
+		return self.manager.overlapping_sprites(self)
+
+class PDSpriteManager:
+	def __init__(self, graphics=None):
+		self.graphics = graphics
+		self.sprites = []
+		self.needs_sort = False
+		self.next_order = 0
+
+		# one hash for collide rects and one for what's drawn, since the two are often different sizes
+		self.collisions = SpatialHash()
+		self.bounds = SpatialHash()
+
+		self.dirty = np.ones((DIRTY_TILES_Y, DIRTY_TILES_X), dtype=bool)
+		self.draw_offset = None
+
+		# optional callable(x, y, width, height) that paints behind the sprites, otherwise it's the background color
+		self.background = None
+
+	def add(self, sprite):
+		if sprite.manager is self: return
+		if sprite.manager is not None: sprite.manager.remove(sprite)
+		sprite.manager = self
+		sprite.order = self.next_order
+		self.next_order += 1
+		self.sprites.append(sprite)
+		self.needs_sort = True
+		self.bounds.update(sprite, sprite.get_bounds())
+		self.update_collisions(sprite)
+		self.mark_dirty(sprite.get_bounds())
+
+	def remove(self, sprite):
+		if sprite.manager is not self: return
+		self.sprites.remove(sprite)
+		self.bounds.remove(sprite)
+		self.collisions.remove(sprite)
+		self.mark_dirty(sprite.get_bounds())
+		sprite.manager = None
+
+	def remove_all(self):
+		for sprite in self.sprites: sprite.manager = None
+		self.sprites.clear()
+		self.bounds.clear()
+		self.collisions.clear()
+		self.dirty[:] = True
+
+	def sprite_changed(self, sprite, old_bounds):
+		bounds = sprite.get_bounds()
+		self.bounds.update(sprite, bounds)
+		self.update_collisions(sprite)
+		self.mark_dirty(old_bounds)
+		self.mark_dirty(bounds)
+
+	def update_collisions(self, sprite):
+		rect = sprite.get_collide_bounds()
+		if rect is None: self.collisions.remove(sprite)
+		else: self.collisions.update(sprite, rect)
+
+	def mark_dirty(self, rect):
+		if self.draw_offset is None: return
+		x, y, w, h = rect
+		ox, oy = self.draw_offset
+		tx0, ty0 = max(floor(x + ox) // DIRTY_TILE_SIZE, 0), max(floor(y + oy) // DIRTY_TILE_SIZE, 0)
+		tx1, ty1 = floor(x + ox + w) // DIRTY_TILE_SIZE + 1, floor(y + oy + h) // DIRTY_TILE_SIZE + 1
+		# fully left of or above the screen, where a negative end would slice from the other side
+		if tx1 <= 0 or ty1 <= 0: return
+		self.dirty[ty0:ty1, tx0:tx1] = True
+
+	def get_draw_list(self):
+		# only re-sorted after a z change or an add, ties go to whichever sprite was added first
+		if self.needs_sort:
+			self.sprites.sort(key=lambda sprite: (sprite.z_index, sprite.order))
+			self.needs_sort = False
+		return self.sprites
+
+	def _can_collide(self, sprite, other):
+		if other is sprite or not other.collisions_enabled: return False
+		if sprite.collides_with_groups == 0 and other.groups == 0: return True
+		return bool(sprite.collides_with_groups & other.groups)
+
+	def _project(self, sprite, rect, goal_x, goal_y, visited):
+		x, y, w, h = rect
+		area = (min(x, goal_x), min(y, goal_y), abs(goal_x - x) + w, abs(goal_y - y) + h)
+
+		ax, ay, aw, ah = area
+		rects = self.collisions.rects
+
+		collisions = []
+		for other in self.collisions.query(area):
+			# cells are coarse, so most candidates are nowhere near the path and can go before the real test
+			other_rect = rects[other]
+			bx, by, bw, bh = other_rect
+			if bx > ax + aw or ax > bx + bw or by > ay + ah or ay > by + bh: continue
+			if other in visited or not self._can_collide(sprite, other): continue
+			collision_type = sprite.get_collision_response(other)
+			if collision_type is None: continue
+
+			result = detect_collision(rect, other_rect, goal_x, goal_y)
+			if result is None: continue
+			overlaps, ti, move, normal, touch = result
+			collisions.append(SpriteCollision(sprite, other, collision_type, overlaps, ti, move, normal, touch, rect, other_rect))
+
+		# earliest first, and the closer of two at the same time
+		cx, cy = x + w / 2, y + h / 2
+		def distance(collision):
+			ox, oy, ow, oh = collision.other_rect
+			return (ox + ow / 2 - cx) ** 2 + (oy + oh / 2 - cy) ** 2
+		collisions.sort(key=lambda collision: (collision.ti, distance(collision)))
+		return collisions
+
+	def check_collisions(self, sprite, goal_x, goal_y):
+		# the goal is for the sprite's position, the collision math works on its collide rect
+		rect = sprite.get_collide_bounds()
+		if rect is None or not sprite.collisions_enabled: return goal_x, goal_y, []
+		x, y, w, h = rect
+		shift_x, shift_y = x - sprite.x, y - sprite.y
+		goal_x, goal_y = goal_x + shift_x, goal_y + shift_y
+
+		visited = {sprite}
+		collisions = []
+		projected = self._project(sprite, rect, goal_x, goal_y, visited)
+		while projected:
+			collision = projected[0]
+			collisions.append(collision)
+			visited.add(collision.other)
+
+			tx, ty = collision.touch
+			if collision.type == COLLISION_FREEZE:
+				goal_x, goal_y = tx, ty
+				break
+			elif collision.type == COLLISION_OVERLAP:
+				# same start and goal, so projecting again would only drop the one just visited
+				projected = projected[1:]
+				continue
+
+			mx, my = collision.move
+			nx, ny = collision.normal
+			if collision.type == COLLISION_BOUNCE:
+				bx, by = tx, ty
+				if mx != 0 or my != 0:
+					bnx, bny = goal_x - tx, goal_y - ty
+					if nx == 0: bny = -bny
+					else: bnx = -bnx
+					bx, by = tx + bnx, ty + bny
+				goal_x, goal_y = bx, by
+			elif mx != 0 or my != 0:
+				if nx != 0: goal_x = tx
+				else: goal_y = ty
+			projected = self._project(sprite, (tx, ty, w, h), goal_x, goal_y, visited)
+
+		return goal_x - shift_x, goal_y - shift_y, collisions
+
+	def move_with_collisions(self, sprite, goal_x, goal_y):
+		actual_x, actual_y, collisions = self.check_collisions(sprite, goal_x, goal_y)
+		sprite.move_to(actual_x, actual_y)
+		return actual_x, actual_y, collisions
+
+	def query_sprites_in_rect(self, x, y, width, height):
+		rect = (x, y, width, height)
+		rects = self.collisions.rects
+		return [sprite for sprite in self.collisions.query(rect) if rects_overlap(rect, rects[sprite])]
+
+	def query_sprites_at_point(self, x, y):
+		found = []
+		for sprite in self.collisions.query((x, y, 0, 0)):
+			sx, sy, sw, sh = self.collisions.rects[sprite]
+			if sx <= x < sx + sw and sy <= y < sy + sh: found.append(sprite)
+		return found
+
+	def overlapping_sprites(self, sprite):
+		rect = self.collisions.rects.get(sprite)
+		if rect is None: return []
+		rects = self.collisions.rects
+		return [other for other in self.collisions.query(rect) if self._can_collide(sprite, other) and rects_overlap(rect, rects[other])]
+
+	def all_overlapping_sprites(self):
+		pairs = []
+		for sprite in self.sprites:
+			if sprite.collide_rect is None or not sprite.collisions_enabled: continue
+			for other in self.overlapping_sprites(sprite):
+				# each pair once, and in the order the sprites were added
+				if other.order > sprite.order: pairs.append((sprite, other))
+		return pairs
+
+	def _dirty_rects(self):
+		# runs of dirty tiles along each row, so a wide change is one rect and not a dozen
+		for ty, row in enumerate(self.dirty):
+			tiles = np.flatnonzero(row)
+			if len(tiles) == 0: continue
+			breaks = np.flatnonzero(np.diff(tiles) > 1)
+			starts = np.concatenate(((tiles[0],), tiles[breaks + 1]))
+			ends = np.concatenate((tiles[breaks], (tiles[-1],))) + 1
+			for tx0, tx1 in zip(starts, ends):
+				x, y = int(tx0) * DIRTY_TILE_SIZE, ty * DIRTY_TILE_SIZE
+				yield x, y, min(int(tx1) * DIRTY_TILE_SIZE, LCD_WIDTH) - x, min(DIRTY_TILE_SIZE, LCD_HEIGHT - y)
+
+	def update(self):
+		for sprite in list(self.sprites):
+			if sprite.update is not None: sprite.update(sprite)
+		self.draw()
+
+	def draw(self):
+		graphics = self.graphics
+		if graphics.draw_offset != self.draw_offset:
+			# everything moves on screen when the offset does
+			self.draw_offset = graphics.draw_offset
+			self.dirty[:] = True
+		if not self.dirty.any(): return
+
+		ox, oy = self.draw_offset
+		saved_clip, saved_mode = graphics.clip_rect, graphics.image_draw_mode
+
+		# background first, noting which dirty rects each sprite touches on the way
+		hits = {}
+		for x, y, w, h in self._dirty_rects():
+			graphics.set_screen_clip_rect(x, y, w, h)
+			if self.background is not None: self.background(x - ox, y - oy, w, h)
+			else: graphics.clear_rect(x, y, w, h)
+			for sprite in self.bounds.query((x - ox, y - oy, w, h)): hits.setdefault(sprite, []).append((x, y, w, h))
+
+		# then one walk of the draw list, which is only sorted again after a z change, and the rects never overlap
+		for sprite in self.get_draw_list():
+			rects = hits.get(sprite)
+			if rects is None or not sprite.visible: continue
+			for x, y, w, h in rects:
+				graphics.set_screen_clip_rect(x, y, w, h)
+				self._draw_sprite(sprite, (x - ox, y - oy, w, h))
+
+		graphics.clip_rect = saved_clip
+		graphics.image_draw_mode = saved_mode
+		self.dirty[:] = False
+
+	def _draw_sprite(self, sprite, rect):
+		graphics = self.graphics
+		bx, by, bw, bh = sprite.get_bounds()
+		bx, by = floor(bx), floor(by)
+
+		if sprite.draw is not None:
+			# custom drawing happens in the sprite's own coordinates
+			rx, ry, rw, rh = rect
+			saved_offset = graphics.draw_offset
+			graphics.draw_offset = (saved_offset[0] + bx, saved_offset[1] + by)
+			sprite.draw(sprite, rx - bx, ry - by, rw, rh)
+			graphics.draw_offset = saved_offset
+		elif sprite.image is not None:
+			graphics.image_draw_mode = sprite.draw_mode
+			graphics.draw_image(sprite.image, bx, by, sprite.flip)
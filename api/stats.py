@@ -0,0 +1,29 @@
+class PDStats:
+	def __init__(self, interval=1.0):
+		self.enabled = False
+		self.interval = interval
+
+		# totals for the last complete interval, as reported by playdate.getStats()
+		self.gc_time = 0.0
+		self.game_time = 0.0
+		self.audio_time = 0.0
+
+		self._reset_accum()
+
+	def _reset_accum(self):
+		self._elapsed = 0.0
+		self._gc_time = 0.0
+		self._game_time = 0.0
+		self._audio_time = 0.0
+
+	def record(self, elapsed, game=0.0, gc=0.0, audio=0.0):
+		self._elapsed += elapsed
+		self._game_time += game
+		self._gc_time += gc
+		self._audio_time += audio
+
+		if self._elapsed >= self.interval:
+			self.game_time = self._game_time
+			self.gc_time = self._gc_time
+			self.audio_time = self._audio_time
+			self._reset_accum()
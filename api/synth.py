@@ -0,0 +1,315 @@
+import numpy as np
+
+from math import ceil, log2
+
+from api.sound import AUDIO_SAMPLE_RATE, SoundSource
+from logger import get_logger
+
+LOGGER = get_logger("api.synth")
+
+WAVE_SQUARE = 0
+WAVE_TRIANGLE = 1
+WAVE_SINE = 2
+WAVE_NOISE = 3
+WAVE_SAWTOOTH = 4
+WAVE_PO_PHASE = 5
+WAVE_PO_DIGITAL = 6
+WAVE_PO_VOSIM = 7
+
+LFO_SQUARE = 0
+LFO_TRIANGLE = 1
+LFO_SINE = 2
+LFO_SAMPLE_AND_HOLD = 3
+LFO_SAWTOOTH_UP = 4
+LFO_SAWTOOTH_DOWN = 5
+
+ENV_IDLE = 0
+ENV_ATTACK = 1
+ENV_DECAY = 2
+ENV_SUSTAIN = 3
+ENV_RELEASE = 4
+
+NOTE_NAMES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+def note_to_frequency(note):
+	return 440.0 * 2 ** ((note - 69) / 12)
+
+def frequency_to_note(frequency):
+	return 69 + 12 * log2(frequency / 440.0)
+
+def parse_pitch(pitch):
+	# a frequency in Hz, or a note name like "C4", "F#3" or "Bb5"
+	if not isinstance(pitch, str): return float(pitch)
+	name = pitch.strip()
+	note = NOTE_NAMES[name[0].upper()]
+	rest = name[1:]
+	while rest and rest[0] in "#b":
+		note += 1 if rest[0] == "#" else -1
+		rest = rest[1:]
+	octave = int(rest) if rest else 4
+	return note_to_frequency(note + 12 * (octave + 1))
+
+def _hash_noise(cycles):
+	# the same pseudo-random value for the same cycle number, so sample and hold needs no state
+	return (np.modf(np.sin(cycles * 12.9898) * 43758.5453)[0] % 1.0) * 2 - 1
+
+class PDLFO:
+	def __init__(self, lfo_type=LFO_SINE):
+		self.type = lfo_type
+		self.rate = 1.0
+		self.depth = 1.0
+		self.center = 0.0
+		self.phase = 0.0
+
+	def render(self, start_frame, nframes, sample_rate):
+		# a function of the mixer clock only, so one LFO can drive any number of synths without running fast
+		phases = self.phase + self.rate * (start_frame + np.arange(nframes)) / sample_rate
+		cycle = np.floor(phases)
+		t = phases - cycle
+
+		if self.type == LFO_SQUARE: shape = np.where(t < 0.5, 1.0, -1.0)
+		elif self.type == LFO_TRIANGLE: shape = 1 - 4 * np.abs(t - 0.5)
+		elif self.type == LFO_SAMPLE_AND_HOLD: shape = _hash_noise(cycle)
+		elif self.type == LFO_SAWTOOTH_UP: shape = 2 * t - 1
+		elif self.type == LFO_SAWTOOTH_DOWN: shape = 1 - 2 * t
+		else: shape = np.sin(2 * np.pi * t)
+		return (self.center + self.depth * shape).astype(np.float32)
+
+class PDEnvelope:
+	def __init__(self, attack=0.0, decay=0.0, sustain=1.0, release=0.0):
+		self.attack = attack
+		self.decay = decay
+		self.sustain = sustain
+		self.release = release
+		self.stage = ENV_IDLE
+		self.level = 0.0
+		self.release_slope = 0.0
+		self.ramp_left = None
+
+	def note_on(self):
+		# from wherever the level is now, so retriggering a sounding note doesn't click
+		self.stage, self.ramp_left = ENV_ATTACK, None
+
+	def note_off(self, sample_rate):
+		if self.stage == ENV_IDLE: return
+		self.stage, self.ramp_left = ENV_RELEASE, None
+		self.release_slope = self.level / (self.release * sample_rate) if self.release > 0 else float("inf")
+
+	def _ramp(self, out, i, left, slope, target, next_stage):
+		# a straight line from the current level to target, counted in samples so rounding can't leave it just short
+		if self.ramp_left is None: self.ramp_left = max(ceil(abs(target - self.level) / slope), 1)
+		count = min(left, self.ramp_left)
+		step = slope if target > self.level else -slope
+		out[i:i + count] = self.level + step * np.arange(1, count + 1)
+		self.ramp_left -= count
+		if self.ramp_left == 0:
+			out[i + count - 1] = self.level = target
+			self.stage, self.ramp_left = next_stage, None
+		else: self.level += step * count
+		return count
+
+	def render(self, nframes, sample_rate):
+		# each stage is one ramp, so a block is at most a handful of array writes
+		out = np.empty(nframes, dtype=np.float32)
+		i = 0
+		while i < nframes:
+			left = nframes - i
+			if self.stage == ENV_ATTACK:
+				if self.attack <= 0 or self.level >= 1.0:
+					self.level, self.stage, self.ramp_left = 1.0, ENV_DECAY, None
+					continue
+				i += self._ramp(out, i, left, 1.0 / (self.attack * sample_rate), 1.0, ENV_DECAY)
+			elif self.stage == ENV_DECAY:
+				if self.decay <= 0 or self.level <= self.sustain:
+					self.level, self.stage, self.ramp_left = self.sustain, ENV_SUSTAIN, None
+					continue
+				i += self._ramp(out, i, left, (1.0 - self.sustain) / (self.decay * sample_rate), self.sustain, ENV_SUSTAIN)
+			elif self.stage == ENV_RELEASE:
+				if self.level <= 0 or self.release_slope == float("inf"):
+					self.level, self.stage, self.ramp_left = 0.0, ENV_IDLE, None
+					continue
+				i += self._ramp(out, i, left, self.release_slope, 0.0, ENV_IDLE)
+			else:
+				# sustaining or silent, flat to the end of the block
+				if self.stage == ENV_SUSTAIN: self.level = self.sustain
+				out[i:] = self.level
+				i = nframes
+		return out
+
+class PDSynth(SoundSource):
+	def __init__(self, waveform=WAVE_SQUARE, mixer=None):
+		super().__init__(mixer.sample_rate if mixer is not None else AUDIO_SAMPLE_RATE)
+		self.mixer = mixer
+		self.set_waveform(waveform)
+		self.wavetable = None
+		self.envelope = PDEnvelope()
+		self.frequency_mod = None
+		self.amplitude_mod = None
+
+		# pulse width for square waves
+		self.parameter = 0.5
+
+		self.frequency = 440.0
+		self.note_volume = 1.0
+		self.phase = 0.0
+		self.frames_left = None
+		self.rng = np.random.default_rng()
+
+	def set_waveform(self, waveform):
+		if waveform > WAVE_SAWTOOTH:
+			LOGGER.warning(f"Waveform {waveform} isn't supported, using a square wave")
+			waveform = WAVE_SQUARE
+		self.waveform = waveform
+
+	def set_wavetable(self, samples):
+		self.wavetable = None if samples is None else np.append(np.asarray(samples, dtype=np.float32), samples[0])
+
+	def set_adsr(self, attack, decay, sustain, release):
+		self.envelope.attack, self.envelope.decay = attack, decay
+		self.envelope.sustain, self.envelope.release = sustain, release
+
+	def is_sounding(self):
+		return self.envelope.stage != ENV_IDLE
+
+	def note_on(self, pitch, volume=1.0, length=None, sample_rate=None):
+		self.frequency = parse_pitch(pitch)
+		self.note_volume = volume
+		if sample_rate is None: sample_rate = self.mixer.sample_rate if self.mixer is not None else self.sample_rate
+		self.frames_left = None if length is None else int(length * sample_rate)
+		self.envelope.note_on()
+
+	def note_off(self, sample_rate=None):
+		if sample_rate is None: sample_rate = self.mixer.sample_rate if self.mixer is not None else self.sample_rate
+		self.frames_left = None
+		self.envelope.note_off(sample_rate)
+
+	def play_note(self, pitch, volume=1.0, length=None):
+		self.note_on(pitch, volume, length)
+		self.finished = False
+		self.playing = True
+		if self.mixer is not None: self.mixer.add(self)
+
+	def play_midi_note(self, note, volume=1.0, length=None):
+		self.play_note(note_to_frequency(note), volume, length)
+
+	def stop(self):
+		self.envelope.stage, self.envelope.level, self.envelope.ramp_left = ENV_IDLE, 0.0, None
+		super().stop()
+
+	def _wave(self, phases, nframes):
+		if self.wavetable is not None:
+			# linear interpolation around the table, which has its first entry repeated on the end
+			pos = phases * (len(self.wavetable) - 1)
+			index = pos.astype(np.int64)
+			return self.wavetable[index] + (self.wavetable[index + 1] - self.wavetable[index]) * (pos - index)
+		if self.waveform == WAVE_SQUARE: return np.where(phases < self.parameter, 1.0, -1.0)
+		if self.waveform == WAVE_TRIANGLE: return 1 - 4 * np.abs(phases - 0.5)
+		if self.waveform == WAVE_SINE: return np.sin(2 * np.pi * phases)
+		if self.waveform == WAVE_NOISE: return self.rng.uniform(-1.0, 1.0, nframes)
+		return 2 * phases - 1
+
+	def render(self, nframes, out_rate, start_frame=None):
+		if self.envelope.stage == ENV_IDLE:
+			self.playing, self.finished = False, True
+			return None
+		if start_frame is None: start_frame = self.mixer.frames_mixed if self.mixer is not None else 0
+
+		# a note with a length lets go partway through a block, which splits the envelope there
+		if self.frames_left is not None and self.frames_left < nframes:
+			split = max(self.frames_left, 0)
+			head = self.envelope.render(split, out_rate)
+			self.note_off(out_rate)
+			envelope = np.concatenate((head, self.envelope.render(nframes - split, out_rate)))
+		else:
+			envelope = self.envelope.render(nframes, out_rate)
+			if self.frames_left is not None: self.frames_left -= nframes
+
+		# the phase accumulator, per sample when the pitch is being modulated and a straight ramp otherwise
+		if self.frequency_mod is not None:
+			increments = self.frequency * np.exp2(self.frequency_mod.render(start_frame, nframes, out_rate) / 12) / out_rate
+			phases = self.phase + np.cumsum(increments) - increments
+			self.phase = float(phases[-1] + increments[-1]) % 1.0
+		else:
+			increment = self.frequency / out_rate
+			phases = self.phase + increment * np.arange(nframes)
+			self.phase = (self.phase + increment * nframes) % 1.0
+		phases %= 1.0
+
+		amplitude = envelope * self.note_volume
+		if self.amplitude_mod is not None: amplitude *= np.clip(1 + self.amplitude_mod.render(start_frame, nframes, out_rate), 0, None)
+		block = (self._wave(phases, nframes) * amplitude).astype(np.float32)
+
+		if self.envelope.stage == ENV_IDLE: self.playing, self.finished = False, True
+		return block[:, None]
+
+class PDInstrument(SoundSource):
+	def __init__(self, mixer=None):
+		super().__init__(mixer.sample_rate if mixer is not None else AUDIO_SAMPLE_RATE)
+		self.mixer = mixer
+		self.transpose = 0.0
+
+		# [synth, lowest note, highest note, transpose, note playing, when it started]
+		self.voices = []
+		self.note_count = 0
+
+	def add_voice(self, synth, range_start=0, range_end=127, transpose=0.0):
+		synth.mixer = None
+		self.voices.append([synth, range_start, range_end, transpose, None, 0])
+
+	def _allocate(self, note):
+		candidates = [voice for voice in self.voices if voice[1] <= note <= voice[2]]
+		if not candidates: return None
+
+		# a silent voice if there is one, otherwise the quietest one letting go, otherwise the oldest note
+		for voice in candidates:
+			if not voice[0].is_sounding(): return voice
+		releasing = [voice for voice in candidates if voice[0].envelope.stage == ENV_RELEASE]
+		if releasing: return min(releasing, key=lambda voice: voice[0].envelope.level)
+		return min(candidates, key=lambda voice: voice[5])
+
+	def play_note(self, pitch, volume=1.0, length=None):
+		note = frequency_to_note(parse_pitch(pitch)) + self.transpose
+		voice = self._allocate(round(note))
+		if voice is None: return None
+
+		synth = voice[0]
+		sample_rate = self.mixer.sample_rate if self.mixer is not None else self.sample_rate
+		synth.note_on(note_to_frequency(note + voice[3]), volume, length, sample_rate)
+		self.note_count += 1
+		voice[4], voice[5] = round(note), self.note_count
+
+		self.finished = False
+		self.playing = True
+		if self.mixer is not None: self.mixer.add(self)
+		return synth
+
+	def play_midi_note(self, note, volume=1.0, length=None):
+		return self.play_note(note_to_frequency(note), volume, length)
+
+	def note_off(self, pitch):
+		note = round(frequency_to_note(parse_pitch(pitch)) + self.transpose)
+		sample_rate = self.mixer.sample_rate if self.mixer is not None else self.sample_rate
+		for voice in self.voices:
+			if voice[4] == note and voice[0].is_sounding():
+				voice[0].note_off(sample_rate)
+				voice[4] = None
+
+	def all_notes_off(self):
+		sample_rate = self.mixer.sample_rate if self.mixer is not None else self.sample_rate
+		for voice in self.voices:
+			voice[0].note_off(sample_rate)
+			voice[4] = None
+
+	def render(self, nframes, out_rate):
+		start_frame = self.mixer.frames_mixed if self.mixer is not None else 0
+		out = None
+		for voice in self.voices:
+			synth = voice[0]
+			if not synth.is_sounding(): continue
+			block = synth.render(nframes, out_rate, start_frame)
+			if block is None: continue
+			if out is None: out = block
+			else: out += block
+
+		if not any(voice[0].is_sounding() for voice in self.voices): self.playing, self.finished = False, True
+		return out
@@ -0,0 +1,163 @@
+import numpy as np
+
+from api.blitter import DRAWMODE_COPY, PackedImage, blit
+from api.transform import unpack_image
+from logger import get_logger
+
+LOGGER = get_logger("api.tilemap")
+
+# a multiple of 8, so chunks sit next to each other on byte boundaries
+TILEMAP_CHUNK_SIZE = 64
+
+class PDTilemap:
+	def __init__(self, image_table=None):
+		self.image_table = None
+		self.tile_width = 0
+		self.tile_height = 0
+		self.tiles = np.zeros((0, 0), dtype=np.int32)
+
+		# (chunk x, chunk y) -> (color, mask, fully opaque), all packed and TILEMAP_CHUNK_SIZE pixels square
+		self.chunks = {}
+		self.tile_cache = {}
+
+		# the visible chunks put together as (chunk range, image, fully opaque), kept until the range or a chunk changes
+		self.view = None
+		if image_table is not None: self.set_image_table(image_table)
+
+	def set_image_table(self, image_table):
+		self.image_table = image_table
+		first = image_table.image_table[0][0]
+		self.tile_width, self.tile_height = first.stored_width, first.stored_height
+		self.tile_cache.clear()
+		self.chunks.clear()
+		self.view = None
+
+	def set_size(self, width, height):
+		tiles = np.zeros((height, width), dtype=np.int32)
+		h, w = min(height, self.tiles.shape[0]), min(width, self.tiles.shape[1])
+		tiles[:h, :w] = self.tiles[:h, :w]
+		self.tiles = tiles
+		self.chunks.clear()
+		self.view = None
+
+	def get_size(self):
+		height, width = self.tiles.shape
+		return width, height
+
+	def get_pixel_size(self):
+		height, width = self.tiles.shape
+		return width * self.tile_width, height * self.tile_height
+
+	def set_tiles(self, data, width):
+		# 1-based tile indices, row by row, with 0 for an empty tile
+		height = -(-len(data) // width) if width else 0
+		tiles = np.zeros(height * width, dtype=np.int32)
+		tiles[:len(data)] = data
+		self.tiles = tiles.reshape(height, width)
+		self.chunks.clear()
+		self.view = None
+
+	def get_tile_at(self, x, y):
+		# 1-based positions like the Lua API
+		height, width = self.tiles.shape
+		if not (1 <= x <= width and 1 <= y <= height): return None
+		return int(self.tiles[y - 1, x - 1])
+
+	def set_tile_at(self, x, y, index):
+		height, width = self.tiles.shape
+		if not (1 <= x <= width and 1 <= y <= height): return
+		if self.tiles[y - 1, x - 1] == index: return
+		self.tiles[y - 1, x - 1] = index
+
+		# only the chunks under this one tile have to be composed again
+		px, py = (x - 1) * self.tile_width, (y - 1) * self.tile_height
+		for cy in range(py // TILEMAP_CHUNK_SIZE, (py + self.tile_height - 1) // TILEMAP_CHUNK_SIZE + 1):
+			for cx in range(px // TILEMAP_CHUNK_SIZE, (px + self.tile_width - 1) // TILEMAP_CHUNK_SIZE + 1):
+				self.chunks.pop((cx, cy), None)
+		self.view = None
+
+	def _get_tile(self, index):
+		tile = self.tile_cache.get(index)
+		if tile is None:
+			table = self.image_table
+			row, col = divmod(index - 1, table.num_per_row)
+			if 0 <= index - 1 < table.num_images: tile = unpack_image(table.image_table[row][col])
+			else:
+				LOGGER.warning(f"Tile index {index} is out of range")
+				tile = (np.zeros((self.tile_height, self.tile_width), dtype=bool),) * 2
+			self.tile_cache[index] = tile
+		return tile
+
+	def _get_chunk(self, cx, cy):
+		chunk = self.chunks.get((cx, cy))
+		if chunk is not None: return chunk
+
+		size = TILEMAP_CHUNK_SIZE
+		white = np.zeros((size, size), dtype=bool)
+		opaque = np.zeros((size, size), dtype=bool)
+
+		# every tile that lands on any part of the chunk
+		tw, th = self.tile_width, self.tile_height
+		height, width = self.tiles.shape
+		x0, y0 = cx * size, cy * size
+		for ty in range(y0 // th, min((y0 + size - 1) // th + 1, height)):
+			for tx in range(x0 // tw, min((x0 + size - 1) // tw + 1, width)):
+				index = self.tiles[ty, tx]
+				if index == 0: continue
+				tile_white, tile_opaque = self._get_tile(index)
+
+				left, top = tx * tw - x0, ty * th - y0
+				src_x, src_y = max(-left, 0), max(-top, 0)
+				dst_x, dst_y = max(left, 0), max(top, 0)
+				w, h = min(tw - src_x, size - dst_x), min(th - src_y, size - dst_y)
+				white[dst_y:dst_y + h, dst_x:dst_x + w] = tile_white[src_y:src_y + h, src_x:src_x + w]
+				opaque[dst_y:dst_y + h, dst_x:dst_x + w] = tile_opaque[src_y:src_y + h, src_x:src_x + w]
+
+		chunk = (np.packbits(white, axis=1), np.packbits(opaque, axis=1), bool(opaque.all()))
+		self.chunks[(cx, cy)] = chunk
+		return chunk
+
+	def _get_view(self, cx0, cy0, cx1, cy1):
+		key = (cx0, cy0, cx1, cy1)
+		if self.view is None or self.view[0] != key:
+			# chunks are whole bytes wide, so the visible ones just butt together into one bitmap
+			rows = [[self._get_chunk(cx, cy) for cx in range(cx0, cx1)] for cy in range(cy0, cy1)]
+			color = np.block([[chunk[0] for chunk in row] for row in rows])
+			mask = np.block([[chunk[1] for chunk in row] for row in rows])
+			opaque = all(chunk[2] for row in rows for chunk in row)
+
+			size = TILEMAP_CHUNK_SIZE
+			map_w, map_h = self.get_pixel_size()
+			height = min(color.shape[0], map_h - cy0 * size)
+			width = min(color.shape[1] * 8, map_w - cx0 * size)
+			self.view = (key, PackedImage(color[:height], mask[:height], width), opaque)
+		return self.view[1], self.view[2]
+
+	def draw(self, graphics, x, y, mode=DRAWMODE_COPY):
+		if self.image_table is None or self.tiles.size == 0: return
+		ox, oy = graphics.draw_offset
+		sx, sy = int(x) + ox, int(y) + oy
+		clip_x0, clip_y0, clip_x1, clip_y1 = graphics.clip_rect
+		map_w, map_h = self.get_pixel_size()
+
+		# the part of the map that's on screen, in map pixels, then in chunks
+		mx0, my0 = max(clip_x0 - sx, 0), max(clip_y0 - sy, 0)
+		mx1, my1 = min(clip_x1 - sx, map_w), min(clip_y1 - sy, map_h)
+		if mx0 >= mx1 or my0 >= my1: return
+		size = TILEMAP_CHUNK_SIZE
+		cx0, cy0 = mx0 // size, my0 // size
+		cx1, cy1 = (mx1 - 1) // size + 1, (my1 - 1) // size + 1
+
+		image, opaque = self._get_view(cx0, cy0, cx1, cy1)
+		left, top = sx + cx0 * size, sy + cy0 * size
+
+		if mode == DRAWMODE_COPY and opaque and (left | image.width | clip_x0 | clip_x1) & 7 == 0:
+			# lined up with the frame's bytes and nothing to see through: a straight copy of the rows
+			row0, row1 = max(clip_y0 - top, 0), min(clip_y1 - top, image.height)
+			col0, col1 = max((clip_x0 - left) >> 3, 0), min((clip_x1 - left) >> 3, image.width >> 3)
+			if row0 < row1 and col0 < col1:
+				graphics.frame[top + row0:top + row1, (left >> 3) + col0:(left >> 3) + col1] = image.color[row0:row1, col0:col1]
+			return
+
+		# the same image every frame the view holds still, so the blitter keeps its shifted copies too
+		blit(graphics.frame, image, left, top, graphics.clip_rect, mode)
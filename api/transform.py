@@ -0,0 +1,124 @@
+import numpy as np
+
+from collections import OrderedDict
+from math import ceil, cos, radians, sin
+
+from api.blitter import PackedImage
+from logger import get_logger
+
+LOGGER = get_logger("api.transform")
+
+FLIP_NONE = 0
+FLIP_X = 1
+FLIP_Y = 2
+FLIP_XY = 3
+
+# the Lua API also takes the flips by name
+FLIP_NAMES = {
+	"flipX": FLIP_X,
+	"flipY": FLIP_Y,
+	"flipXY": FLIP_XY
+}
+
+# angles are snapped to this many degrees, which is finer than a 1-bit sprite can show anyway
+TRANSFORM_ANGLE_STEP = 1.0
+TRANSFORM_CACHE_SIZE = 4 * 1024 * 1024
+
+class TransformedImage(PackedImage):
+	def __init__(self, white, opaque):
+		# (h, w) bool arrays, kept packed so they go through the same blit path as a PDImageFile
+		super().__init__(np.packbits(white, axis=1), np.packbits(opaque, axis=1), white.shape[1])
+		# nothing is trimmed, so it can be transformed again or given to a sprite like a loaded image
+		self.stored_width, self.stored_height = self.width, self.height
+		# the cache it's in and how much it takes up there, shifted copies for blitting included
+		self.cache = None
+		self.cache_bytes = self.nbytes
+
+def unpack_image(image):
+	# the whole stored image, transparent padding included
+	color, alpha = image.get_planes()
+	white = np.zeros((image.stored_height, image.stored_width), dtype=bool)
+	opaque = np.zeros((image.stored_height, image.stored_width), dtype=bool)
+
+	rows = slice(image.clip_t, image.clip_t + image.height)
+	cols = slice(image.clip_l, image.clip_l + image.width)
+	white[rows, cols] = np.unpackbits(color, axis=1)[:, :image.width]
+	if alpha is not None: opaque[rows, cols] = np.unpackbits(alpha, axis=1)[:, :image.width]
+	else: opaque[rows, cols] = True
+	return white, opaque
+
+def transform_image(image, angle=0.0, xscale=1.0, yscale=1.0, flip=FLIP_NONE):
+	white, opaque = unpack_image(image)
+	if flip & FLIP_X: white, opaque = white[:, ::-1], opaque[:, ::-1]
+	if flip & FLIP_Y: white, opaque = white[::-1], opaque[::-1]
+	height, width = white.shape
+
+	# the size of the rotated and scaled bounding box, rounded so a right angle doesn't gain a pixel
+	c, s = cos(radians(angle)), sin(radians(angle))
+	sw, sh = width * xscale, height * yscale
+	out_w = ceil(round(abs(sw * c) + abs(sh * s), 6))
+	out_h = ceil(round(abs(sw * s) + abs(sh * c), 6))
+	if out_w <= 0 or out_h <= 0 or width == 0 or height == 0:
+		return TransformedImage(np.zeros((0, 0), dtype=bool), np.zeros((0, 0), dtype=bool))
+
+	# map every output pixel centre back into the source, clockwise since y points down
+	u = np.arange(out_w) + 0.5 - out_w / 2
+	v = (np.arange(out_h) + 0.5 - out_h / 2)[:, None]
+	src_x = np.floor((u * c + v * s) / xscale + width / 2).astype(np.int32)
+	src_y = np.floor((v * c - u * s) / yscale + height / 2).astype(np.int32)
+
+	inside = (src_x >= 0) & (src_x < width) & (src_y >= 0) & (src_y < height)
+	src_x = np.clip(src_x, 0, width - 1)
+	src_y = np.clip(src_y, 0, height - 1)
+	return TransformedImage(white[src_y, src_x], opaque[src_y, src_x] & inside)
+
+class TransformCache:
+	def __init__(self, max_bytes=TRANSFORM_CACHE_SIZE):
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, image, angle=0.0, xscale=1.0, yscale=None, flip=FLIP_NONE):
+		if yscale is None: yscale = xscale
+
+		# a negative scale is a flip along that axis
+		if xscale < 0: xscale, flip = -xscale, flip ^ FLIP_X
+		if yscale < 0: yscale, flip = -yscale, flip ^ FLIP_Y
+		if xscale == 0 or yscale == 0: return TransformedImage(np.zeros((0, 0), dtype=bool), np.zeros((0, 0), dtype=bool))
+		angle = round((angle % 360) / TRANSFORM_ANGLE_STEP) * TRANSFORM_ANGLE_STEP % 360
+
+		# the key holds the image itself, so its id can't be reused while the entry is around
+		key = (image, angle, xscale, yscale, flip)
+		transformed = self.entries.get(key)
+		if transformed is not None:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return transformed
+
+		self.misses += 1
+		transformed = transform_image(image, angle, xscale, yscale, flip)
+		self.entries[key] = transformed
+		transformed.cache = self
+		self.size += transformed.cache_bytes
+		self._evict()
+		return transformed
+
+	def grow(self, transformed, nbytes):
+		# the blitter building another alignment of an image that's still in here
+		if transformed.cache is not self: return
+		transformed.cache_bytes += nbytes
+		self.size += nbytes
+		self._evict()
+
+	def _evict(self):
+		while self.size > self.max_bytes and len(self.entries) > 1:
+			key, evicted = self.entries.popitem(last=False)
+			evicted.cache = None
+			self.size -= evicted.cache_bytes
+
+	def clear(self):
+		for transformed in self.entries.values(): transformed.cache = None
+		self.entries.clear()
+		self.size = 0
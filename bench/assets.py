@@ -0,0 +1,52 @@
+from os.path import join as joinpath
+from random import Random
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from api.assets import ASSET_CACHE_SIZE, ASSET_FONT, ASSET_IMAGE, ASSET_IMAGETABLE, ASSET_SAMPLE, PDAssetManager
+from bench.generators import generate_pda, generate_pdi, generate_pdt, generate_pft
+
+def write_assets(directory, num_each):
+	paths = []
+	for i in range(num_each):
+		files = (
+			(ASSET_IMAGE, f"image{i}.pdi", generate_pdi(128, 128, seed=i)),
+			(ASSET_IMAGETABLE, f"table{i}.pdt", generate_pdt(32, 32, 16, 4, seed=i)),
+			(ASSET_FONT, f"font{i}.pft", generate_pft(8, 12, seed=i)),
+			(ASSET_SAMPLE, f"sound{i}.pda", generate_pda(0.5, 22050, seed=i))
+		)
+		for asset_type, filename, data in files:
+			with open(joinpath(directory, filename), "wb") as f: f.write(data)
+			# spelled the way a game might, with the source extension
+			paths.append((asset_type, filename.rsplit(".", 1)[0] + (".png" if asset_type == ASSET_IMAGE else "")))
+	return paths
+
+def run_loads(manager, paths, num_loads, seed=0):
+	# a few assets get most of the loads, like a game reloading the same sprite every time an enemy spawns
+	rng = Random(seed)
+	weights = [1 / (i + 1) for i in range(len(paths))]
+	start = perf_counter()
+	for asset_type, path in rng.choices(paths, weights, k=num_loads): manager.get(asset_type, path)
+	return perf_counter() - start
+
+if __name__ == "__main__":
+	num_each = int(argv[1]) if len(argv) > 1 else 8
+	num_loads = int(argv[2]) if len(argv) > 2 else 2000
+
+	with TemporaryDirectory() as directory:
+		paths = write_assets(directory, num_each)
+
+		print(f"{len(paths)} assets, {num_loads} loads")
+		print(f"{'budget':<10}{'ms/load':>10}{'uncached':>10}{'speedup':>9}")
+		uncached = PDAssetManager(directory, max_bytes=0)
+		uncached_time = run_loads(uncached, paths, num_loads // 10) / (num_loads // 10)
+
+		for budget in (ASSET_CACHE_SIZE, 1024 * 1024, 256 * 1024):
+			manager = PDAssetManager(directory, max_bytes=budget, sample_rate=44100)
+			per_load = run_loads(manager, paths, num_loads) / num_loads
+			print(f"{f'{budget // 1024} KB':<10}{per_load * 1000:>10.3f}{uncached_time * 1000:>10.3f}{uncached_time / per_load:>8.1f}x")
+
+			for asset_type, stats in manager.get_stats().items():
+				if stats["hits"] + stats["misses"] == 0: continue
+				print(f"  {asset_type:<12}{stats['hits']:>6} hits{stats['misses']:>6} misses{stats['evictions']:>6} evicted{stats['bytes']:>10} bytes")
@@ -0,0 +1,179 @@
+from io import BytesIO
+from math import ceil
+from random import Random
+from struct import pack
+from zlib import compress
+
+from loaders.pda import MONO_16, MONO_ADPCM4, PDAudioFormat
+from loaders.pdi import PDImageFile
+from loaders.pds import PDStringsFile
+from loaders.pdt import PDImageTableFile
+from loaders.pdv import PDV_FRAME_NONE, PDV_FRAME_IFRAME, PDV_FRAME_PFRAME
+from loaders.pft import PDFontFile
+from loaders.pdz import PDZ_FILE_IMAGE, PDZ_FILE_IMAGETABLE, PDZ_FILE_AUDIO, PDZ_FILE_STRINGS, PDZ_FILE_FONT, PDZipWriter
+
+def _bitmap(rng, width, height):
+	# mostly runs of solid color with some noise, which compresses about like real art does
+	stride = ceil(width / 8)
+	rows = []
+	for y in range(height):
+		row = bytearray(rng.choice((b"\0", b"\xff")) * stride)
+		for i in range(rng.randrange(stride // 4 + 1)): row[rng.randrange(stride)] = rng.randrange(0x100)
+		rows.append(bytes(row))
+	return b"".join(rows)
+
+def image_data(width, height, alpha=True, clip=(0, 0, 0, 0), seed=0):
+	rng = Random(seed)
+	stride = ceil(width / 8)
+	clip_l, clip_r, clip_t, clip_b = clip
+
+	data = pack("<8H", width, height, stride, clip_l, clip_r, clip_t, clip_b, 0x3 * int(alpha))
+	data += _bitmap(rng, width, height)
+	if alpha: data += _bitmap(rng, width, height)
+	return data
+
+def generate_pdi(width, height, alpha=True, compressed=True, seed=0):
+	return PDImageFile.pack_file(image_data(width, height, alpha, seed=seed), compressed, (width, height, 0))
+
+def imagetable_data(cell_width, cell_height, num_images, num_per_row, alpha=True, seed=0):
+	cells = [image_data(cell_width, cell_height, alpha, seed=seed + i) for i in range(num_images)]
+
+	offsets = []
+	end = 0
+	for cell in cells:
+		end += len(cell)
+		offsets.append(end)
+
+	return pack("<2H", num_images, num_per_row) + pack(f"<{num_images}L", *offsets) + b"".join(cells)
+
+def generate_pdt(cell_width, cell_height, num_images, num_per_row=None, alpha=True, compressed=True, seed=0):
+	if num_per_row is None: num_per_row = num_images
+	payload = imagetable_data(cell_width, cell_height, num_images, num_per_row, alpha, seed)
+	return PDImageTableFile.pack_file(payload, compressed, (cell_width, cell_height, num_images))
+
+def generate_pdv(width, height, num_frames, keyframe_interval=10, framerate=30.0, seed=0):
+	rng = Random(seed)
+	stride = ceil(width / 8)
+
+	frames = []
+	frame_types = []
+	for i in range(num_frames):
+		if i % keyframe_interval == 0:
+			frames.append(compress(_bitmap(rng, width, height)))
+			frame_types.append(PDV_FRAME_IFRAME)
+		else:
+			change_map = bytearray(stride * height)
+			for j in range(rng.randrange(len(change_map) // 16 + 1)): change_map[rng.randrange(len(change_map))] = rng.randrange(0x100)
+			frames.append(compress(bytes(change_map)))
+			frame_types.append(PDV_FRAME_PFRAME)
+
+	offsets = []
+	end = 0
+	for frame, frame_type in zip(frames, frame_types):
+		offsets.append((end << 2) | frame_type)
+		end += len(frame)
+	offsets.append((end << 2) | PDV_FRAME_NONE)
+
+	header = b"Playdate VID" + pack("<L2H", 0, num_frames, 0) + pack("<f", framerate) + pack("<2H", width, height)
+	return header + pack(f"<{len(offsets)}L", *offsets) + b"".join(frames)
+
+def audio_data(seconds, framerate=22050, fmt=MONO_16, seed=0):
+	rng = Random(seed)
+	nchannels = PDAudioFormat.get_nchannels(fmt)
+	num_frames = int(seconds * framerate)
+	data = pack("<L", framerate | (fmt << 24))
+
+	if fmt < MONO_ADPCM4:
+		return data + rng.randbytes(num_frames * nchannels * PDAudioFormat.get_sampwidth(fmt))
+
+	block_size = 256 * nchannels
+	samples_per_block = 2 * (block_size - 4 * nchannels) // nchannels + 1
+	num_blocks = ceil(num_frames / samples_per_block)
+
+	blocks = []
+	for i in range(num_blocks):
+		for channel in range(nchannels): blocks.append(pack("<hBx", rng.randrange(-0x8000, 0x8000), rng.randrange(89)))
+		blocks.append(rng.randbytes(block_size - 4 * nchannels))
+	return data + pack("<H", block_size) + b"".join(blocks)
+
+def generate_pda(seconds, framerate=22050, fmt=MONO_16, seed=0):
+	return b"Playdate AUD" + audio_data(seconds, framerate, fmt, seed)
+
+def strings_data(num_keys, seed=0):
+	rng = Random(seed)
+	entries = []
+	for i in range(num_keys):
+		value = " ".join(f"word{rng.randrange(1000)}" for j in range(rng.randrange(1, 12)))
+		entries.append(f"key_{i}".encode("utf-8") + b"\0" + value.encode("utf-8") + b"\0")
+
+	# the first entry's offset is implied
+	offsets = []
+	end = 0
+	for entry in entries[:-1]:
+		end += len(entry)
+		offsets.append(end)
+
+	return pack("<L", num_keys) + pack(f"<{len(offsets)}L", *offsets) + b"".join(entries)
+
+def generate_pds(num_keys, compressed=True, seed=0):
+	return PDStringsFile.pack_file(strings_data(num_keys, seed), compressed)
+
+def _glyph_data(rng, width, height, kerning):
+	data = pack("<BBH", width, len(kerning), 0)
+	for other, amount in kerning: data += pack("<Bb", other, amount)
+	while len(data) % 4 != 0: data += b"\0"
+	return data + image_data(width, height, True, seed=rng.randrange(1 << 30))
+
+def font_data(max_width, max_height, num_pages=1, glyphs_per_page=96, tracking=1, seed=0):
+	rng = Random(seed)
+
+	page_mask = bytearray(64)
+	pages = []
+	for page_num in range(num_pages):
+		page_mask[page_num // 8] |= 1 << (page_num % 8)
+
+		first = 0x20 if page_num == 0 else 0
+		codepoints = range(first, min(first + glyphs_per_page, 0x100))
+		glyph_mask = bytearray(32)
+		glyphs = []
+		for codepoint in codepoints:
+			glyph_mask[codepoint // 8] |= 1 << (codepoint % 8)
+			kerning = [(rng.randrange(0x20, 0x7f), rng.randrange(-2, 3)) for k in range(rng.randrange(3))]
+			glyphs.append(_glyph_data(rng, rng.randrange(1, max_width + 1), max_height, kerning))
+
+		offsets = []
+		end = 0
+		for glyph in glyphs:
+			end += len(glyph)
+			offsets.append(end)
+
+		page = b"\0\0\0" + pack("<B", len(glyphs) & 0xff) + bytes(glyph_mask) + pack(f"<{len(offsets)}H", *offsets)
+		while len(page) % 4 != 0: page += b"\0"
+		pages.append(page + b"".join(glyphs))
+
+	offsets = []
+	end = 0
+	for page in pages:
+		end += len(page)
+		offsets.append(end)
+
+	header = pack("<BBH", max_width, max_height, tracking) + bytes(page_mask)
+	return header + pack(f"<{len(offsets)}L", *offsets) + b"".join(pages)
+
+def generate_pft(max_width, max_height, num_pages=1, glyphs_per_page=96, compressed=True, seed=0):
+	payload = font_data(max_width, max_height, num_pages, glyphs_per_page, seed=seed)
+	return PDFontFile.pack_file(payload, compressed, (max_width, max_height, 0))
+
+def generate_pdz(num_each=4, scale=1, compressed=True, seed=0):
+	entries = []
+	for i in range(num_each):
+		entries.append((f"images/image{i}", PDZ_FILE_IMAGE, image_data(64 * scale, 64 * scale, seed=seed + i)))
+		entries.append((f"images/table{i}", PDZ_FILE_IMAGETABLE, imagetable_data(16 * scale, 16 * scale, 8, 4, seed=seed + i)))
+		entries.append((f"sounds/sound{i}", PDZ_FILE_AUDIO, audio_data(0.25 * scale, 22050, MONO_ADPCM4 if i % 2 else MONO_16, seed=seed + i)))
+		entries.append((f"strings{i}", PDZ_FILE_STRINGS, strings_data(50 * scale, seed=seed + i)))
+		entries.append((f"fonts/font{i}", PDZ_FILE_FONT, font_data(8, 12, seed=seed + i)))
+
+	fh = BytesIO()
+	with PDZipWriter(fh, workers=1) as writer:
+		for filename, filetype, entry_data in entries: writer.add_file(filename, filetype, entry_data, compressed)
+	return fh.getvalue()
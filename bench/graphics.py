@@ -0,0 +1,89 @@
+from sys import argv
+from time import perf_counter
+
+from api.blitter import DRAWMODE_COPY, DRAWMODE_XOR, DRAWMODE_WHITE_TRANSPARENT
+from api.graphics import COLOR_BLACK, COLOR_XOR, PDGraphics
+from api.tilemap import PDTilemap
+from bench.generators import generate_pdi, generate_pdt
+from loaders.pdi import PDImageFile
+from loaders.pdt import PDImageTableFile
+
+def run_primitive(graphics, draw, iterations):
+	start = perf_counter()
+	for i in range(iterations): draw(graphics, i)
+	return iterations / (perf_counter() - start)
+
+PRIMITIVES = (
+	("fillRect 16x16", lambda g, i: g.fill_rect(i % 384, i % 224, 16, 16)),
+	("fillRect full", lambda g, i: g.fill_rect(0, 0, 400, 240)),
+	("fillRect pattern", lambda g, i: g.fill_rect(i % 300, i % 140, 100, 100)),
+	("drawRect 100x100", lambda g, i: g.draw_rect(i % 300, i % 140, 100, 100)),
+	("drawLine", lambda g, i: g.draw_line(0, i % 240, 399, 239 - i % 240)),
+	("drawLine width 4", lambda g, i: g.draw_line(0, i % 240, 399, 239 - i % 240)),
+	("fillCircle r=32", lambda g, i: g.fill_circle(200, 120, 32)),
+	("drawCircle r=32", lambda g, i: g.draw_circle(200, 120, 32)),
+	("fillPolygon", lambda g, i: g.fill_polygon((10, 10, 390, 40, 200, 230, 20, 120)))
+)
+
+# sprite-sized images, drawn at every bit alignment
+IMAGE_BLITS = (
+	("drawImage copy", 32, DRAWMODE_COPY),
+	("drawImage XOR", 32, DRAWMODE_XOR),
+	("drawImage whiteTr", 32, DRAWMODE_WHITE_TRANSPARENT),
+	("drawImage 128 copy", 128, DRAWMODE_COPY)
+)
+
+def draw_rotated_uncached(g, image, i):
+	g.transforms.clear()
+	g.draw_rotated(image, 200, 120, i * 5, 1.5)
+
+# a few angles over and over, which is what games tend to do, and then a miss every time
+TRANSFORMS = (
+	("drawRotated cached", lambda g, image, i: g.draw_rotated(image, 200, 120, i % 8 * 45, 1.5)),
+	("drawRotated miss", draw_rotated_uncached),
+	("drawScaled 2x", lambda g, image, i: g.draw_scaled(image, i % 300, i % 140, 2))
+)
+
+def make_tilemap(alpha):
+	tilemap = PDTilemap(PDImageTableFile(generate_pdt(16, 16, 16, 4, alpha=alpha)))
+	tilemap.set_tiles([1 + i * 7 % 16 for i in range(64 * 64)], 64)
+	return tilemap
+
+# a full screen of a 64x64 tile map, scrolling on and off byte boundaries
+TILEMAPS = (
+	("tilemap aligned", False, lambda g, tilemap, i: tilemap.draw(g, -8 * (i % 64), -(i % 200))),
+	("tilemap scroll", False, lambda g, tilemap, i: tilemap.draw(g, -(i % 500), -(i % 200))),
+	("tilemap alpha", True, lambda g, tilemap, i: tilemap.draw(g, -(i % 500), -(i % 200)))
+)
+
+if __name__ == "__main__":
+	iterations = int(argv[1]) if len(argv) > 1 else 2000
+
+	print(f"{iterations} iterations of each primitive")
+	print(f"{'primitive':<20}{'calls/s':>12}")
+
+	for name, draw in PRIMITIVES:
+		graphics = PDGraphics()
+		graphics.set_color(COLOR_XOR if "Rect" in name else COLOR_BLACK)
+		if "pattern" in name: graphics.set_pattern((0xaa, 0x55) * 4)
+		if "width" in name: graphics.line_width = 4
+		print(f"{name:<20}{run_primitive(graphics, draw, iterations):>12.0f}")
+
+	for name, size, mode in IMAGE_BLITS:
+		graphics = PDGraphics()
+		graphics.image_draw_mode = mode
+		image = PDImageFile(generate_pdi(size, size))
+		rate = run_primitive(graphics, lambda g, i: g.draw_image(image, i * 7 % (400 - size), i * 3 % (240 - size)), iterations)
+		print(f"{name:<20}{rate:>12.0f}")
+
+	image = PDImageFile(generate_pdi(32, 32))
+	for name, draw in TRANSFORMS:
+		graphics = PDGraphics()
+		rate = run_primitive(graphics, lambda g, i: draw(g, image, i), iterations)
+		print(f"{name:<20}{rate:>12.0f}")
+
+	for name, alpha, draw in TILEMAPS:
+		graphics = PDGraphics()
+		tilemap = make_tilemap(alpha)
+		rate = run_primitive(graphics, lambda g, i: draw(g, tilemap, i), iterations)
+		print(f"{name:<20}{rate:>12.0f}")
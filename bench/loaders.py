@@ -0,0 +1,109 @@
+from json import dump, load
+from os.path import isfile, join as joinpath
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter
+import tracemalloc
+
+from bench.generators import generate_pdi, generate_pdt, generate_pdv, generate_pda, generate_pft, generate_pds, generate_pdz
+from loaders.pda import PDAudioFile, MONO_16, MONO_ADPCM4, STEREO_ADPCM4
+from loaders.pdi import PDImageFile
+from loaders.pds import PDStringsFile
+from loaders.pdt import PDImageTableFile
+from loaders.pdv import PDVideoFile
+from loaders.pft import PDFontFile
+from loaders.pdz import PDZipFile
+from logger import init_logging
+
+REPEATS = 3
+
+# (name, loader class, generator, units of work, unit name)
+def get_cases(scale):
+	return [
+		("pdi", PDImageFile, lambda: generate_pdi(400, 240 * scale), 400 * 240 * scale, "pixels"),
+		("pdt", PDImageTableFile, lambda: generate_pdt(32, 32, 16 * scale, 4), 32 * 32 * 16 * scale, "pixels"),
+		("pdv", PDVideoFile, lambda: generate_pdv(200, 120, 10 * scale), 200 * 120 * 10 * scale, "pixels"),
+		("pda-pcm", PDAudioFile, lambda: generate_pda(2 * scale, 22050, MONO_16), 2 * scale * 22050, "samples"),
+		("pda-adpcm", PDAudioFile, lambda: generate_pda(scale, 22050, MONO_ADPCM4), scale * 22050, "samples"),
+		("pda-adpcm-stereo", PDAudioFile, lambda: generate_pda(scale, 22050, STEREO_ADPCM4), scale * 22050, "samples"),
+		("pft", PDFontFile, lambda: generate_pft(12, 16, scale, 96), 96 * scale, "glyphs"),
+		("pds", PDStringsFile, lambda: generate_pds(1000 * scale), 1000 * scale, "strings"),
+		("pdz", PDZipFile, lambda: generate_pdz(4, scale), 5 * 4, "entries")
+	]
+
+def _run_once(loader, path, out_dir):
+	start = perf_counter()
+	pd_file = loader(path)
+	parsed = perf_counter()
+	if loader == PDZipFile: pd_file.dump_files(joinpath(out_dir, "pdz"))
+	else: pd_file.to_nonpdfile()
+	return parsed - start, perf_counter() - parsed
+
+def run_case(loader, path, out_dir, repeats=REPEATS):
+	parse_time = export_time = float("inf")
+	for i in range(repeats):
+		parse, export = _run_once(loader, path, out_dir)
+		parse_time = min(parse_time, parse)
+		export_time = min(export_time, export)
+
+	# tracemalloc slows everything down, so peak memory gets its own run
+	tracemalloc.start()
+	_run_once(loader, path, out_dir)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	return parse_time, export_time, peak
+
+def run(scale=1, repeats=REPEATS):
+	results = {}
+	work_dir = mkdtemp(prefix="pd-emu-bench-")
+
+	try:
+		for name, loader, generator, units, unit_name in get_cases(scale):
+			data = generator()
+			path = joinpath(work_dir, f"{name}{loader.PD_FILE_EXT}")
+			with open(path, "wb") as f: f.write(data)
+
+			parse_time, export_time, peak = run_case(loader, path, work_dir, repeats)
+			total_time = parse_time + export_time
+			results[name] = {
+				"input_bytes": len(data),
+				"parse_s": parse_time,
+				"export_s": export_time,
+				"mb_per_s": len(data) / total_time / 1e6,
+				"units": units,
+				"unit": unit_name,
+				"units_per_s": units / total_time,
+				"peak_bytes": peak
+			}
+	finally: rmtree(work_dir, ignore_errors=True)
+
+	return results
+
+def print_results(results, baseline=None):
+	print(f"{'case':<18}{'input KB':>10}{'parse ms':>10}{'export ms':>11}{'MB/s':>8}{'throughput':>24}{'peak KB':>10}{'vs baseline':>13}")
+	for name, result in results.items():
+		throughput = f"{result['units_per_s']:.0f} {result['unit']}/s"
+		line = f"{name:<18}{result['input_bytes'] / 1024:>10.1f}{result['parse_s'] * 1000:>10.2f}{result['export_s'] * 1000:>11.2f}"
+		line += f"{result['mb_per_s']:>8.2f}{throughput:>24}{result['peak_bytes'] / 1024:>10.0f}"
+
+		if baseline is not None and name in baseline:
+			old_time = baseline[name]["parse_s"] + baseline[name]["export_s"]
+			new_time = result["parse_s"] + result["export_s"]
+			line += f"{(old_time / new_time - 1) * 100:>+12.1f}%"
+		print(line)
+
+if __name__ == "__main__":
+	init_logging()
+
+	scale = int(argv[1]) if len(argv) > 1 else 1
+	results = run(scale)
+
+	baseline = None
+	if len(argv) > 3 and isfile(argv[3]):
+		with open(argv[3], "r") as f: baseline = load(f)
+	print_results(results, baseline)
+
+	if len(argv) > 2:
+		with open(argv[2], "w") as f: dump(results, f, indent="\t")
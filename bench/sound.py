@@ -0,0 +1,76 @@
+from sys import argv
+from time import perf_counter
+
+from api.resample import RESAMPLE_LINEAR, RESAMPLE_SINC, PDResampler
+from api.sound import AUDIO_BLOCK_SIZE, PDFilePlayer, PDMixer, PDSamplePlayer, load_samples
+from api.synth import LFO_SINE, WAVE_NOISE, WAVE_SAWTOOTH, WAVE_SINE, WAVE_SQUARE, WAVE_TRIANGLE, PDInstrument, PDLFO, PDSynth
+from bench.generators import generate_pda
+from loaders.pda import MONO_16, STEREO_16, PDAudioFile
+
+def make_players(mixer, num_channels):
+	samples = load_samples(PDAudioFile(generate_pda(1.0, 22050, MONO_16)))
+	for i in range(num_channels):
+		# a spread of rates and pans so every channel goes down the resampling path
+		player = PDSamplePlayer(samples, 22050, mixer)
+		player.set_volume(0.5 + i % 2 * 0.5, 1.0 - i % 2 * 0.5)
+		player.play(0, 0.5 + i % 7 * 0.25)
+
+	player = PDFilePlayer(PDAudioFile(generate_pda(4.0, 44100, STEREO_16)), mixer)
+	player.play(0)
+
+def run_blocks(mixer, num_blocks, block_size):
+	for i in range(num_blocks):
+		mixer.mix(block_size)
+		mixer.pump()
+	return mixer.take_audio_time() / num_blocks
+
+def make_instrument(mixer, num_voices):
+	instrument = PDInstrument(mixer)
+	vibrato = PDLFO(LFO_SINE)
+	vibrato.rate, vibrato.depth = 5.0, 0.2
+	waveforms = (WAVE_SQUARE, WAVE_SAWTOOTH, WAVE_SINE, WAVE_TRIANGLE, WAVE_NOISE)
+	for i in range(num_voices):
+		synth = PDSynth(waveforms[i % len(waveforms)])
+		synth.set_adsr(0.01, 0.1, 0.7, 0.2)
+		if i % 2: synth.frequency_mod = vibrato
+		instrument.add_voice(synth)
+
+	# every voice held, so they all render for the whole run
+	for i in range(num_voices): instrument.play_midi_note(36 + i % 48, 1.0 / num_voices)
+
+def run_resampler(src_rate, dst_rate, mode, seconds=2.0, block_size=AUDIO_BLOCK_SIZE):
+	samples = load_samples(PDAudioFile(generate_pda(seconds, src_rate, STEREO_16)))
+	resampler = PDResampler(src_rate, dst_rate, 2, mode)
+	start = perf_counter()
+	for i in range(0, len(samples), block_size): resampler.process(samples[i:i + block_size])
+	resampler.flush()
+	return seconds / (perf_counter() - start)
+
+if __name__ == "__main__":
+	num_channels = int(argv[1]) if len(argv) > 1 else 8
+	num_blocks = int(argv[2]) if len(argv) > 2 else 500
+
+	print(f"{num_channels} sample players and a file player, {num_blocks} blocks")
+	print(f"{'block size':<12}{'ms/block':>10}{'budget ms':>11}{'load':>8}{'underruns':>11}")
+
+	for block_size in (256, AUDIO_BLOCK_SIZE, 1024, 2048):
+		mixer = PDMixer(block_size=block_size)
+		make_players(mixer, num_channels)
+		per_block = run_blocks(mixer, num_blocks, block_size)
+		budget = block_size / mixer.sample_rate
+		print(f"{block_size:<12}{per_block * 1000:>10.3f}{budget * 1000:>11.2f}{per_block / budget:>8.1%}{mixer.underruns:>11}")
+
+	print()
+	print(f"{'synth voices':<14}{'ms/block':>10}{'load':>8}")
+	for num_voices in (8, 16, 32, 64):
+		mixer = PDMixer()
+		make_instrument(mixer, num_voices)
+		per_block = run_blocks(mixer, num_blocks, AUDIO_BLOCK_SIZE)
+		print(f"{num_voices:<14}{per_block * 1000:>10.3f}{per_block / (AUDIO_BLOCK_SIZE / mixer.sample_rate):>8.1%}")
+
+	print()
+	print(f"{'resampling':<22}{'linear':>10}{'sinc':>10}  (seconds of stereo audio per second)")
+	for src_rate, dst_rate in ((11025, 44100), (22050, 44100), (44100, 22050)):
+		linear = run_resampler(src_rate, dst_rate, RESAMPLE_LINEAR)
+		sinc = run_resampler(src_rate, dst_rate, RESAMPLE_SINC)
+		print(f"{f'{src_rate} -> {dst_rate}':<22}{linear:>10.0f}{sinc:>10.0f}")
@@ -0,0 +1,65 @@
+from random import Random
+from sys import argv
+from time import perf_counter
+
+from api.graphics import PDGraphics
+from api.sprites import COLLISION_OVERLAP, PDSprite, PDSpriteManager
+from bench.generators import generate_pdi
+from loaders.pdi import PDImageFile
+
+def make_sprites(manager, num_sprites, seed=0):
+	rng = Random(seed)
+	images = [PDImageFile(generate_pdi(size, size, seed=size)) for size in (8, 12, 16)]
+
+	sprites = []
+	for i in range(num_sprites):
+		sprite = PDSprite(rng.choice(images))
+		sprite.set_collide_rect(0, 0, sprite.width, sprite.height)
+		sprite.collision_response = COLLISION_OVERLAP
+		manager.add(sprite)
+		sprite.move_to(rng.uniform(0, 400), rng.uniform(0, 240))
+		sprite.set_z_index(rng.randrange(4))
+		sprite.velocity = (rng.uniform(-2, 2), rng.uniform(-2, 2))
+		sprites.append(sprite)
+	return sprites
+
+def run_frames(manager, sprites, num_frames):
+	move_time = query_time = draw_time = 0.0
+	num_collisions = 0
+
+	for frame in range(num_frames):
+		start = perf_counter()
+		for sprite in sprites:
+			vx, vy = sprite.velocity
+			if not 0 <= sprite.x + vx < 400: vx = -vx
+			if not 0 <= sprite.y + vy < 240: vy = -vy
+			sprite.velocity = (vx, vy)
+			x, y, collisions = manager.move_with_collisions(sprite, sprite.x + vx, sprite.y + vy)
+			num_collisions += len(collisions)
+
+		mid = perf_counter()
+		for i in range(10): manager.query_sprites_in_rect(i * 40, 100, 40, 40)
+		manager.all_overlapping_sprites()
+
+		end = perf_counter()
+		manager.update()
+
+		move_time += mid - start
+		query_time += end - mid
+		draw_time += perf_counter() - end
+
+	return move_time * 1000 / num_frames, query_time * 1000 / num_frames, draw_time * 1000 / num_frames, num_collisions / num_frames
+
+if __name__ == "__main__":
+	num_sprites = int(argv[1]) if len(argv) > 1 else 1000
+	num_frames = int(argv[2]) if len(argv) > 2 else 30
+
+	manager = PDSpriteManager(PDGraphics())
+	sprites = make_sprites(manager, num_sprites)
+	manager.update()
+
+	move_ms, query_ms, draw_ms, collisions = run_frames(manager, sprites, num_frames)
+	print(f"{num_sprites} sprites, {num_frames} frames, {collisions:.0f} collisions per frame")
+	print(f"{'moveWithCollisions':<20}{move_ms:>10.2f} ms/frame")
+	print(f"{'queries':<20}{query_ms:>10.2f} ms/frame")
+	print(f"{'draw':<20}{draw_ms:>10.2f} ms/frame")
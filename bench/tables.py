@@ -0,0 +1,43 @@
+from sys import argv
+from time import perf_counter
+
+from api.pdtime import PDTimeService
+from api.runtime import RUNTIME, LuaTablePool
+
+def run_frames(pool, num_frames, calls_per_frame):
+	time_service = PDTimeService(pool)
+	collectgarbage = RUNTIME.globals().collectgarbage
+
+	collectgarbage("collect")
+	collectgarbage("stop")
+	start_mem = collectgarbage("count")
+	start_allocs = pool.allocations
+	start = perf_counter()
+
+	for frame in range(num_frames):
+		time_service.begin_frame()
+		for i in range(calls_per_frame):
+			pool.fill("getPowerStatus", {"charging": False, "USB": True})
+			pool.fill("getStats", {"GC": 0.1, "game": 0.5, "audio": 0.05, "idle": 0.35})
+			time_service.get_time()
+			time_service.get_gmt_time()
+
+	elapsed = perf_counter() - start
+	garbage = collectgarbage("count") - start_mem
+	collectgarbage("restart")
+	collectgarbage("collect")
+
+	return (pool.allocations - start_allocs) / num_frames, garbage / num_frames, elapsed * 1000 / num_frames
+
+if __name__ == "__main__":
+	num_frames = int(argv[1]) if len(argv) > 1 else 1000
+	calls_per_frame = int(argv[2]) if len(argv) > 2 else 4
+
+	print(f"{num_frames} frames, {calls_per_frame} calls of each getter per frame")
+	print(f"{'mode':<8}{'tables/frame':>14}{'Lua KB/frame':>14}{'ms/frame':>10}")
+
+	for mode in ("pooled", "copy"):
+		pool = LuaTablePool(RUNTIME)
+		pool.copy_mode = (mode == "copy")
+		allocs, garbage, ms = run_frames(pool, num_frames, calls_per_frame)
+		print(f"{mode:<8}{allocs:>14.2f}{garbage:>14.2f}{ms:>10.3f}")
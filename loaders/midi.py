@@ -0,0 +1,165 @@
+from struct import Struct
+from sys import argv
+
+from loaders.pdfile import PDFile
+from logger import init_logging, get_logger
+
+LOGGER = get_logger("loaders.midi")
+
+MIDI_HEADER = Struct(">LHHh")
+MIDI_CHUNK = Struct(">4sL")
+
+MIDI_NOTE_OFF = 0x80
+MIDI_NOTE_ON = 0x90
+MIDI_META = 0xff
+MIDI_META_TEMPO = 0x51
+MIDI_META_END = 0x2f
+
+# microseconds per quarter note when a file never sets one
+MIDI_DEFAULT_TEMPO = 500000
+
+# bytes of data after each kind of channel message, indexed by the top nibble of the status byte
+MIDI_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2, 0xc0: 1, 0xd0: 1, 0xe0: 2}
+
+class MIDITrack:
+	def __init__(self, name=None):
+		self.name = name
+		# (start tick, length in ticks, note number, velocity from 0 to 1, channel)
+		self.notes = []
+		self.length = 0
+
+class MIDIFile(PDFile):
+	
+	MAGIC = b"MThd"
+	PD_FILE_EXT = ".mid"
+	NONPD_FILE_EXT = ".mid"
+	
+	def __init__(self, filename, skip_magic=False):
+		# not a Playdate format, a standard MIDI file that games bundle as it is
+		super().__init__(filename, skip_magic)
+		length, self.format, num_chunks, self.division = self.readstruct(MIDI_HEADER)
+		self.advance(length - 6)
+		
+		self.tracks = []
+		# (tick, microseconds per quarter note), from any track
+		self.tempos = []
+		
+		for i in range(num_chunks):
+			header = self.readstruct(MIDI_CHUNK)
+			if header is None: break
+			kind, length = header
+			data = self.readbin(length)
+			if kind == b"MTrk": self.tracks.extend(self._parse_track(data))
+		
+		self.tempos.sort()
+		self.length = max((track.length for track in self.tracks), default=0)
+	
+	def get_steps_per_second(self):
+		if self.division < 0:
+			# SMPTE timing: frames per second, then ticks per frame
+			return -(self.division >> 8) * (self.division & 0xff)
+		tempo = self.tempos[0][1] if self.tempos else MIDI_DEFAULT_TEMPO
+		return self.division * 1000000 / tempo
+	
+	def _parse_track(self, data):
+		pos = 0
+		tick = 0
+		status = 0
+		name = None
+		# (channel, note) -> ticks and velocities of notes still held, oldest first
+		held = {}
+		notes = []
+		
+		def read_varlen():
+			nonlocal pos
+			value = 0
+			while pos < len(data):
+				byte = data[pos]
+				pos += 1
+				value = (value << 7) | (byte & 0x7f)
+				if not byte & 0x80: break
+			return value
+		
+		while pos < len(data):
+			tick += read_varlen()
+			if pos >= len(data): break
+			
+			if data[pos] & 0x80:
+				status = data[pos]
+				pos += 1
+			
+			if status == MIDI_META:
+				kind = data[pos]
+				pos += 1
+				length = read_varlen()
+				payload = data[pos:pos + length]
+				pos += length
+				if kind == MIDI_META_TEMPO and length == 3: self.tempos.append((tick, int.from_bytes(payload, "big")))
+				elif kind == 0x03 and name is None: name = payload.decode("latin-1")
+				elif kind == MIDI_META_END: break
+				continue
+			if status in (0xf0, 0xf7):
+				# sysex, skipped over
+				pos += read_varlen()
+				continue
+			
+			# running status means the status byte can be left out and the last one used again
+			kind = status & 0xf0
+			length = MIDI_DATA_LENGTHS.get(kind)
+			if length is None:
+				LOGGER.warning(f"Unknown MIDI status byte {status:#04x}, skipping the rest of the track")
+				break
+			args = data[pos:pos + length]
+			pos += length
+			
+			channel = status & 0x0f
+			if kind == MIDI_NOTE_ON and args[1] > 0:
+				held.setdefault((channel, args[0]), []).append((tick, args[1] / 127))
+			elif kind == MIDI_NOTE_OFF or kind == MIDI_NOTE_ON:
+				started = held.get((channel, args[0]))
+				if started:
+					start, velocity = started.pop(0)
+					notes.append((start, tick - start, args[0], velocity, channel))
+		
+		# anything never let go of runs to the end of the track
+		for (channel, note), started in held.items():
+			for start, velocity in started: notes.append((start, tick - start, note, velocity, channel))
+		if not notes: return []
+		notes.sort()
+		
+		# a type 0 file has every channel in one track, which is one instrument each on the Playdate
+		if self.format == 0: channels = sorted(set(note[4] for note in notes))
+		else: channels = [None]
+		
+		tracks = []
+		for channel in channels:
+			track = MIDITrack(name)
+			track.notes = [note for note in notes if channel is None or note[4] == channel]
+			track.length = tick
+			tracks.append(track)
+		return tracks
+	
+	def to_nonpdfile(self):
+		return self.data
+
+if __name__ == "__main__":
+	init_logging()
+	
+	midi_file = MIDIFile(argv[1])
+	LOGGER.info(f"Format {midi_file.format}, {midi_file.length} steps at {midi_file.get_steps_per_second():.2f} steps per second")
+	for i, track in enumerate(midi_file.tracks):
+		LOGGER.info(f"Track {i + 1}{f' ({track.name})' if track.name else ''}: {len(track.notes)} notes")
+
+# Standard MIDI file, big endian throughout
+
+# HEADER CHUNK
+# 0: char[4]: constant "MThd"
+# 4: uint32: header length, 6
+# 8: uint16: format (0 = one track, 1 = simultaneous tracks, 2 = independent tracks)
+# 10: uint16: number of track chunks
+# 12: int16: division, ticks per quarter note if positive, SMPTE frames per second and ticks per frame if negative
+
+# TRACK CHUNK
+# 0: char[4]: constant "MTrk"
+# 4: uint32: length of the events
+# events, each a variable-length delta time in ticks followed by a channel, meta or sysex event
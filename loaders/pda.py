@@ -1,5 +1,8 @@
+import numpy as np
+
 from io import BytesIO
 from os.path import splitext
+from struct import pack
 from sys import argv, byteorder as BYTEORDER
 import wave
 
@@ -16,6 +19,8 @@ MONO_ADPCM4 = 4
 STEREO_ADPCM4 = 5
 FORMAT_LENGTH = 6
 
+PCM_CHUNK_SIZE = 0x10000
+
 IMA_INDEX_TABLE = [
 	-1, -1, -1, -1, 2, 4, 6, 8,
 	-1, -1, -1, -1, 2, 4, 6, 8
@@ -87,6 +92,71 @@ class ADPCMDecoder:
 		
 		return result
 
+IMA_INDEX_ARRAY = np.array(IMA_INDEX_TABLE, dtype=np.int32)
+IMA_STEP_ARRAY = np.array(IMA_STEP_TABLE, dtype=np.int32)
+
+class ADPCMEncoder:
+	def __init__(self, block_size=256):
+		self.block_size = block_size
+	
+	def get_block_frames(self, nchannels):
+		# the header holds the first sample, then 2 nibbles per byte
+		return 1 + 2 * (self.block_size - 4 * nchannels) // nchannels
+	
+	def encode_blocks(self, blocks):
+		# each block restarts from its own header, so every block is encoded side by side
+		blocks = blocks.astype(np.int32)
+		predictor = blocks[:, 0].copy()
+		
+		first_diffs = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1) if blocks.shape[1] > 1 else np.zeros(len(blocks))
+		step_index = np.clip(np.searchsorted(IMA_STEP_ARRAY, first_diffs), 0, 88).astype(np.int32)
+		start_index = step_index.copy()
+		
+		nibbles = np.empty((len(blocks), blocks.shape[1] - 1), dtype=np.uint8)
+		for i in range(1, blocks.shape[1]):
+			step = IMA_STEP_ARRAY[step_index]
+			diff = blocks[:, i] - predictor
+			nibble = np.where(diff < 0, 8, 0)
+			diff = np.abs(diff)
+			difference = step >> 3
+			
+			for bit, part in ((4, step), (2, step >> 1), (1, step >> 2)):
+				mask = diff >= part
+				nibble |= bit * mask
+				diff -= part * mask
+				difference += part * mask
+			
+			predictor = np.clip(predictor + np.where(nibble & 8, -difference, difference), -32767, 32767)
+			step_index = np.clip(step_index + IMA_INDEX_ARRAY[nibble], 0, 88)
+			nibbles[:, i - 1] = nibble
+		
+		headers = np.zeros((len(blocks), 4), dtype=np.uint8)
+		headers[:, :2] = blocks[:, :1].astype("<i2").view(np.uint8)
+		headers[:, 2] = start_index
+		
+		return headers, nibbles
+	
+	def encode(self, samples):
+		num_frames, nchannels = samples.shape
+		block_frames = self.get_block_frames(nchannels)
+		num_blocks = -(-num_frames // block_frames)
+		
+		padded = np.pad(samples, ((0, num_blocks * block_frames - num_frames), (0, 0)), mode="edge")
+		channel_blocks = padded.reshape(num_blocks, block_frames, nchannels).transpose(2, 0, 1).reshape(nchannels * num_blocks, block_frames)
+		headers, nibbles = self.encode_blocks(channel_blocks)
+		
+		if nchannels == 2:
+			# one byte per frame, left channel in the high nibble
+			headers = np.concatenate((headers[:num_blocks], headers[num_blocks:]), axis=1)
+			data = (nibbles[:num_blocks] << 4) | nibbles[num_blocks:]
+			last_block_len = 8 + (num_frames - (num_blocks - 1) * block_frames - 1)
+		else:
+			data = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+			last_block_len = 4 + -(-(num_frames - (num_blocks - 1) * block_frames - 1) // 2)
+		
+		encoded = np.concatenate((headers, data), axis=1).tobytes()
+		return encoded[:len(encoded) - self.block_size + last_block_len]
+
 class PDAudioFormat:
 	@staticmethod
 	def get_nchannels(fmt):
@@ -111,41 +181,51 @@ class PDAudioFile(PDFile):
 		
 		self.framerate = self.readu24()	
 		self.fmt = self.readu8()
-	
-	def to_wavfile(self):		
-		fh = BytesIO()
+		self.data_start = self.tell()
 		
 		try:
 			self.nchannels = PDAudioFormat.get_nchannels(self.fmt)
 			self.sampwidth = PDAudioFormat.get_sampwidth(self.fmt)
 		except ValueError:
-			LOGGER.error("Audio format invalid.")
-			return b""
-		
-		LOGGER.debug(f"Audio format: {'IMA ADPCM' if self.fmt > STEREO_16 else 'PCM'}")
-		LOGGER.debug(f"Channels: {'2 (Stereo)' if self.nchannels == 2 else '1 (Mono)'}")
+			self.nchannels = self.sampwidth = None
+	
+	def _read_blocks(self, block_size):
+		block = self.readbin(block_size)
+		while block:
+			yield block
+			block = self.readbin(block_size)
+	
+	def get_nframes(self):
+		self.seek(self.data_start)
+		self.handle.seek(0, 2)
+		data_len = self.tell() - self.data_start
 		
-		wavfile = wave.open(fh, "wb")
+		frame_size = self.nchannels * self.sampwidth
+		if self.fmt < MONO_ADPCM4: return data_len // frame_size
 		
-		wavfile.setnchannels(self.nchannels)
-		wavfile.setsampwidth(self.sampwidth)
-		wavfile.setframerate(self.framerate)
+		self.seek(self.data_start)
+		block_size = self.readu16()
+		data_len -= 2
 		
-		data = bytes()
+		# each block starts with one whole sample per channel, then a nibble per sample after that
+		header_len = 4 * self.nchannels
+		num_blocks = -(-data_len // block_size)
+		body_len = data_len - num_blocks * header_len
+		return num_blocks + 2 * body_len // self.nchannels
+	
+	def iter_pcm(self):
+		# yields the audio as PCM a block at a time, so nothing ever holds the whole thing
+		self.seek(self.data_start)
 		stereo = (self.nchannels == 2)
+		
 		if self.fmt < MONO_ADPCM4: 
 			LOGGER.debug("Data is already PCM, so no conversion needed.")
-			data = self.readbin()
+			yield from self._read_blocks(PCM_CHUNK_SIZE)
 		elif self.fmt < FORMAT_LENGTH:
 			LOGGER.debug("Data is ADPCM -- conversion needed!")
 			
 			block_size = self.readu16()
 			
-			saved_pos = self.tell()
-			self.handle.seek(0, 2)
-			file_end = self.tell()
-			self.seek(saved_pos)
-			
 			if stereo:
 				decoder_left = ADPCMDecoder()
 				decoder_right = ADPCMDecoder()
@@ -156,39 +236,91 @@ class PDAudioFile(PDFile):
 					
 					return decoder_left.decode(sample_left).to_bytes(2, byteorder="little", signed=True) + decoder_right.decode(sample_right).to_bytes(2, byteorder="little", signed=True)
 				
-				for i in range(saved_pos, file_end, block_size):
-					decoder_left.predictor = self.reads16()
-					decoder_left.step_index = self.readu8()
-					self.advance(1)
+				for block in self._read_blocks(block_size):
+					decoder_left.predictor = int.from_bytes(block[0:2], byteorder="little", signed=True)
+					decoder_left.step_index = block[2]
+					decoder_left._step = IMA_STEP_TABLE[decoder_left.step_index]
 					
-					decoder_right.predictor = self.reads16()
-					decoder_right.step_index = self.readu8()
-					self.advance(1)
+					decoder_right.predictor = int.from_bytes(block[4:6], byteorder="little", signed=True)
+					decoder_right.step_index = block[6]
+					decoder_right._step = IMA_STEP_TABLE[decoder_right.step_index]
 					
-					data += decoder_left.predictor.to_bytes(2, byteorder="little", signed=True)
+					data = decoder_left.predictor.to_bytes(2, byteorder="little", signed=True)
 					data += decoder_right.predictor.to_bytes(2, byteorder="little", signed=True)
-					
-					block = self.readbin(block_size - 8)
-					data += b"".join(map(decode_stereo, tuple(block)))
+					yield data + b"".join(map(decode_stereo, block[8:]))
 					
 			else:
 				decoder = ADPCMDecoder()
 				
-				for i in range(saved_pos, file_end, block_size):
-					decoder.predictor = self.reads16()
-					decoder.step_index = self.readu8()
-					self.advance(1)
-					data += decoder.decode_block(self.readbin(block_size - 4))
-			
-		wavfile.writeframes(data)
+				for block in self._read_blocks(block_size):
+					decoder.predictor = int.from_bytes(block[0:2], byteorder="little", signed=True)
+					decoder.step_index = block[2]
+					yield decoder.decode_block(block[4:])
+	
+	def write_wavfile(self, fh):
+		if self.nchannels is None:
+			LOGGER.error("Audio format invalid.")
+			return False
+		
+		LOGGER.debug(f"Audio format: {'IMA ADPCM' if self.fmt > STEREO_16 else 'PCM'}")
+		LOGGER.debug(f"Channels: {'2 (Stereo)' if self.nchannels == 2 else '1 (Mono)'}")
+		
+		wavfile = wave.open(fh, "wb")
+		
+		wavfile.setnchannels(self.nchannels)
+		wavfile.setsampwidth(self.sampwidth)
+		wavfile.setframerate(self.framerate)
+		# knowing the length up front means the header never has to be patched, so the sink doesn't need to seek
+		wavfile.setnframes(self.get_nframes())
+		
+		for data in self.iter_pcm(): wavfile.writeframesraw(data)
 		wavfile.close()
+		return True
+	
+	def to_wavfile(self):
+		fh = BytesIO()
+		if not self.write_wavfile(fh): return b""
 		self.wavfile = fh.getvalue()
 		fh.close()
 		
 		return self.wavfile
+	
+	def write_nonpdfile(self, fh):
+		self.write_wavfile(fh)
+	
 	def to_nonpdfile(self):
 		return self.to_wavfile()
 
+def _wav_to_samples(wavfile):
+	nchannels = wavfile.getnchannels()
+	sampwidth = wavfile.getsampwidth()
+	frames = wavfile.readframes(wavfile.getnframes())
+	
+	if sampwidth == 1: samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int32) - 0x80) << 8
+	elif sampwidth == 2: samples = np.frombuffer(frames, dtype="<i2").astype(np.int32)
+	elif sampwidth == 3: samples = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2")[:, 0].astype(np.int32)
+	elif sampwidth == 4: samples = np.frombuffer(frames, dtype="<i4") >> 16
+	else: raise ValueError("unsupported WAV sample width")
+	
+	return samples.reshape(-1, nchannels)
+
+def wavfile_to_pda(wav, fmt=MONO_ADPCM4, block_size=None):
+	if type(wav) == bytes: wav = BytesIO(wav)
+	with wave.open(wav, "rb") as wavfile:
+		framerate = wavfile.getframerate()
+		samples = _wav_to_samples(wavfile)
+	
+	nchannels = PDAudioFormat.get_nchannels(fmt)
+	if samples.shape[1] > nchannels: samples = samples.mean(axis=1, keepdims=True).astype(np.int32)
+	elif samples.shape[1] < nchannels: samples = np.repeat(samples, nchannels, axis=1)
+	
+	header = PDAudioFile.MAGIC + pack("<L", framerate | (fmt << 24))
+	if fmt < MONO_16: return header + ((samples >> 8) + 0x80).astype(np.uint8).tobytes()
+	elif fmt < MONO_ADPCM4: return header + samples.astype("<i2").tobytes()
+	
+	if block_size is None: block_size = 256 * nchannels
+	return header + pack("<H", block_size) + ADPCMEncoder(block_size).encode(samples)
+
 if __name__ == "__main__":
 	init_logging()
 	
@@ -1,5 +1,10 @@
+import numpy as np
+
+from hashlib import md5
 from io import BytesIO
-from os.path import splitext
+from os import environ, makedirs, replace
+from os.path import expanduser, isfile, join as joinpath, splitext
+from struct import pack_into, unpack, unpack_from
 from sys import argv
 
 from loaders.pdfile import PDFile
@@ -7,6 +12,8 @@ from logger import init_logging, get_logger
 
 LOGGER = get_logger("loaders.pdbin")
 
+PDEX_CACHE_DIR = joinpath(environ.get("XDG_CACHE_HOME", joinpath(expanduser("~"), ".cache")), "pd-emu", "pdex")
+
 class PDBinFile(PDFile):
 	
 	MAGIC = b"Playdate PDX"
@@ -31,11 +38,8 @@ class PDBinFile(PDFile):
 			relocs_len = self.readu32()
 			
 			self.decompress()
-			self.code = self.readbin(self.code_size)
-			self.relocs = []
-			
-			for i in range(relocs_len):
-				self.relocs.append(self.readu32())
+			self.code = self.readbin(self.filesz)
+			self.relocs = list(unpack(f"<{relocs_len}L", self.readbin(4 * relocs_len)))
 		else:
 			LOGGER.debug("Detected legacy binary format")
 			self.seek(0)
@@ -43,7 +47,44 @@ class PDBinFile(PDFile):
 			self.event_handler = self.readu32() - 0x6000000c
 			self.filesz = self.readu32() - 0x6000000c
 			self.memsz = self.readu32() - 0x6000000c
-			self.code = self.readbin(self.code_size)
+			self.code = self.readbin(self.filesz)
+			self.relocs = []
+			self.md5 = md5(self.code).digest()
+
+	def relocate(self, base, cache_dir=PDEX_CACHE_DIR):
+		if not self.relocs: return self.code
+		
+		cache_path = None
+		if cache_dir is not None:
+			cache_path = joinpath(cache_dir, f"{self.md5.hex()}-{base:08x}.bin")
+			if isfile(cache_path):
+				with open(cache_path, "rb") as f: image = f.read()
+				if len(image) == self.filesz:
+					LOGGER.debug("Using cached relocated image")
+					return image
+		
+		image = bytearray(self.code)
+		relocs = np.array(self.relocs, dtype=np.uint32)
+		
+		# aligned words are patched in one pass, anything else falls back to one word at a time
+		aligned = relocs[(relocs & 3) == 0]
+		words = np.frombuffer(image, dtype="<u4", count=len(image) // 4)
+		words[aligned >> 2] += np.uint32(base)
+		del words
+		
+		for reloc in relocs[(relocs & 3) != 0].tolist():
+			pack_into("<L", image, reloc, (unpack_from("<L", image, reloc)[0] + base) & 0xffffffff)
+		
+		image = bytes(image)
+		
+		if cache_path is not None:
+			try:
+				makedirs(cache_dir, exist_ok=True)
+				with open(cache_path + ".tmp", "wb") as f: f.write(image)
+				replace(cache_path + ".tmp", cache_path)
+			except OSError as e: LOGGER.warning(f"Couldn't cache relocated image: {e}")
+		
+		return image
 
 	def to_elffile(self, revb=False):
 		fh = BytesIO()
@@ -96,7 +137,7 @@ class PDBinFile(PDFile):
 		fh.write(b"\x08\0\0\0\x03\0\0\0")
 		fh.write(self.filesz.to_bytes(4, byteorder="little"))
 		fh.write((0x10000 + self.filesz).to_bytes(4, byteorder="little"))
-		fh.write((self.memsz - filesz).to_bytes(4, byteorder="little"))
+		fh.write((self.memsz - self.filesz).to_bytes(4, byteorder="little"))
 		fh.write(b"\0\0\0\0\0\0\0\0\x04\0\0\0\0\0\0\0")
 		
 		fh.write((SHSTRTAB.index(b".rel.text\0")).to_bytes(4, byteorder="little"))
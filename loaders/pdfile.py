@@ -1,10 +1,132 @@
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
-from zlib import decompress
-from struct import unpack, error as struct_error
+from os import cpu_count, remove, replace
+from zlib import compress, decompress, decompressobj
+from struct import Struct, pack
+from sys import byteorder
+
+PD_FLAG_COMPRESSED = 0x80000000
+
+U16 = Struct("<H")
+S16 = Struct("<h")
+U32 = Struct("<L")
+
+# strings in these files are short, so most come out of a single read
+STR_CHUNK_SIZE = 64
+
+def unpack_array(typecode, data):
+	# offset tables are little-endian, array is native
+	table = array(typecode, data)
+	if byteorder == "big": table.byteswap()
+	return table
+
+# zlib drops the GIL while inflating, so threads are enough to spread this across cores
+DECOMPRESS_WORKERS = cpu_count() or 1
+# below this many compressed bytes the thread handoff costs more than it saves
+DECOMPRESS_MIN_PARALLEL = 0x10000
+
+_DECOMPRESS_POOL = None
+
+def get_decompress_pool():
+	global _DECOMPRESS_POOL
+	if _DECOMPRESS_POOL is None: _DECOMPRESS_POOL = ThreadPoolExecutor(DECOMPRESS_WORKERS, thread_name_prefix="pd-zlib")
+	return _DECOMPRESS_POOL
+
+def decompress_all(chunks, workers=None):
+	# yields each chunk decompressed, in order, with at most 2 * workers chunks in flight
+	if workers is None: workers = DECOMPRESS_WORKERS
+	if workers <= 1 or sum(len(chunk) for chunk in chunks) < DECOMPRESS_MIN_PARALLEL:
+		for chunk in chunks: yield decompress(chunk)
+		return
+	
+	pool = get_decompress_pool()
+	pending = deque()
+	for chunk in chunks:
+		pending.append(pool.submit(decompress, chunk))
+		if len(pending) >= 2 * workers: yield pending.popleft().result()
+	while pending: yield pending.popleft().result()
+
+@contextmanager
+def atomic_open(path, mode="wb"):
+	# readers only ever see the old file or the finished new one
+	tmp_path = path + ".tmp"
+	try:
+		with open(tmp_path, mode) as f: yield f
+		replace(tmp_path, path)
+	except BaseException:
+		try: remove(tmp_path)
+		except FileNotFoundError: pass
+		raise
+
+# compressed payloads at least this big are inflated as the parser reads them instead of all up front
+STREAM_MIN_SIZE = 0x100000
+STREAM_CHUNK_SIZE = 0x10000
+
+class ZlibStream:
+	# read-only, seekable file object over a zlib stream that only inflates as far as it has been read
+	def __init__(self, source):
+		self.source = memoryview(source)
+		self.source_pos = 0
+		self.inflater = decompressobj()
+		self.buffer = bytearray()
+		self.pos = 0
+		self.closed = False
+	
+	def _fill(self, end=None):
+		while self.source is not None and (end is None or len(self.buffer) < end):
+			# cap the output too, since a run of zeros can inflate a thousandfold
+			chunk = self.inflater.unconsumed_tail
+			if not chunk:
+				chunk = self.source[self.source_pos:self.source_pos + STREAM_CHUNK_SIZE]
+				self.source_pos += len(chunk)
+			self.buffer += self.inflater.decompress(chunk, STREAM_CHUNK_SIZE)
+			
+			if self.inflater.eof or (self.source_pos >= len(self.source) and not self.inflater.unconsumed_tail):
+				# the compressed input is never needed again once it has all been fed through
+				self.buffer += self.inflater.flush()
+				self.source.release()
+				self.source = None
+				self.inflater = None
+	
+	def read(self, size=-1):
+		if size is None or size < 0:
+			self._fill()
+			end = len(self.buffer)
+		else:
+			end = self.pos + size
+			self._fill(end)
+		
+		# slicing the bytearray would copy it once before bytes() copies it again
+		with memoryview(self.buffer) as view: data = bytes(view[self.pos:end])
+		self.pos += len(data)
+		return data
+	
+	def seek(self, offset, whence=0):
+		if whence == 1: offset += self.pos
+		elif whence == 2:
+			self._fill()
+			offset += len(self.buffer)
+		if offset < 0: raise ValueError(f"negative seek position {offset}")
+		self.pos = offset
+		return self.pos
+	
+	def tell(self):
+		return self.pos
+	
+	def close(self):
+		if self.source is not None: self.source.release()
+		self.source = None
+		self.inflater = None
+		self.buffer = bytearray()
+		self.closed = True
 
 class PDFile:
 	def __init__(self, filename, skip_magic, mode="rb"):
-		self.filename = filename
+		# only a path is kept, bytes passed in would pin the compressed copy for as long as the file lives
+		self.filename = filename if type(filename) == str else None
 		self.data = b""
 		if type(filename) == str:
 			with open(filename, mode) as f: self.data = f.read()
@@ -22,40 +144,73 @@ class PDFile:
 					self.fallback = True
 					self.advance(len(self.MAGIC2))
 				else: raise ValueError("incorrect magic number for Playdate file")
-	def decompress(self, compressed=True):
+	def decompress(self, compressed=True, stream=None, size=None):
+		# size is the decompressed length from the file's header, if it has one
 		self.compressed = compressed
-		if self.compressed:
-			self.zlib_data = decompress(self.handle.read())
+		self.decompressed_size = size
+		if not self.compressed: self.decompressed_size = len(self.data) - self.tell()
+		else:
+			source = memoryview(self.data)[self.tell():]
+			if stream is None: stream = len(source) >= STREAM_MIN_SIZE
 			self.handle.close()
-			self.handle = BytesIO(self.zlib_data)
+			
+			if stream:
+				# drop our reference so the compressed bytes can go as soon as the stream is done with them
+				self.handle = ZlibStream(source)
+				self.data = None
+			else:
+				# a single zlib stream can't be split up, but it can at least be inflated without copying it first
+				self.zlib_data = decompress(source)
+				self.handle = BytesIO(self.zlib_data)
+				self.decompressed_size = len(self.zlib_data)
+	@classmethod
+	def pack_file(cls, payload, compressed=True, header_fields=(0, 0, 0)):
+		if compressed:
+			return cls.MAGIC + pack("<L", PD_FLAG_COMPRESSED) + pack("<4L", len(payload), *header_fields) + compress(payload, 9)
+		return cls.MAGIC + pack("<L", 0) + payload
+	def write_nonpdfile(self, fh):
+		# loaders that can produce their output a piece at a time override this
+		fh.write(self.to_nonpdfile())
 	def readbin(self, numbytes=-1):
 		return self.handle.read(numbytes)
+	def readstruct(self, fmt):
+		data = self.readbin(fmt.size)
+		if len(data) < fmt.size: return None
+		return fmt.unpack(data)
 	def readu8(self):
-		try: return unpack("<B", self.readbin(1))[0]
-		except struct_error: return None
+		data = self.readbin(1)
+		return data[0] if data else None
 	def reads8(self):
-		try: return unpack("<b", self.readbin(1))[0]
-		except struct_error: return None
+		data = self.readbin(1)
+		return data[0] - ((data[0] & 0x80) << 1) if data else None
 	def readu16(self):
-		try: return unpack("<H", self.readbin(2))[0]
-		except struct_error: return None
+		data = self.readbin(2)
+		return U16.unpack(data)[0] if len(data) == 2 else None
 	def reads16(self):
-		try: return unpack("<h", self.readbin(2))[0]
-		except struct_error: return None
+		data = self.readbin(2)
+		return S16.unpack(data)[0] if len(data) == 2 else None
 	def readu24(self):
-		try: return int.from_bytes(self.readbin(3), byteorder="little")
-		except struct_error: return None
+		return int.from_bytes(self.readbin(3), byteorder="little")
 	def readu32(self):
-		try: return unpack("<L", self.readbin(4))[0]
-		except struct_error: return None
+		data = self.readbin(4)
+		return U32.unpack(data)[0] if len(data) == 4 else None
+	def read_array_u16(self, count):
+		return unpack_array("H", self.readbin(2 * count))
+	def read_array_u32(self, count):
+		return unpack_array("I", self.readbin(4 * count))
 	def readstr(self):
-		b = bytes()
+		start = self.tell()
+		chunks = []
 		while True:
-			byte = self.readbin(1) 
-			if byte == bytes(): break
-			if unpack("<B", byte)[0] == 0: break
-			b += byte
-		return str(b, encoding="utf-8")
+			chunk = self.readbin(STR_CHUNK_SIZE)
+			end = chunk.find(b"\0")
+			if end >= 0:
+				chunks.append(chunk[:end])
+				self.seek(start + sum(len(c) for c in chunks) + 1)
+				break
+			chunks.append(chunk)
+			if len(chunk) < STR_CHUNK_SIZE: break
+		return str(b"".join(chunks), encoding="utf-8")
 	def seek(self, offset):
 		self.handle.seek(offset)
 	def seekrelto(self, pos, offset):
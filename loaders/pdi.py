@@ -1,3 +1,4 @@
+import numpy as np
 import pygame as pg
 import pygame.locals as pgloc
 from PIL import Image
@@ -5,7 +6,7 @@ from PIL import Image
 from io import BytesIO
 from math import ceil
 from os.path import splitext
-from struct import pack
+from struct import Struct, pack
 from sys import argv
 
 from loaders.pdfile import PDFile
@@ -13,6 +14,9 @@ from logger import init_logging, get_logger
 
 LOGGER = get_logger("loaders.pdi")
 
+# width, height, stride, clip left/right/top/bottom, flags
+PDI_HEADER = Struct("<8H")
+
 PDI_PALETTE = (
 	(0x32, 0x2f, 0x28),
 	(0xb1, 0xae, 0xa7)
@@ -46,6 +50,37 @@ def _flatten2d(seq):
 	
 	return return_seq
 
+def pil_to_image_data(pil_img):
+	color = np.asarray(pil_img.convert("L")) >= 0x80
+	opaque = np.asarray(pil_img.convert("RGBA"))[:, :, 3] >= 0x80
+	stored_height, stored_width = color.shape
+	
+	# fully transparent rows and columns around the edges are stored as clip padding
+	rows = np.flatnonzero(opaque.any(axis=1))
+	cols = np.flatnonzero(opaque.any(axis=0))
+	if len(rows):
+		top, bottom = int(rows[0]), int(rows[-1]) + 1
+		left, right = int(cols[0]), int(cols[-1]) + 1
+	else: top = bottom = left = right = 0
+	
+	color = color[top:bottom, left:right]
+	opaque = opaque[top:bottom, left:right]
+	has_alpha = not opaque.all()
+	
+	width = right - left
+	height = bottom - top
+	data = PDI_HEADER.pack(width, height, ceil(width / 8), left, stored_width - right, top, stored_height - bottom, 0x3 * int(has_alpha))
+	data += np.packbits(color, axis=1).tobytes()
+	if has_alpha: data += np.packbits(opaque, axis=1).tobytes()
+	
+	return data
+
+def pngfile_to_pdi(png, compressed=True):
+	if type(png) == bytes: png = BytesIO(png)
+	with Image.open(png) as pil_img:
+		data = pil_to_image_data(pil_img)
+		return PDImageFile.pack_file(data, compressed, (pil_img.width, pil_img.height, 0))
+
 class PDImageFile(PDFile):
 	
 	MAGIC = b"Playdate IMG"
@@ -59,17 +94,13 @@ class PDImageFile(PDFile):
 		if filename != bytes():
 			flags = self.readu32()
 			compressed = bool(flags & 0x80000000)
-			if compressed: self.advance(16)
-			self.decompress(compressed)
+			size = None
+			if compressed:
+				size = self.readu32()
+				self.advance(12)
+			self.decompress(compressed, size=size)
 			
-			self.width = self.readu16()
-			self.height = self.readu16()
-			self.stride = self.readu16()
-			self.clip_l = self.readu16()
-			self.clip_r = self.readu16()
-			self.clip_t = self.readu16()
-			self.clip_b = self.readu16()
-			flags = self.readu16()
+			self.width, self.height, self.stride, self.clip_l, self.clip_r, self.clip_t, self.clip_b, flags = self.readstruct(PDI_HEADER)
 			self.alpha = bool(flags & 0x3)
 			
 			LOGGER.debug(f"Image size: {self.width} x {self.height}")
@@ -138,7 +169,15 @@ class PDImageFile(PDFile):
 		
 		return self.surf
 
-	def to_pngfile(self, bw=False):
+	def get_planes(self):
+		# the packed color and alpha rows straight out of the file, alpha is None for opaque images
+		plane_size = self.stride * self.height
+		raw = self.raw[:2 * plane_size] if self.alpha else self.raw[:plane_size]
+		planes = np.frombuffer(raw.ljust((1 + self.alpha) * plane_size, b"\0"), dtype=np.uint8).reshape(-1, self.stride)
+		if self.alpha: return planes[:self.height], planes[self.height:]
+		return planes, None
+
+	def to_pil_img(self, bw=False):
 		if self.alpha: 
 			color = "RGBA"	
 			if bw: self.palette = _flatten2d(PDI_BW_PALETTE_WITH_ALPHA)
@@ -151,9 +190,15 @@ class PDImageFile(PDFile):
 		self.pil_img = Image.new("P", (self.stored_width, self.stored_height))
 		self.pil_img.putpalette(self.palette, color)
 		self.pil_img.putdata(_flatten2d(self.pixels))
+		
+		return self.pil_img
+	
+	def write_pngfile(self, fh, bw=False):
+		self.to_pil_img(bw).save(fh, format="PNG")
 
+	def to_pngfile(self, bw=False):
 		fh = BytesIO()
-		self.pil_img.save(fh, format="PNG")
+		self.write_pngfile(fh, bw)
 		self.pngfile = fh.getvalue()
 		fh.close()
 
@@ -161,6 +206,9 @@ class PDImageFile(PDFile):
 
 	def to_nonpdfile(self):
 		return self.to_pngfile()
+	
+	def write_nonpdfile(self, fh):
+		self.write_pngfile(fh)
 
 	@staticmethod
 	def from_bytes(data, width, height, has_alpha=False):
@@ -13,37 +13,83 @@ class PDStringsFile(PDFile):
 	PD_FILE_EXT = ".pds"
 	NONPD_FILE_EXT = ".strings"
 	
-	def __init__(self, filename, skip_magic=False):
+	def __init__(self, filename, skip_magic=False, lazy=False):
 		if not skip_magic: LOGGER.info(f"Decompiling strings file {filename}...")
 		super().__init__(filename, skip_magic)
 		
 		flags = self.readu32()
 		compressed = bool(flags & 0x80000000)
-		if compressed: self.advance(16)
-		self.decompress(compressed)
+		size = None
+		if compressed:
+			size = self.readu32()
+			self.advance(12)
+		self.decompress(compressed, size=size)
 		
 		self.num_keys = self.readu32()
-		offsets = [0x00000000]
+		self.lazy = lazy
 		self.string_table = {}
 		
-		for i in range(self.num_keys - 1):
-			offsets.append(self.readu32())
-		header_end = self.tell()
+		# the last entry has no offset after it, it just runs to the end of the table
+		self.offsets = self.read_array_u32(max(self.num_keys - 1, 0))
+		if self.num_keys > 0: self.offsets.insert(0, 0x00000000)
 		
-		for i in range(len(offsets) - 1):
-			self.seekrelto(header_end, offsets[i])
-			k = self.readstr()
-			v = self.readstr()
-			self.string_table[k] = v
+		if self.lazy:
+			# keep the raw table around and only decode what actually gets looked up
+			self.table = self.readbin()
+			self.index = None
+			self.close()
+			# the table is its own copy, so neither the file's bytes nor the inflated payload are needed any more
+			self.data = None
+			self.zlib_data = None
+		else:
+			header_end = self.tell()
+			for offset in self.offsets:
+				self.seekrelto(header_end, offset)
+				k = self.readstr()
+				v = self.readstr()
+				self.string_table[k] = v
+	
+	def _build_index(self):
+		# only the keys are decoded here, each one maps to where its value starts
+		self.index = {}
+		for offset in self.offsets:
+			end = self.table.find(b"\0", offset)
+			if end < 0: end = len(self.table)
+			self.index[str(self.table[offset:end], encoding="utf-8")] = end + 1
+	
+	def get(self, key, default=None):
+		value = self.string_table.get(key)
+		if value is not None or not self.lazy: return value if value is not None else default
+		
+		if self.index is None: self._build_index()
+		start = self.index.get(key)
+		if start is None: return default
+		
+		end = self.table.find(b"\0", start)
+		if end < 0: end = len(self.table)
+		value = str(self.table[start:end], encoding="utf-8")
+		self.string_table[key] = value
+		return value
+	
+	def __contains__(self, key):
+		if not self.lazy: return key in self.string_table
+		if self.index is None: self._build_index()
+		return key in self.index
+	
+	def keys(self):
+		if not self.lazy: return self.string_table.keys()
+		if self.index is None: self._build_index()
+		return self.index.keys()
 	
 	def to_dict(self):
+		if self.lazy: return {key: self.get(key) for key in self.keys()}
 		return self.string_table
 	
 	def to_stringsfile(self):
-		data = b"-- Decompiled with the pd-emu decompilation tools"
-		for k, v in self.string_table.items():
-			data += f"\n\"{k}\" = \"{v}\"".encode("utf-8")
-		self.stringsfile = data
+		lines = [b"-- Decompiled with the pd-emu decompilation tools"]
+		for k, v in self.to_dict().items():
+			lines.append(f"\"{k}\" = \"{v}\"".encode("utf-8"))
+		self.stringsfile = b"\n".join(lines)
 		return self.stringsfile
 	
 	def to_nonpdfile(self):
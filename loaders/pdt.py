@@ -2,14 +2,52 @@ from PIL import Image
 
 from io import BytesIO
 from os.path import splitext
+from struct import pack
 from sys import argv
 
 from loaders.pdfile import PDFile
-from loaders.pdi import PDImageFile
+from loaders.pdi import PDImageFile, pil_to_image_data
 from logger import init_logging, get_logger
 
 LOGGER = get_logger("loaders.pdt")
 
+def _open_image(png):
+	if type(png) == bytes: png = BytesIO(png)
+	return Image.open(png)
+
+def _pack_table(cells, num_per_row, cell_width, cell_height, compressed):
+	offsets = []
+	end = 0
+	for cell in cells:
+		end += len(cell)
+		offsets.append(end)
+	
+	payload = pack("<2H", len(cells), num_per_row) + pack(f"<{len(cells)}L", *offsets) + b"".join(cells)
+	return PDImageTableFile.pack_file(payload, compressed, (cell_width, cell_height, len(cells)))
+
+def sheet_to_pdt(png, cell_width, cell_height, compressed=True):
+	with _open_image(png) as sheet:
+		sheet = sheet.convert("RGBA")
+		num_per_row = sheet.width // cell_width
+		num_rows = sheet.height // cell_height
+		
+		cells = []
+		for y in range(num_rows):
+			for x in range(num_per_row):
+				cells.append(pil_to_image_data(sheet.crop((x * cell_width, y * cell_height, (x + 1) * cell_width, (y + 1) * cell_height))))
+	
+	return _pack_table(cells, num_per_row, cell_width, cell_height, compressed)
+
+def images_to_pdt(pngs, compressed=True):
+	cells = []
+	cell_size = (0, 0)
+	for png in pngs:
+		with _open_image(png) as pil_img:
+			if not cells: cell_size = pil_img.size
+			cells.append(pil_to_image_data(pil_img))
+	
+	return _pack_table(cells, len(cells), cell_size[0], cell_size[1], compressed)
+
 class PDImageTableFile(PDFile):
 
 	MAGIC = b"Playdate IMT"
@@ -22,8 +60,11 @@ class PDImageTableFile(PDFile):
 
 		flags = self.readu32()
 		compressed = bool(flags & 0x80000000)
-		if compressed: self.advance(16)
-		self.decompress(compressed)
+		size = None
+		if compressed:
+			size = self.readu32()
+			self.advance(12)
+		self.decompress(compressed, size=size)
 
 		self.num_images = self.readu16()
 		self.num_per_row = self.readu16()
@@ -37,11 +78,10 @@ class PDImageTableFile(PDFile):
 			self.num_rows = 1
 			LOGGER.debug(f"Sequential table, image count: {self.num_per_row} images")
 
-		offsets = [0x00000000]
 		self.image_table = []
-
-		for i in range(self.num_images):
-			offsets.append(self.readu32())
+		
+		offsets = self.read_array_u32(self.num_images)
+		offsets.insert(0, 0x00000000)
 
 		header_end = self.tell()
 
@@ -58,7 +98,7 @@ class PDImageTableFile(PDFile):
 		
 		for y in range(self.num_rows):
 			for x in range(self.num_per_row):
-				self.image_table[y][x].to_pngfile()
+				self.image_table[y][x].to_pil_img()
 				self.pil_img.paste(self.image_table[y][x].pil_img, (x * self.image_table[y][x].stored_width, y * self.image_table[y][x].stored_height))
 		fh = BytesIO()
 		self.pil_img.save(fh, format="PNG")
@@ -3,10 +3,9 @@ from PIL import Image, GifImagePlugin
 from io import BytesIO
 from os.path import splitext
 from sys import argv
-from struct import unpack
-from zlib import decompress
+from struct import Struct, unpack
 
-from loaders.pdfile import PDFile
+from loaders.pdfile import PDFile, decompress_all
 from loaders.pdi import PDImageFile
 from logger import init_logging, get_logger
 
@@ -20,6 +19,13 @@ PDV_FRAME_IFRAME = 1
 PDV_FRAME_PFRAME = 2
 PDV_FRAME_COMBINED = 3
 
+# frame count, padding, framerate, width, height
+PDV_HEADER = Struct("<H2xf2H")
+
+def _xor_bytes(data, other):
+	# xor a whole change map in one go instead of byte by byte
+	return (int.from_bytes(data, "little") ^ int.from_bytes(other[:len(data)], "little")).to_bytes(len(data), "little")
+
 GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
 
 class PDVideoFile(PDFile):
@@ -28,83 +34,76 @@ class PDVideoFile(PDFile):
 	PD_FILE_EXT = ".pdv"
 	NONPD_FILE_EXT = ".gif"
 
-	def __init__(self, filename, skip_magic=False):
+	def __init__(self, filename, skip_magic=False, workers=None):
 		if not skip_magic: LOGGER.info(f"Decompiling video file {filename}...")
 		super().__init__(filename, skip_magic)
 
 		self.advance(4)
-		self.num_frames = self.readu16()
-		self.advance(2)
-		self.framerate = unpack("<f", self.readbin(4))[0]
-		self.width = self.readu16()
-		self.height = self.readu16()
+		self.num_frames, self.framerate, self.width, self.height = self.readstruct(PDV_HEADER)
 		
 		LOGGER.debug(f"Framerate: {self.framerate:02f} fps")
 		LOGGER.debug(f"Frame size: {self.width} x {self.height}")
 
-		offsets = []
-		frame_type_table = []
-		self.frame_table = []
-
-		for i in range(self.num_frames + 1):
-			value = self.readu32()
-			offsets.append(value >> 2)
-			frame_type_table.append(value & 0x3)
+		values = self.read_array_u32(self.num_frames + 1)
+		self.offsets = [value >> 2 for value in values]
+		self.frame_types = [value & 0x3 for value in values]
+		self.header_end = self.tell()
 		
-		header_end = self.tell()
-
-		for i in range(len(offsets) - 1):
-			offset = offsets[i]
-			next_offset = offsets[i + 1]
-			self.seekrelto(header_end, offset)
-			
-			frame_data = decompress(self.readbin(next_offset - offset))
-			if frame_type_table[i] == PDV_FRAME_IFRAME:
-				self.frame_table.append(PDImageFile.from_bytes(frame_data, self.width, self.height))
-			elif frame_type_table[i] == PDV_FRAME_PFRAME:
-				prev_frame = self.frame_table[-1]
-				
-				frame_data = bytearray(frame_data)
-				for i in range(len(frame_data)):
-					frame_data[i] ^= prev_frame.raw[i]
-				frame_data = bytes(frame_data)
-				
-				img_file = PDImageFile.from_bytes(frame_data, self.width, self.height)
-				
-				self.frame_table.append(img_file)
-			elif frame_type_table[i] == PDV_FRAME_COMBINED:
+		self.workers = workers
+		self._frame_table = None
+	
+	def iter_frames(self):
+		# decodes one frame at a time, only ever holding on to the one before it
+		view = memoryview(self.data)
+		
+		# every frame is its own zlib stream, so they can all be inflated side by side
+		chunks = []
+		for i in range(len(self.offsets) - 1):
+			chunks.append(view[self.header_end + self.offsets[i]:self.header_end + self.offsets[i + 1]])
+		
+		prev_frame = None
+		for frame_type, frame_data in zip(self.frame_types, decompress_all(chunks, self.workers)):
+			if frame_type == PDV_FRAME_PFRAME:
+				frame_data = _xor_bytes(frame_data, prev_frame.raw)
+			elif frame_type == PDV_FRAME_COMBINED:
 				iframe_len = unpack("<H", frame_data[:2])[0]
-				iframe_len = iframe_len[2:]
-				iframe_file = frame_data[:iframe_len]
-				pframe_file = PDImageFile.from_bytes(frame_data[iframe_len:], self.width, self.height)
-				
-				iframe_file = bytearray(iframe_file)
-				for i in range(len(iframe_file.raw)):
-					iframe_file[i] ^= pframe_file.raw[i]
-				iframe_file = bytes(iframe_file)
-
-				self.frame_table.append(iframe_file)
+				frame_data = _xor_bytes(frame_data[2 + iframe_len:], frame_data[2:2 + iframe_len])
+			elif frame_type != PDV_FRAME_IFRAME: continue
+			
+			prev_frame = PDImageFile.from_bytes(frame_data, self.width, self.height)
+			yield prev_frame
+	
+	@property
+	def frame_table(self):
+		if self._frame_table is None: self._frame_table = list(self.iter_frames())
+		return self._frame_table
 
 	def to_surflist(self):
 		return_list = []
 		for i in range(len(self.frame_table)):
 			return_list.append(self.frame_table[i].to_surf())
 		return return_list
-
-	def to_giffile(self, bw=False):
-		for i in range(len(self.frame_table)):
-			self.frame_table[i].to_pngfile()
-		
-		if bw: pal = PDV_BW_PALETTE
-		else: pal = PDV_PALETTE
+	
+	def write_giffile(self, fh, bw=False):
 		frame_duration = round(1000 / self.framerate)
 		
-		pil_img_list = []
-		for img in self.frame_table:
-			pil_img_list.append(img.pil_img.convert(dither=Image.Dither.NONE))
+		# every frame shares the first one's palette, so they can be encoded and written as they're decoded
+		header_written = False
+		for frame in self.iter_frames():
+			pil_img = frame.to_pil_img(bw)
+			if not header_written:
+				header, used_palette_colors = GifImagePlugin.getheader(pil_img)
+				for chunk in header: fh.write(chunk)
+				header_written = True
+			
+			for chunk in GifImagePlugin.getdata(pil_img, duration=frame_duration): fh.write(chunk)
+			frame.pil_img = None
 		
+		if header_written: fh.write(b";")
+
+	def to_giffile(self, bw=False):
 		fh = BytesIO()
-		pil_img_list[0].save(fh, format="GIF", save_all=True, append_images=pil_img_list[1:], duration=frame_duration)
+		self.write_giffile(fh, bw)
 		self.giffile = fh.getvalue()
 		fh.close()
 
@@ -112,6 +111,9 @@ class PDVideoFile(PDFile):
 
 	def to_nonpdfile(self):
 		return self.to_giffile()
+	
+	def write_nonpdfile(self, fh):
+		self.write_giffile(fh)
 
 if __name__ == "__main__":
 	init_logging()
@@ -1,19 +1,23 @@
-from os import mkdir, sep as PATHSEP, walk
+from hashlib import md5
+from os import makedirs, mkdir, remove, sep as PATHSEP, stat, walk
 from os.path import abspath, basename, dirname, isdir, join as joinpath, normpath, splitext, relpath
 from sys import argv
+from time import sleep
 
-from loaders.pdfile import PDFile
+from loaders.pdfile import PDFile, atomic_open, decompress_all
 from loaders.pda import PDAudioFile
 from loaders.pdi import PDImageFile
 from loaders.pds import PDStringsFile
 from loaders.pdt import PDImageTableFile
 from loaders.pdv import PDVideoFile
 from loaders.pft import PDFontFile
-from loaders.pdz import PDZipFile
+from loaders.pdz import PDZ_FILE_AUDIO, PDZ_FILE_NONE, PDZipEntry, PDZipFile, iter_pdz_entries
 from logger import init_logging, get_logger
 
 LOGGER = get_logger("loaders.pdx")
 
+WATCH_INTERVAL = 0.5
+
 class StrayFile(PDFile):
 	MAGIC = b""
 	NONPD_FILE_EXT = ""
@@ -38,6 +42,7 @@ class PDXApplication:
 	]
 	
 	def __init__(self, filename):
+		self.directory = filename
 		self.files = {}
 		self.metadata = {}
 		
@@ -47,14 +52,38 @@ class PDXApplication:
 			if root != ".": 
 				for subdir in root.split(PATHSEP): workdir = workdir[subdir]
 			for subdir in dirs: workdir[subdir] = {}
-			for branch in files:
-				is_pd_file = False
-				for file_type in self.ALLOWED_FILE_TYPES:
-					if branch.endswith(file_type.PD_FILE_EXT):
-						is_pd_file = True
-						workdir[branch] = file_type(joinpath(rootdir, branch))
-						break
-				if not is_pd_file: workdir[branch] = StrayFile(joinpath(rootdir, branch))
+			for branch in files: workdir[branch] = self.load_file(joinpath(rootdir, branch))
+	
+	@classmethod
+	def load_file(cls, path):
+		for file_type in cls.ALLOWED_FILE_TYPES:
+			if path.endswith(file_type.PD_FILE_EXT): return file_type(path)
+		return StrayFile(path)
+	
+	@staticmethod
+	def dump_file(target, filename, out_loc, root_loc):
+		# writes out one loaded file and returns the paths it wrote
+		if type(target) == PDZipFile: return target.dump_files(root_loc)
+		
+		if type(target) == PDImageTableFile:
+			non_pdfile = target.to_nonpdfile()
+			outputs = []
+			if not target.is_matrix:
+				for i in range(len(non_pdfile)):
+					outputs.append((joinpath(out_loc, f"{splitext(filename)[0]}-table-{i}{target.NONPD_FILE_EXT}"), non_pdfile[i]))
+			else:
+				outputs.append((joinpath(out_loc, f"{splitext(filename)[0]}-table-{target.image_table[0][0].stored_width}-{target.image_table[0][0].stored_height}{target.NONPD_FILE_EXT}"), non_pdfile))
+			
+			for path, data in outputs:
+				with atomic_open(path) as f: f.write(data)
+			return [path for path, data in outputs]
+		
+		if type(target) == StrayFile: path = joinpath(out_loc, f"{filename}")
+		else: path = joinpath(out_loc, f"{splitext(filename)[0]}{target.NONPD_FILE_EXT}")
+		
+		# everything else goes straight into the file as it's converted
+		with atomic_open(path) as f: target.write_nonpdfile(f)
+		return [path]
 	
 	def _dump_dir(self, root, out_loc, root_loc):
 		try: mkdir(out_loc)
@@ -63,43 +92,134 @@ class PDXApplication:
 		for filename in root.keys():
 			target = root[filename]
 			if type(target) == dict: self._dump_dir(target, joinpath(out_loc, filename), root_loc)
-			elif type(target) == PDZipFile: target.dump_files(root_loc)
-			elif type(target) == StrayFile:
-				non_pdfile = target.to_nonpdfile()
-				with open(joinpath(out_loc, f"{filename}"), "wb") as f:
-					f.write(non_pdfile)
-			else:
-				non_pdfile = target.to_nonpdfile()
-				
-				if type(target) == PDImageTableFile:
-					if not target.is_matrix:
-						for i in range(len(non_pdfile)):
-							with open(joinpath(out_loc, f"{splitext(filename)[0]}-table-{i}{target.NONPD_FILE_EXT}"), "wb") as f:
-								f.write(non_pdfile[i])
-					else:
-						with open(joinpath(out_loc, f"{splitext(filename)[0]}-table-{target.image_table[0][0].stored_width}-{target.image_table[0][0].stored_height}{target.NONPD_FILE_EXT}"), "wb") as f:
-							f.write(non_pdfile)
-				else:
-					with open(joinpath(out_loc, f"{splitext(filename)[0]}{target.NONPD_FILE_EXT}"), "wb") as f:
-						f.write(non_pdfile)
+			else: self.dump_file(target, filename, out_loc, root_loc)
 	
 	def dump_files(self, out_loc):
 		self._dump_dir(self.files, out_loc, out_loc)
 
+class PDXWatcher:
+	def __init__(self, filename, out_loc, interval=WATCH_INTERVAL):
+		self.filename = filename
+		self.out_loc = out_loc
+		self.interval = interval
+		
+		# relative path -> (mtime, size) as of the last successful dump
+		self.file_stats = {}
+		# relative path, or (pdz path, entry name) -> files written for it
+		self.outputs = {}
+		# pdz path -> {entry name: digest}
+		self.entry_hashes = {}
+	
+	def scan(self):
+		file_stats = {}
+		for rootdir, dirs, files in walk(self.filename):
+			for branch in files:
+				path = joinpath(rootdir, branch)
+				try: st = stat(path)
+				except FileNotFoundError: continue
+				file_stats[relpath(path, self.filename)] = (st.st_mtime_ns, st.st_size)
+		return file_stats
+	
+	def _remove_outputs(self, key):
+		for path in self.outputs.pop(key, []):
+			try: remove(path)
+			except FileNotFoundError: pass
+	
+	def _dump_pdz(self, rel_path):
+		old_hashes = self.entry_hashes.get(rel_path, {})
+		new_hashes = {}
+		changed = PDZipEntry(None, "", PDZ_FILE_NONE)
+		changed_names = []
+		
+		changed_entries = []
+		for name, filetype, compressed, data in iter_pdz_entries(joinpath(self.filename, rel_path), raw=True):
+			# the stored bytes change whenever the contents do, so nothing has to be inflated just to tell
+			digest = md5(bytes((filetype, compressed)) + data).digest()
+			new_hashes[name] = digest
+			if filetype != PDZ_FILE_NONE and old_hashes.get(name) != digest: changed_entries.append((name, filetype, compressed, data))
+		
+		# only what changed gets inflated, spread over the same threads the PDZ loader uses
+		chunks = [data[8:] if filetype == PDZ_FILE_AUDIO else data[4:] for name, filetype, compressed, data in changed_entries if compressed]
+		inflated = decompress_all(chunks)
+		for name, filetype, compressed, data in changed_entries:
+			if compressed: data = (data[:4] if filetype == PDZ_FILE_AUDIO else b"") + next(inflated)
+			changed.add_file(name, filetype, data)
+			changed_names.append(name)
+		
+		for name in old_hashes.keys() - new_hashes.keys(): self._remove_outputs((rel_path, name))
+		for name in changed_names:
+			self._remove_outputs((rel_path, name))
+			out_loc = joinpath(self.out_loc, dirname(normpath(name)))
+			makedirs(out_loc, exist_ok=True)
+			self.outputs[(rel_path, name)] = changed.get_file(name).dump_file(out_loc)
+		
+		self.entry_hashes[rel_path] = new_hashes
+		LOGGER.info(f"{rel_path}: {len(changed_names)} of {len(new_hashes)} entries changed")
+	
+	def _dump(self, rel_path):
+		if rel_path.endswith(PDZipFile.PD_FILE_EXT): return self._dump_pdz(rel_path)
+		
+		target = PDXApplication.load_file(joinpath(self.filename, rel_path))
+		out_loc = joinpath(self.out_loc, dirname(rel_path))
+		makedirs(out_loc, exist_ok=True)
+		
+		self._remove_outputs(rel_path)
+		self.outputs[rel_path] = PDXApplication.dump_file(target, basename(rel_path), out_loc, self.out_loc)
+	
+	def _forget(self, rel_path):
+		self._remove_outputs(rel_path)
+		for name in self.entry_hashes.pop(rel_path, {}): self._remove_outputs((rel_path, name))
+		self.file_stats.pop(rel_path, None)
+	
+	def poll(self):
+		file_stats = self.scan()
+		updated = 0
+		
+		for rel_path in self.file_stats.keys() - file_stats.keys():
+			LOGGER.info(f"Removed: {rel_path}")
+			self._forget(rel_path)
+		
+		for rel_path, file_stat in file_stats.items():
+			if self.file_stats.get(rel_path) == file_stat: continue
+			try: self._dump(rel_path)
+			except Exception as e:
+				# most likely caught halfway through a build, so it gets another go on the next poll
+				LOGGER.error(f"Couldn't dump {rel_path}: {e}")
+				continue
+			self.file_stats[rel_path] = file_stat
+			updated += 1
+		
+		return updated
+	
+	def run(self):
+		makedirs(self.out_loc, exist_ok=True)
+		LOGGER.info(f"Watching {self.filename} for changes...")
+		while True:
+			self.poll()
+			sleep(self.interval)
+
 if __name__ == "__main__":
 	init_logging()
 	
+	watch = "--watch" in argv
+	if watch: argv.remove("--watch")
+	
 	if len(argv) == 1:
 		LOGGER.error("No argument specified")
 		LOGGER.info("To dump an application: python3 -m loaders.pdx [input PDX] [output directory]")
+		LOGGER.info("To keep re-dumping it as it changes: python3 -m loaders.pdx [input PDX] [output directory] --watch")
 	else:
 		filename = argv[1]
 		if isdir(filename):
 			if filename.endswith(PATHSEP): filename = filename[:-1]
-			pdx_app = PDXApplication(filename)
 			
 			dump_loc = basename(filename)[:basename(filename).rindex(".")]
 			if len(argv) > 2: dump_loc = argv[2]
 			dump_loc = abspath(dump_loc)
-						
-			pdx_app.dump_files(dump_loc)
+			
+			if watch:
+				try: PDXWatcher(filename, dump_loc).run()
+				except KeyboardInterrupt: pass
+			else:
+				pdx_app = PDXApplication(filename)
+				pdx_app.dump_files(dump_loc)
@@ -1,9 +1,12 @@
-from os import mkdir, sep as PATHSEP
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from os import cpu_count, mkdir, sep as PATHSEP
 from os.path import abspath, basename, join as joinpath, normpath, splitext
+from struct import pack
 from sys import argv, exit
-from zlib import decompress
+from zlib import compress, decompress
 
-from loaders.pdfile import PDFile
+from loaders.pdfile import PDFile, atomic_open, decompress_all
 from loaders.pdlua import PDLuaBytecodeFile
 from loaders.pda import PDAudioFile
 from loaders.pdi import PDImageFile
@@ -79,43 +82,52 @@ class PDZipEntry:
 		try: return directory.data[path[-1]]
 		except KeyError: raise FileNotFoundError(f"PDZ entry not found: '{path[-1]}'")
 
+	def dump_file(self, path):
+		# writes out a single file entry and returns the paths it wrote
+		if self.filetype == PDZ_FILE_IMAGETABLE:
+			non_pdfile = self.data.to_nonpdfile()
+			outputs = []
+			if not self.data.is_matrix:
+				for i in range(len(non_pdfile)):
+					outputs.append((joinpath(path, f"{splitext(self.filename)[0]}-table-{i}{self.data.NONPD_FILE_EXT}"), non_pdfile[i]))
+			else:
+				outputs.append((joinpath(path, f"{splitext(self.filename)[0]}-table-{self.data.image_table[0][0].stored_width}-{self.data.image_table[0][0].stored_height}{self.extension}"), non_pdfile))
+			
+			for out_path, data in outputs:
+				with atomic_open(out_path) as f: f.write(data)
+			return [out_path for out_path, data in outputs]
+		
+		out_path = joinpath(path, self.filename + self.extension)
+		with atomic_open(out_path) as f: self.data.write_nonpdfile(f)
+		return [out_path]
+
 	def dump_files(self, path):
 		try: mkdir(path)
 		except FileExistsError: pass
 		
+		written = []
 		for filename in self.data.keys():
 			target = self.data[filename]
-			if target.is_directory:
-				target.dump_files(joinpath(path, target.filename))
-			else:
-				if target.filetype > PDZ_FILE_NONE: non_pdfile = target.data.to_nonpdfile()
-				else: non_pdfile = target.data
-				
-				if target.filetype == PDZ_FILE_IMAGETABLE:
-					if not target.data.is_matrix:
-						for i in range(len(non_pdfile)):
-							with open(joinpath(path, f"{splitext(filename)[0]}-table-{i}{target.data.NONPD_FILE_EXT}"), "wb") as f:
-								f.write(non_pdfile[i])
-					else:
-						with open(joinpath(path, f"{splitext(filename)[0]}-table-{target.data.image_table[0][0].stored_width}-{target.data.image_table[0][0].stored_height}{target.extension}"), "wb") as f:
-							f.write(non_pdfile)
-				else:
-					filename = target.filename + target.extension
-					with open(joinpath(path, filename), "wb") as f:
-						f.write(non_pdfile)
+			if target.is_directory: written += target.dump_files(joinpath(path, target.filename))
+			else: written += target.dump_file(path)
+		return written
 
 class PDZipFile(PDFile):
 
 	MAGIC = b"Playdate PDZ"
 	PD_FILE_EXT = ".pdz"
 
-	def __init__(self, filename, skip_magic=False):
+	def __init__(self, filename, skip_magic=False, workers=None):
 		super().__init__(filename, skip_magic)
 		
 		self.advance(4)
 		self.root_directory = PDZipEntry(self, "", PDZ_FILE_NONE)
 		self.imported_files = []
 		
+		# walk the entry headers first so all of the compressed entries can be inflated together
+		entries = []
+		chunks = []
+		view = memoryview(self.data)
 		flags = self.readu8()
 		
 		while flags is not None:
@@ -127,16 +139,26 @@ class PDZipFile(PDFile):
 			
 			self.align(4)
 			
-			data = self.readbin(file_length)
+			start = self.tell()
+			end = start + file_length
+			self.advance(file_length)
 			
 			if compressed:
 				if filetype == PDZ_FILE_AUDIO:
 					# Audio files have the sample rate and audio format uncompressed out front
-					data = data[:4] + decompress(data[8:])
-				else: data = decompress(data[4:])
+					entries.append((filename, filetype, True, self.data[start:start + 4]))
+					chunks.append(view[start + 8:end])
+				else:
+					entries.append((filename, filetype, True, b""))
+					chunks.append(view[start + 4:end])
+			else: entries.append((filename, filetype, False, self.data[start:end]))
 			
-			self.root_directory.add_file(filename, filetype, data)
 			flags = self.readu8()
+		
+		inflated = decompress_all(chunks, workers)
+		for filename, filetype, compressed, data in entries:
+			if compressed: data += next(inflated)
+			self.root_directory.add_file(filename, filetype, data)
 	
 	def import_func(self, path):
 		if path not in self.imported_files:
@@ -147,7 +169,117 @@ class PDZipFile(PDFile):
 		return self.root_directory.get_file(path)
 
 	def dump_files(self, directory_name):
-		self.root_directory.dump_files(directory_name)
+		return self.root_directory.dump_files(directory_name)
+
+def encode_entry_data(filetype, data, compressed=True, level=9):
+	if not compressed: return data
+	if filetype == PDZ_FILE_AUDIO:
+		# the sample rate and format stay uncompressed out front
+		return data[:4] + pack("<L", len(data) - 4) + compress(data[4:], level)
+	return pack("<L", len(data)) + compress(data, level)
+
+def iter_pdz_entries(filename, raw=False):
+	with open(filename, "rb") as f:
+		if f.read(len(PDZipFile.MAGIC)) != PDZipFile.MAGIC: raise ValueError("incorrect magic number for Playdate file")
+		f.read(4)
+		pos = 16
+		
+		flags = f.read(1)
+		while flags:
+			compressed = bool(flags[0] & 0x80)
+			filetype = flags[0] & 0x7f
+			file_length = int.from_bytes(f.read(3), byteorder="little")
+			
+			filename = bytearray()
+			byte = f.read(1)
+			while byte and byte != b"\0":
+				filename += byte
+				byte = f.read(1)
+			pos += 5 + len(filename)
+			
+			f.read(-pos % 4)
+			pos += -pos % 4
+			
+			data = f.read(file_length)
+			pos += file_length
+			
+			if compressed and not raw:
+				if filetype == PDZ_FILE_AUDIO: data = data[:4] + decompress(data[8:])
+				else: data = decompress(data[4:])
+			
+			yield str(filename, encoding="utf-8"), filetype, compressed, data
+			flags = f.read(1)
+
+class PDZipWriter:
+	def __init__(self, filename, workers=None, level=9):
+		if type(filename) == str:
+			self.handle = open(filename, "wb")
+			self.owns_handle = True
+		else:
+			self.handle = filename
+			self.owns_handle = False
+		
+		self.level = level
+		self.workers = workers if workers is not None else (cpu_count() or 1)
+		self.pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+		
+		# entries are compressed out of order but written strictly in the order they were added
+		self.pending = deque()
+		self.max_pending = 2 * self.workers
+		
+		self.handle.write(PDZipFile.MAGIC + pack("<L", 0))
+		self.pos = 16
+	
+	def add_file(self, filename, filetype, data, compressed=True, encoded=False):
+		if encoded or not compressed:
+			result = Future()
+			result.set_result(data)
+		elif self.pool is not None:
+			result = self.pool.submit(encode_entry_data, filetype, data, compressed, self.level)
+		else:
+			result = Future()
+			result.set_result(encode_entry_data(filetype, data, compressed, self.level))
+		
+		self.pending.append((filename, filetype, compressed, result))
+		while len(self.pending) > self.max_pending: self._write_next()
+	
+	def _write_next(self):
+		filename, filetype, compressed, result = self.pending.popleft()
+		data = result.result()
+		if len(data) > 0xffffff: raise ValueError(f"PDZ entry too large: '{filename}'")
+		
+		header = bytes((filetype | (0x80 * int(compressed)),)) + len(data).to_bytes(3, byteorder="little")
+		header += filename.encode("utf-8") + b"\0"
+		header += bytes(-(self.pos + len(header)) % 4)
+		
+		self.handle.write(header)
+		self.handle.write(data)
+		self.pos += len(header) + len(data)
+	
+	def flush(self):
+		while self.pending: self._write_next()
+		self.handle.flush()
+	
+	def close(self):
+		try: self.flush()
+		finally:
+			if self.pool is not None: self.pool.shutdown()
+			if self.owns_handle: self.handle.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+def repack_pdz(in_filename, out_filename, replacements=None, workers=None):
+	if replacements is None: replacements = {}
+	with PDZipWriter(out_filename, workers) as writer:
+		for filename, filetype, compressed, data in iter_pdz_entries(in_filename, raw=True):
+			if filename in replacements:
+				writer.add_file(filename, filetype, replacements[filename], compressed)
+			else:
+				writer.add_file(filename, filetype, data, compressed, encoded=True)
 
 if __name__ == "__main__":
 	init_logging()
@@ -10,7 +10,7 @@ from struct import unpack
 from sys import argv
 from unicodedata import category
 
-from loaders.pdfile import PDFile
+from loaders.pdfile import PDFile, unpack_array
 from loaders.pdi import PDImageFile, PDI_PALETTE_WITH_ALPHA, PDI_BW_PALETTE_WITH_ALPHA
 from logger import init_logging, get_logger
 
@@ -35,19 +35,12 @@ class PDFontPage:
 		
 		self.glyphs_stored = []
 		
-		glyph_table = data[4:36]
-		bits = 0
-		for i in range(0x100):
-			if i % 8 == 0: bits = glyph_table[i // 8]
-			if (bits >> (i % 8)) & 1: 
-				self.glyphs_stored.append((self.number << 8) | i)
+		glyph_mask = int.from_bytes(data[4:36], byteorder="little")
+		self.glyphs_stored = [(self.number << 8) | i for i in range(0x100) if (glyph_mask >> i) & 1]
 		
 		offset_table_length = 2 * data[3]
-		offset_table = data[36:36 + offset_table_length]
-		offsets = [0x0000]
-
-		for i in range(0, offset_table_length, 2):
-			offsets.append(unpack("<H", offset_table[i:i+2])[0])
+		offsets = unpack_array("H", data[36:36 + offset_table_length])
+		offsets.insert(0, 0x0000)
 		
 		header_end = 36 + offset_table_length
 		while header_end % 4 != 0: header_end += 1
@@ -102,7 +95,7 @@ class PDFontGlyph:
 		return self.surf
 
 	def to_pngfile(self, tracking, next_glyph="\0"):
-		if not self.image.pil_img: self.image.to_pngfile()
+		if not self.image.pil_img: self.image.to_pil_img()
 		glyph_width = tracking + self.width
 		
 		self.pil_img = Image.new("P", (glyph_width, self.image.stored_height))
@@ -127,23 +120,22 @@ class PDFontFile(PDFile):
 						
 		flags = self.readu32()
 		compressed = bool(flags & 0x80000000)
-		if compressed: self.advance(16)
-		self.decompress(compressed)
+		size = None
+		if compressed:
+			size = self.readu32()
+			self.advance(12)
+		self.decompress(compressed, size=size)
 		
 		self.wide_font = bool(flags & 0x00000001)
 		self.max_width = self.readu8()
 		self.max_height = self.readu8()
 		self.tracking = self.readu16()
 		
-		self.pages_stored = []
-		bits = 0
-		for i in range(0x200):
-			if i % 8 == 0: bits = self.readu8()
-			if (bits >> (i % 8)) & 1: self.pages_stored.append(i)
-
-		offsets = [0x00000000]
-		for i in range(len(self.pages_stored)):
-			offsets.append(self.readu32())
+		page_mask = int.from_bytes(self.readbin(0x40), byteorder="little")
+		self.pages_stored = [i for i in range(0x200) if (page_mask >> i) & 1]
+
+		offsets = self.read_array_u32(len(self.pages_stored))
+		offsets.insert(0, 0x00000000)
 
 		header_end = self.tell()
 		
@@ -2,11 +2,21 @@ from os import environ
 from threading import Lock
 from time import time, perf_counter
 
-os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = 1
+environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 import pygame as pg
 import pygame.locals as pgloc
 
+from api.assets import PDAssetManager
+from api.graphics import PDGraphics
+from api.localization import PDStringsManager
+from api.sprites import PDSpriteManager
+from api.luagc import LuaGarbageCollector
+from api.pdtime import PDTimeService
+from api.scheduler import PDScheduler
+from api.sound import PDMixer
+from api.stats import PDStats
 from loaders.pdx import PDXApplication
+from loaders.pdz import PDZipFile
 from logger import init_logging, get_logger
 
 LOGGER = get_logger("pdemu")
@@ -39,9 +49,7 @@ class PDEmulator:
 				LOGGER.error("Invalid button constant value")
 	
 	def __init__(self, app=None):
-		if type(app) == PDXApplication:
-			# load it up
-			pass
+		self.app = app if type(app) == PDXApplication else None
 		pg.init()
 		
 		self.display = pg.display.set_mode(size=(400, 240), flags=pg.SCALED)
@@ -49,7 +57,10 @@ class PDEmulator:
 	
 	def reset(self):
 		self.call_update_lock = Lock()
+		self.call_update = True
+		self.update_func = None
 		self.newline = "\n"
+		self.refresh_rate = 30.0
 		
 		self.buttons = {
 			PDEmulator.ButtonValues.LEFT: False,
@@ -71,11 +82,48 @@ class PDEmulator:
 		# self.battery =
 		# self.crank =
 		# self.fps_font =
-		# self.gc =
+		self.graphics = PDGraphics()
+		self.sprites = PDSpriteManager(self.graphics)
+		self.gc = LuaGarbageCollector()
+		if hasattr(self, "mixer"): self.mixer.close()
+		self.mixer = PDMixer()
+		self.mixer.open()
+		self.assets = PDAssetManager(sample_rate=self.mixer.sample_rate, resample_mode=self.mixer.resample_mode)
+		if self.app is not None:
+			# game paths are relative to the PDX, with anything pdc packed into a PDZ found there first
+			self.assets.set_directory(self.app.directory)
+			for archive in self.app.files.values():
+				if type(archive) == PDZipFile: self.assets.mount(archive)
+		self.scheduler = PDScheduler()
 		# self.serial =
 		# self.settings =
-		# self.stats =
+		self.stats = PDStats()
+		self.strings = PDStringsManager()
+		if self.app is not None: self.strings.set_directory(self.app.directory)
+		self.time_service = PDTimeService()
 		# self.system_menu =
+	
+	def run_frame(self):
+		frame_start = perf_counter()
+		self.time_service.begin_frame()
+		self.scheduler.run(self.game_time)
+		with self.call_update_lock: call_update = self.call_update
+		if call_update and self.update_func is not None: self.update_func()
+		game_time = perf_counter() - frame_start
+		
+		# the device collects garbage in whatever time is left before the next frame
+		if self.refresh_rate > 0: idle = (1 / self.refresh_rate) - game_time
+		else: idle = 0.0
+		gc_time = self.gc.collect(idle)
+		self.mixer.pump()
 		
+		self.graphics.present(self.display)
+		pg.display.flip()
+		elapsed = self.clock.tick(self.refresh_rate) / 1000
+		self.game_time += elapsed * 1000
+		self.stats.record(elapsed, game=game_time, gc=gc_time, audio=self.mixer.take_audio_time())
+	
 	def __del__(self):
+		# __init__ may have failed before the mixer was made
+		if hasattr(self, "mixer"): self.mixer.close()
 		pg.quit()
\ No newline at end of file